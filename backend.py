@@ -199,54 +199,26 @@ def retrieve_docs(query: str, k: int = 5) -> List[Dict]:
         except Exception as e:
             logger.exception("Chroma falhou: %s", e)
 
-    # fallback local search
-    entries = load_index()
-    if not entries:
+    # fallback local search (índice residente em memória, recarregado se o arquivo mudar)
+    from backend_service.index_format import preferred_index_path
+    from backend_service.lexical import hybrid_top_k
+    from backend_service.local_index import get_local_index
+
+    snapshot = get_local_index(preferred_index_path(INDEX_FILE)).snapshot()
+    if not len(snapshot):
         logger.info("Nenhum documento local para recuperar.")
         return []
-    qv = _embed_text(query, dim=len(entries[0].embedding) if entries and entries[0].embedding else 128)
-    scored = [(e, _cosine_sim(qv, e.embedding)) for e in entries]
-    scored.sort(key=lambda t: t[1], reverse=True)
-    for e, sc in scored[:k]:
-        results.append({
-            "id": e.id,
-            "title": e.title,
-            "content": e.content,
-            "source": e.source,
-            "score": float(sc),
-        })
+    qv = _embed_text(query, dim=snapshot.dim or 128)
+    results.extend(hybrid_top_k(snapshot, query, qv, k))
     logger.info("Recuperado %d docs do índice local", len(results))
     return results
 
 
 def generate_answer_from_context(query: str, sources: List[Dict]) -> str:
-    """Tenta gerar resposta com genai; senão fallback concatenação."""
-    if not sources:
-        return "Não foi possível recuperar contexto relevante para responder à pergunta."
-
-    try:
-        api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-        enable_genai = os.environ.get("ENABLE_GENAI", "1") != "0"
-        if api_key and enable_genai:
-            try:
-                import genai as _genai
-                logger.info("Usando genai para gerar resposta (modelo: %s)", os.environ.get("GEMINI_MODEL", "gemini-2.5-flash"))
-                _genai.configure(api_key=api_key)
-                model_name = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
-                model = _genai.GenerativeModel(model_name)
-                ctx = "\n\n---\n\n".join([s["content"][:1500] for s in sources])
-                prompt = f"Contexto:\n{ctx}\n\nPergunta: {query}\n\nResponda de forma objetiva e fundamente suas afirmações citando as fontes quando possível."  # noqa: E501
-                resp = model.generate_content(prompt)
-                text = getattr(resp, "text", None) or str(resp)
-                return text.strip()
-            except Exception:
-                logger.exception("genai import/exec falhou, usando fallback de contexto")
-    except Exception:
-        logger.exception("genai falhou, usando fallback de contexto")
+    """Tenta gerar resposta com genai (com cache semântico); senão fallback concatenação."""
+    from backend_service.generation import generate_answer_from_context as _generate
 
-    # fallback simple
-    snippets = "\n\n---\n\n".join([f"Fonte: {s.get('source') or s.get('title') or s.get('id')}\n{s.get('content')[:1000]}" for s in sources[:3]])
-    return f"(Fallback) Não foi possível gerar via LLM. Trechos relevantes:\n\n{snippets}\n\nPergunta: {query}"
+    return _generate(query, sources)
 
 
 # FastAPI app
@@ -388,40 +360,15 @@ def scrape_confluence(req: ScrapeConfluenceRequest):
         if not chunks:
             raise HTTPException(status_code=400, detail="Nenhum conteúdo extraído da página.")
 
-        # embeddings: tenta usar sentence-transformers, senão fallback determinístico
-        embedding_vectors = []
-        try:
-            from sentence_transformers import SentenceTransformer
-
-            emb_model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
-            for c in chunks:
-                vec = emb_model.encode([c])[0].tolist()
-                embedding_vectors.append(vec)
-        except Exception:
-            logger.warning("sentence-transformers não disponível — usando embedding determinístico")
-            for c in chunks:
-                embedding_vectors.append(_embed_text(c, dim=128))
+        # upsert incremental: ids estáveis por fonte/conteúdo, só grava o que mudou
+        from backend_service.services import upsert_source
 
-        # conecta ao Chroma (HTTP preferencial)
+        collection_name = req.collection_name or os.environ.get("COLLECTION_NAME", "fragaz")
+        metadatas = [{"source": req.url, "title": req.title or req.url, "chunk_index": i} for i in range(len(chunks))]
         try:
-            import chromadb as _chromadb
-
-            chroma_client = None
-            try:
-                chroma_client = _chromadb.HttpClient(host=os.environ.get("CHROMA_SERVER_IP"), port=int(os.environ.get("CHROMA_SERVER_PORT")), headers={"X-Chroma-Token": os.environ.get("CHROMA_AUTH_TOKEN")})
-            except Exception:
-                # fallback local client
-                chroma_client = _chromadb.Client()
-
-            collection_name = req.collection_name or os.environ.get("COLLECTION_NAME", "fragaz")
-            coll = chroma_client.get_or_create_collection(collection_name)
-
-            ids = [f"confluence-{int(time.time())}-{i}" for i in range(len(chunks))]
-            metadatas = [{"source": req.url, "title": req.title or req.url, "chunk_index": i} for i in range(len(chunks))]
-
-            coll.add(documents=chunks, metadatas=metadatas, ids=ids, embeddings=embedding_vectors)
-            logger.info("Adicionados %d chunks ao Chroma collection=%s", len(chunks), collection_name)
-            return {"status": "success", "added": len(chunks), "collection": collection_name}
+            summary = upsert_source(collection_name, req.url, chunks, metadatas)
+            logger.info("Confluence %s sincronizado com collection=%s: %s", req.url, collection_name, summary)
+            return {"status": "success", **summary, "collection": collection_name}
         except Exception as e:
             logger.exception("Falha ao enviar para Chroma: %s", e)
             raise HTTPException(status_code=500, detail=f"Erro Chroma: {e}")
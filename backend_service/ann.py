@@ -0,0 +1,183 @@
+"""ANN: índice IVF (inverted file) em NumPy puro para o fallback local.
+
+Os embeddings (já normalizados) são agrupados por k-means esférico em `nlist`
+listas; na consulta apenas as `nprobe` listas mais próximas da query são
+pontuadas. `nprobe` controla o compromisso recall x latência (`nprobe == nlist`
+equivale à busca exata).
+
+O índice é persistido ao lado do arquivo do índice local
+(`.fragaz_index.ivf.npz`) e habilitado por deployment via ambiente::
+
+    FRAGAZ_ANN=ivf            # vazio/"exact" mantém a busca exaustiva
+    FRAGAZ_ANN_NPROBE=8
+    FRAGAZ_ANN_NLIST=0        # 0 = automático (~2*sqrt(n))
+"""
+from __future__ import annotations
+
+import logging
+import os
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .local_index import top_k
+
+logger = logging.getLogger("fragaz.ann")
+
+ASSIGN_BLOCK_ROWS = 65536
+TRAIN_POINTS_PER_LIST = 64
+
+
+def ann_mode() -> str:
+    return os.environ.get("FRAGAZ_ANN", "").strip().lower()
+
+
+def ann_path(index_path: Path) -> Path:
+    index_path = Path(index_path)
+    return index_path.with_name(index_path.stem + ".ivf.npz")
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(x[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(x: np.ndarray, nlist: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """K-means esférico (similaridade cosseno) sobre uma amostra de `x`."""
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    sample_size = min(n, nlist * TRAIN_POINTS_PER_LIST)
+    sample = np.asarray(x[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        counts = np.bincount(labels, minlength=nlist)
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+        empty = counts == 0
+        if empty.any():
+            # reinicializa listas vazias com pontos aleatórios
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms > 0, norms, 1.0)
+    return centroids.astype(np.float32)
+
+
+FINGERPRINT_BLOCK_ROWS = 65536
+
+
+def fingerprint(snapshot) -> int:
+    """Identifica o conteúdo do índice para detectar arquivos obsoletos.
+
+    Cobre a forma da matriz, todas as colunas de texto (blob e offsets) e os
+    vetores: editar o conteúdo de um chunk sem mudar o id também invalida os
+    índices derivados (IVF, quantização, BM25). É um crc32 em blocos, sem
+    cópia do mmap inteiro.
+    """
+    crc = zlib.crc32(f"{len(snapshot)}:{snapshot.dim}".encode())
+    for name in sorted(snapshot.columns):
+        col = snapshot.columns[name]
+        crc = zlib.crc32(name.encode(), crc)
+        crc = zlib.crc32(np.ascontiguousarray(col.offsets, dtype=np.int64) - int(col.offsets[0]), crc)
+        if len(col):
+            crc = zlib.crc32(memoryview(col.blob)[int(col.offsets[0]):int(col.offsets[-1])], crc)
+    matrix = snapshot.matrix
+    for start in range(0, len(matrix), FINGERPRINT_BLOCK_ROWS):
+        crc = zlib.crc32(np.ascontiguousarray(matrix[start:start + FINGERPRINT_BLOCK_ROWS], dtype=np.float32), crc)
+    return crc
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_rows: np.ndarray, fingerprint: int = 0, nprobe: int = 8):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.fingerprint = fingerprint
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, nlist: int = 0, iters: int = 10, seed: int = 0, fingerprint: int = 0, nprobe: int = 8) -> "IVFIndex":
+        n = len(matrix)
+        if nlist <= 0:
+            nlist = max(1, int(2 * np.sqrt(n)))
+        nlist = max(1, min(nlist, n))
+        centroids = kmeans(matrix, nlist, iters=iters, seed=seed)
+        labels = _assign(matrix, centroids)
+        list_rows = np.argsort(labels, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=list_offsets[1:])
+        return cls(centroids, list_offsets, list_rows, fingerprint, nprobe)
+
+    def candidates(self, q: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        cscores = self.centroids @ q
+        probe = np.argpartition(-cscores, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+        return np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe])
+
+    def search(self, matrix: np.ndarray, query_vec, k: int, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        q = np.asarray(query_vec, dtype=np.float32)
+        qn = float(np.linalg.norm(q))
+        if qn == 0 or k <= 0 or q.shape[0] != matrix.shape[1]:
+            return []
+        q = q / qn
+        rows = self.candidates(q, nprobe)
+        if rows.size == 0:
+            return []
+        rows.sort()  # acesso sequencial ao mmap
+        scores = np.asarray(matrix[rows], dtype=np.float32) @ q
+        return [(int(rows[i]), sc) for i, sc in top_k(scores, k)]
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(tmp, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows,
+                 fingerprint=np.array([self.fingerprint], dtype=np.int64))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path, nprobe: int = 8) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["list_offsets"], data["list_rows"], int(data["fingerprint"][0]), nprobe)
+
+
+def attach(snapshot, index_path: Path, fp: Optional[int] = None) -> None:
+    """Anexa um IVF ao snapshot quando `FRAGAZ_ANN=ivf`, carregando do disco ou construindo.
+
+    `fp` é o `fingerprint` do snapshot, quando já calculado (ver `LocalIndex`).
+    """
+    if ann_mode() != "ivf" or len(snapshot) == 0:
+        return
+    nprobe = int(os.environ.get("FRAGAZ_ANN_NPROBE", "8"))
+    nlist = int(os.environ.get("FRAGAZ_ANN_NLIST", "0"))
+    fp = fingerprint(snapshot) if fp is None else fp
+    path = ann_path(index_path)
+    ivf = None
+    if path.exists():
+        try:
+            ivf = IVFIndex.load(path, nprobe=nprobe)
+            if ivf.fingerprint != fp or len(ivf.list_rows) != len(snapshot):
+                logger.info("Índice IVF obsoleto, reconstruindo: %s", path)
+                ivf = None
+        except Exception as e:
+            logger.warning("Falha ao carregar índice IVF %s: %s", path, e)
+            ivf = None
+    if ivf is None:
+        ivf = IVFIndex.build(snapshot.matrix, nlist=nlist, fingerprint=fp, nprobe=nprobe)
+        try:
+            ivf.save(path)
+        except OSError as e:
+            logger.warning("Não foi possível persistir índice IVF: %s", e)
+        logger.info("Índice IVF construído: nlist=%d, %d entradas", ivf.nlist, len(snapshot))
+    snapshot.ann = ivf
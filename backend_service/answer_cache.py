@@ -0,0 +1,172 @@
+"""Answer cache: cache semântico das respostas geradas pelo LLM.
+
+Uma resposta em cache é reaproveitada quando:
+
+- o conjunto de fontes recuperadas é exatamente o mesmo (ids + hash do
+  conteúdo de cada chunk), e
+- a similaridade cosseno entre o embedding da nova query e o da query original
+  é >= `threshold`.
+
+O embedding da query vem do modelo compartilhado de `embeddings.py`
+(`generation.embed_query`). Sem o modelo (sem `sentence-transformers`, ou se
+ele falhar ao carregar) os vetores são o hash determinístico de
+`services._embed_text`, que só aproxima palavras, não significado: nesse caso o
+chamador passa `exact=True` e só a mesma pergunta normalizada reaproveita a
+resposta.
+
+Como o hash do conteúdo faz parte da chave, uma resposta fica obsoleta
+automaticamente quando qualquer chunk citado muda; `invalidate_sources` remove
+proativamente as respostas que citam ids regravados na ingestão.
+
+Configuração::
+
+    FRAGAZ_ANSWER_CACHE=1
+    FRAGAZ_ANSWER_CACHE_THRESHOLD=0.92
+    FRAGAZ_ANSWER_CACHE_SIZE=1024
+    FRAGAZ_ANSWER_CACHE_TTL=3600
+"""
+from __future__ import annotations
+
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Sequence, Set
+
+import numpy as np
+
+EXACT_SIMILARITY = 1.0 - 1e-6  # vetores iguais, a menos de arredondamento
+
+
+def content_hash(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+def source_signature(sources: Sequence[Dict]) -> str:
+    """Identifica o conjunto de fontes (ordem irrelevante) pelos ids e hashes de conteúdo."""
+    parts = sorted(f"{s.get('id')}:{content_hash(s.get('content'))}" for s in sources)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("signature", "embedding", "answer", "source_ids", "expires", "cost")
+
+    def __init__(self, signature: str, embedding: np.ndarray, answer: str, source_ids: Set[str], expires: float, cost: float):
+        self.signature = signature
+        self.embedding = embedding
+        self.answer = answer
+        self.source_ids = source_ids
+        self.expires = expires
+        self.cost = cost
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = 0.92, max_entries: int = 1024, ttl: float = 3600.0):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_signature: Dict[str, Set[int]] = {}
+        self._by_source: Dict[str, Set[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0,
+                       "invalidations": 0, "saved_seconds": 0.0}
+
+    @staticmethod
+    def _normalize(vec) -> Optional[np.ndarray]:
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n > 0 else None
+
+    def _drop(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        ids = self._by_signature.get(entry.signature)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_signature[entry.signature]
+        for sid in entry.source_ids:
+            refs = self._by_source.get(sid)
+            if refs is not None:
+                refs.discard(entry_id)
+                if not refs:
+                    del self._by_source[sid]
+
+    def lookup(self, query_vec, sources: Sequence[Dict], exact: bool = False) -> Optional[str]:
+        """Resposta em cache para as mesmas fontes e query parecida; `exact` exige o mesmo vetor."""
+        q = self._normalize(query_vec)
+        signature = source_signature(sources)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_sim = None, max(self.threshold, EXACT_SIMILARITY) if exact else self.threshold
+            for entry_id in list(self._by_signature.get(signature, ())):
+                entry = self._entries[entry_id]
+                if entry.expires < now:
+                    self._drop(entry_id)
+                    self._stats["expirations"] += 1
+                    continue
+                if q is None or entry.embedding.shape != q.shape:
+                    continue
+                sim = float(entry.embedding @ q)
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += entry.cost
+            return entry.answer
+
+    def store(self, query_vec, sources: Sequence[Dict], answer: str, cost: float = 0.0) -> None:
+        q = self._normalize(query_vec)
+        if q is None:
+            return
+        signature = source_signature(sources)
+        source_ids = {str(s.get("id")) for s in sources}
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = _Entry(signature, q, answer, source_ids, time.monotonic() + self.ttl, cost)
+            self._by_signature.setdefault(signature, set()).add(entry_id)
+            for sid in source_ids:
+                self._by_source.setdefault(sid, set()).add(entry_id)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate_sources(self, source_ids: Iterable[str]) -> int:
+        with self._lock:
+            victims: Set[int] = set()
+            for sid in source_ids:
+                victims |= self._by_source.get(str(sid), set())
+            for entry_id in victims:
+                self._drop(entry_id)
+            self._stats["invalidations"] += len(victims)
+            return len(victims)
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry_id in list(self._entries):
+                self._drop(entry_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats, entries=len(self._entries), threshold=self.threshold)
+        total = out["hits"] + out["misses"]
+        out["hit_rate"] = out["hits"] / total if total else 0.0
+        return out
+
+
+def from_env() -> Optional[AnswerCache]:
+    if os.environ.get("FRAGAZ_ANSWER_CACHE", "1") == "0":
+        return None
+    return AnswerCache(
+        threshold=float(os.environ.get("FRAGAZ_ANSWER_CACHE_THRESHOLD", "0.92")),
+        max_entries=int(os.environ.get("FRAGAZ_ANSWER_CACHE_SIZE", "1024")),
+        ttl=float(os.environ.get("FRAGAZ_ANSWER_CACHE_TTL", "3600")),
+    )
@@ -2,18 +2,32 @@
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
+from . import embeddings, rerank
 from .controllers import router as controllers_router
 
 logger = logging.getLogger("fragaz.app")
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # carrega o modelo de embedding em background para a primeira ingestão não pagar o load
+    if embeddings.warmup_enabled():
+        embeddings.get_embedding_service().warmup()
+        reranker = rerank.get_reranker()
+        if reranker is not None:
+            asyncio.get_running_loop().run_in_executor(None, reranker.model)
+    yield
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="FRAGAZ Backend", version="0.1")
+    app = FastAPI(title="FRAGAZ Backend", version="0.1", lifespan=lifespan)
 
     # CORS middleware
     from fastapi.middleware.cors import CORSMiddleware
@@ -0,0 +1,318 @@
+"""Chroma pool: clientes Chroma de longa duração com handles de coleção em cache.
+
+Cada slot do pool é um cliente (com a sua sessão HTTP keep-alive) criado uma
+única vez e reutilizado entre requisições. O número de slots é limitado
+(`FRAGAZ_CHROMA_POOL_SIZE`); quem não consegue um slot em
+`FRAGAZ_CHROMA_POOL_TIMEOUT` segundos recebe `ChromaPoolTimeout`. Cada slot faz
+um `heartbeat()` no checkout quando o último check tem mais de
+`FRAGAZ_CHROMA_HEALTH_INTERVAL` segundos; slots com falha são descartados.
+
+Gravações (`vector_writer.py`) usam no máximo `FRAGAZ_CHROMA_WRITE_SLOTS`
+slots (padrão: metade do pool), para que a ingestão nunca ocupe o pool
+inteiro e as consultas continuem tendo conexão durante um job.
+
+Os handles de coleção ficam em cache por slot e por nome e são invalidados
+(por geração) quando a coleção é removida ou recriada via `delete_collection`
+/ `invalidate`.
+
+`AsyncChroma` é o equivalente para o caminho assíncrono (`/query`): um único
+`chromadb.AsyncHttpClient` por event loop (o transporte httpx já multiplexa as
+requisições), usado quando o Chroma é remoto (`CHROMA_SERVER_IP` /
+`CHROMA_SERVER_PORT`), `FRAGAZ_ASYNC_CHROMA` não é "0" e o chromadb instalado
+tem o cliente assíncrono; se ele não puder ser criado, `/query` volta para o
+pool síncrono numa thread.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger("fragaz.chroma_pool")
+
+
+class ChromaUnavailable(RuntimeError):
+    pass
+
+
+class ChromaPoolTimeout(ChromaUnavailable):
+    pass
+
+
+class _Slot:
+    __slots__ = ("client", "collections", "last_check")
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.collections: Dict[str, Tuple[int, Any]] = {}
+        self.last_check = time.monotonic()
+
+
+class ChromaPool:
+    def __init__(self, factory: Callable[[], Any], size: int = 4, health_interval: float = 30.0, retry_after: float = 30.0, checkout_timeout: float = 5.0,
+                 write_slots: Optional[int] = None):
+        self._factory = factory
+        self.size = max(1, size)
+        # com um slot só não há o que reservar: leitura e escrita disputam o mesmo
+        self.write_slots = max(1, min(self.size - 1, self.size // 2 if write_slots is None else write_slots))
+        self._write_sem = threading.BoundedSemaphore(self.write_slots)
+        self.health_interval = health_interval
+        self.retry_after = retry_after
+        self.checkout_timeout = checkout_timeout
+        self._idle: "queue.LifoQueue[_Slot]" = queue.LifoQueue()
+        self._sem = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._generations: Dict[str, int] = {}
+        self._down_until = 0.0
+        self._stats = {
+            "created": 0, "discarded": 0, "checkouts": 0, "timeouts": 0, "in_use": 0, "writes_in_use": 0,
+            "wait_seconds": 0.0, "health_checks": 0, "health_failures": 0,
+            "collection_hits": 0, "collection_misses": 0, "invalidations": 0,
+        }
+
+    def _incr(self, key: str, value=1) -> None:
+        with self._lock:
+            self._stats[key] += value
+
+    def _new_slot(self) -> _Slot:
+        if time.monotonic() < self._down_until:
+            raise ChromaUnavailable("Chroma indisponível (aguardando nova tentativa)")
+        try:
+            client = self._factory()
+        except Exception as e:
+            client = None
+            logger.warning("Falha ao criar cliente Chroma: %s", e)
+        if client is None:
+            self._down_until = time.monotonic() + self.retry_after
+            raise ChromaUnavailable("Chroma client não disponível")
+        self._incr("created")
+        return _Slot(client)
+
+    def _check(self, slot: _Slot) -> bool:
+        if time.monotonic() - slot.last_check < self.health_interval:
+            return True
+        self._incr("health_checks")
+        try:
+            slot.client.heartbeat()
+            slot.last_check = time.monotonic()
+            return True
+        except Exception as e:
+            self._incr("health_failures")
+            logger.warning("Health check do Chroma falhou, descartando conexão: %s", e)
+            return False
+
+    @contextmanager
+    def _write_budget(self, write: bool) -> Iterator[None]:
+        if not write:
+            yield
+            return
+        # escritores (threads de background) esperam a vez sem timeout
+        self._write_sem.acquire()
+        self._incr("writes_in_use")
+        try:
+            yield
+        finally:
+            self._incr("writes_in_use", -1)
+            self._write_sem.release()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None, write: bool = False) -> Iterator[_Slot]:
+        with self._write_budget(write), self._checkout(timeout) as slot:
+            yield slot
+
+    @contextmanager
+    def _checkout(self, timeout: Optional[float] = None) -> Iterator[_Slot]:
+        t0 = time.monotonic()
+        if not self._sem.acquire(timeout=self.checkout_timeout if timeout is None else timeout):
+            self._incr("timeouts")
+            raise ChromaPoolTimeout("Nenhuma conexão Chroma livre no pool")
+        slot: Optional[_Slot] = None
+        try:
+            while slot is None:
+                try:
+                    slot = self._idle.get_nowait()
+                except queue.Empty:
+                    slot = self._new_slot()
+                    break
+                if not self._check(slot):
+                    self._incr("discarded")
+                    slot = None
+            with self._lock:
+                self._stats["checkouts"] += 1
+                self._stats["in_use"] += 1
+                self._stats["wait_seconds"] += time.monotonic() - t0
+        except BaseException:
+            self._sem.release()
+            raise
+        try:
+            yield slot
+        except Exception:
+            # possível erro de transporte: força health check no próximo checkout
+            slot.last_check = 0.0
+            raise
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._idle.put(slot)
+            self._sem.release()
+
+    @contextmanager
+    def collection(self, name: str, create: bool = False, timeout: Optional[float] = None,
+                   write: bool = False) -> Iterator[Any]:
+        with self.connection(timeout, write) as slot:
+            gen = self._generations.get(name, 0)
+            cached = slot.collections.get(name)
+            if cached is not None and cached[0] == gen:
+                self._incr("collection_hits")
+                coll = cached[1]
+            else:
+                self._incr("collection_misses")
+                coll = slot.client.get_or_create_collection(name) if create else slot.client.get_collection(name)
+                slot.collections[name] = (gen, coll)
+            yield coll
+
+    def invalidate(self, name: str) -> None:
+        """Descarta os handles em cache de `name` em todos os slots."""
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+            self._stats["invalidations"] += 1
+
+    def delete_collection(self, name: str) -> None:
+        with self.connection() as slot:
+            slot.client.delete_collection(name)
+        self.invalidate(name)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+        out.update(size=self.size, write_slots=self.write_slots, idle=self._idle.qsize(), available=time.monotonic() >= self._down_until)
+        return out
+
+
+_pool: Optional[ChromaPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(factory: Optional[Callable[[], Any]] = None) -> ChromaPool:
+    """Pool do processo. `factory` só é usado na primeira chamada."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if factory is None:
+                    from .services import get_chroma_client as factory
+                _pool = ChromaPool(
+                    factory,
+                    size=int(os.environ.get("FRAGAZ_CHROMA_POOL_SIZE", "4")),
+                    health_interval=float(os.environ.get("FRAGAZ_CHROMA_HEALTH_INTERVAL", "30")),
+                    checkout_timeout=float(os.environ.get("FRAGAZ_CHROMA_POOL_TIMEOUT", "5")),
+                    write_slots=int(os.environ["FRAGAZ_CHROMA_WRITE_SLOTS"]) if os.environ.get("FRAGAZ_CHROMA_WRITE_SLOTS") else None,
+                )
+    return _pool
+
+
+def reset_pool(pool: Optional[ChromaPool] = None) -> None:
+    """Substitui o pool do processo (usado em testes e ao trocar de servidor)."""
+    global _pool
+    with _pool_lock:
+        _pool = pool
+
+
+class AsyncChroma:
+    def __init__(self, factory: Callable[[], Awaitable[Any]], retry_after: float = 30.0):
+        self._factory = factory
+        self.retry_after = retry_after
+        self._client: Any = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._collections: Dict[str, Tuple[int, Any]] = {}
+        self._generations: Dict[str, int] = {}
+        self._down_until = 0.0
+        self._stats = {"created": 0, "failures": 0, "collection_hits": 0, "collection_misses": 0, "invalidations": 0}
+
+    def _bind(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # o cliente httpx fica preso ao loop em que foi criado
+            self._loop, self._lock, self._client = loop, asyncio.Lock(), None
+            self._collections.clear()
+        return self._lock
+
+    async def client(self) -> Any:
+        lock = self._bind()
+        if self._client is not None:
+            return self._client
+        async with lock:
+            if self._client is None:
+                if time.monotonic() < self._down_until:
+                    raise ChromaUnavailable("Chroma indisponível (aguardando nova tentativa)")
+                try:
+                    self._client = await self._factory()
+                except Exception as e:
+                    logger.warning("Falha ao criar cliente Chroma assíncrono: %s", e)
+                    self._client = None
+                if self._client is None:
+                    self._stats["failures"] += 1
+                    self._down_until = time.monotonic() + self.retry_after
+                    raise ChromaUnavailable("Chroma client não disponível")
+                self._stats["created"] += 1
+        return self._client
+
+    async def collection(self, name: str) -> Any:
+        client = await self.client()
+        gen = self._generations.get(name, 0)
+        cached = self._collections.get(name)
+        if cached is not None and cached[0] == gen:
+            self._stats["collection_hits"] += 1
+            return cached[1]
+        self._stats["collection_misses"] += 1
+        coll = await client.get_collection(name)
+        self._collections[name] = (gen, coll)
+        return coll
+
+    def invalidate(self, name: str) -> None:
+        self._generations[name] = self._generations.get(name, 0) + 1
+        self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        return dict(self._stats, connected=self._client is not None, available=time.monotonic() >= self._down_until)
+
+
+_async: Optional[AsyncChroma] = None
+_async_ready = False
+
+
+def async_supported() -> bool:
+    """`chromadb.AsyncHttpClient` só existe a partir do chromadb 0.5."""
+    try:
+        import chromadb
+    except Exception:
+        return False
+    return hasattr(chromadb, "AsyncHttpClient")
+
+
+def async_enabled() -> bool:
+    return (bool(os.environ.get("CHROMA_SERVER_IP") and os.environ.get("CHROMA_SERVER_PORT"))
+            and os.environ.get("FRAGAZ_ASYNC_CHROMA", "1") != "0" and async_supported())
+
+
+def get_async_chroma() -> Optional[AsyncChroma]:
+    """Cliente assíncrono do processo, ou None se o Chroma não for remoto."""
+    global _async, _async_ready
+    if not _async_ready:
+        if async_enabled():
+            from .services import get_async_chroma_client
+
+            _async = AsyncChroma(get_async_chroma_client)
+        _async_ready = True
+    return _async
+
+
+def reset_async_chroma(chroma: Optional[AsyncChroma] = None) -> None:
+    global _async, _async_ready
+    _async, _async_ready = chroma, chroma is not None
@@ -0,0 +1,219 @@
+"""Chunking: HTML -> chunks em streaming, respeitando frases e seções.
+
+O HTML é consumido em pedaços (`feed`) por um `html.parser.HTMLParser`, que
+emite blocos de texto (parágrafos, itens de lista, células...) assim que eles
+fecham; os blocos viram frases e as frases são agrupadas em chunks de até
+`max_tokens` tokens, com `overlap` tokens de sobreposição entre chunks
+consecutivos da mesma seção. Títulos (`h1`..`h6`) fecham o chunk corrente e
+atualizam o caminho de seção (`"Guia > Estorno > Limites"`), que vai nos
+metadados do chunk.
+
+Nada mantém a página inteira em memória: o parser guarda só o bloco corrente
+(que é cortado se passar de `max_block_chars`) e o chunker só as frases do
+chunk corrente. Tokens são aproximados por palavras separadas por espaço.
+
+Configuração::
+
+    FRAGAZ_CHUNK_TOKENS=200
+    FRAGAZ_CHUNK_OVERLAP=40
+"""
+from __future__ import annotations
+
+import codecs
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple, Union
+
+BLOCK_TAGS = frozenset({
+    "p", "div", "li", "ul", "ol", "tr", "td", "th", "table", "pre", "blockquote", "section", "article",
+    "br", "hr", "dd", "dt", "dl", "header", "footer", "caption", "figcaption",
+})
+HEADING_TAGS = {f"h{i}": i for i in range(1, 7)}
+SKIP_TAGS = frozenset({"script", "style", "noscript", "template"})
+
+# fim de frase: . ! ? … seguidos de espaço e de algo que começa uma frase nova
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])[\"”')\]]*\s+(?=[\"“'(\[]?[A-ZÀ-ÖØ-Þ0-9])")
+
+Block = Tuple[Optional[int], str]  # (nível do título ou None, texto)
+
+
+@dataclass
+class Chunk:
+    text: str
+    section: str
+    index: int
+    tokens: int
+
+
+class _BlockParser(HTMLParser):
+    def __init__(self, max_block_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_block_chars = max_block_chars
+        self.blocks: Deque[Block] = deque()
+        self._buf: List[str] = []
+        self._buf_len = 0
+        self._skip = 0
+        self._heading: Optional[int] = None
+
+    def _flush(self) -> None:
+        if self._buf:
+            text = " ".join("".join(self._buf).split())
+            self._buf, self._buf_len = [], 0
+            if text:
+                self.blocks.append((self._heading, text))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag in HEADING_TAGS:
+            self._flush()
+            self._heading = HEADING_TAGS[tag]
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in HEADING_TAGS:
+            self._flush()
+            self._heading = None
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        self._buf.append(data)
+        self._buf_len += len(data)
+        if self._buf_len > self.max_block_chars and self._heading is None:
+            # bloco gigante: corta no último espaço para não partir palavras
+            text = "".join(self._buf)
+            cut = max(text.rfind(" "), text.rfind("\n"))
+            cut = cut if cut > 0 else len(text)
+            self._buf = [text[:cut]]
+            self._flush()
+            self._buf, self._buf_len = [text[cut:]], len(text) - cut
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def iter_blocks(html: Union[str, Iterable[str]], max_block_chars: int = 20000, feed_size: int = 65536) -> Iterator[Block]:
+    """Blocos de texto do HTML, na ordem; aceita string ou iterável de pedaços."""
+    parser = _BlockParser(max_block_chars)
+    pieces = (html[i:i + feed_size] for i in range(0, len(html), feed_size)) if isinstance(html, str) else html
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for piece in pieces:
+        if isinstance(piece, bytes):
+            piece = decoder.decode(piece)
+        parser.feed(piece)
+        while parser.blocks:
+            yield parser.blocks.popleft()
+    parser.close()
+    while parser.blocks:
+        yield parser.blocks.popleft()
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in _SENTENCE_RE.split(text) if s.strip()]
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """Como `split_sentences`, mas devolve (início, fim) de cada frase em `text`, sem espaços nas pontas."""
+    spans = []
+    start = 0
+    for m in [*_SENTENCE_RE.finditer(text), None]:
+        end = m.start() if m is not None else len(text)
+        piece = text[start:end]
+        if piece.strip():
+            lead = len(piece) - len(piece.lstrip())
+            spans.append((start + lead, start + len(piece.rstrip())))
+        if m is not None:
+            start = m.end()
+    return spans
+
+
+class _Chunker:
+    def __init__(self, max_tokens: int, overlap: int):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap = max(0, min(overlap, self.max_tokens // 2))
+        self.section: List[str] = []
+        self._levels: List[int] = []
+        self._sentences: Deque[Tuple[str, int]] = deque()
+        self._tokens = 0
+        self._fresh = 0  # frases novas (fora da sobreposição) no chunk corrente
+        self._index = 0
+
+    def _emit(self) -> Iterator[Chunk]:
+        if self._fresh:
+            text = " ".join(s for s, _ in self._sentences)
+            yield Chunk(text=text, section=" > ".join(self.section), index=self._index, tokens=self._tokens)
+            self._index += 1
+        # mantém no início do próximo chunk as últimas frases até `overlap` tokens
+        kept: Deque[Tuple[str, int]] = deque()
+        kept_tokens = 0
+        for sentence, n in reversed(self._sentences):
+            if kept_tokens + n > self.overlap:
+                break
+            kept.appendleft((sentence, n))
+            kept_tokens += n
+        self._sentences, self._tokens, self._fresh = kept, kept_tokens, 0
+
+    def flush(self) -> Iterator[Chunk]:
+        yield from self._emit()
+        self._sentences.clear()
+        self._tokens = 0
+
+    def heading(self, level: int, text: str) -> Iterator[Chunk]:
+        yield from self.flush()
+        while self._levels and self._levels[-1] >= level:
+            self._levels.pop()
+            self.section.pop()
+        self._levels.append(level)
+        self.section.append(text)
+
+    def add_sentence(self, sentence: str) -> Iterator[Chunk]:
+        words = sentence.split()
+        # frase maior que o chunk: corta em janelas de palavras
+        if len(words) > self.max_tokens:
+            yield from self._emit()
+            step = self.max_tokens - self.overlap
+            for start in range(0, len(words), step):
+                window = words[start:start + self.max_tokens]
+                self._sentences, self._tokens, self._fresh = deque([(" ".join(window), len(window))]), len(window), 1
+                yield from self._emit()
+                if start + self.max_tokens >= len(words):
+                    break
+            return
+        n = len(words)
+        if self._tokens + n > self.max_tokens:
+            yield from self._emit()
+            while self._sentences and self._tokens + n > self.max_tokens:
+                _, dropped = self._sentences.popleft()
+                self._tokens -= dropped
+        self._sentences.append((sentence, n))
+        self._tokens += n
+        self._fresh += 1
+
+
+def iter_chunks(html: Union[str, Iterable[str]], max_tokens: Optional[int] = None, overlap: Optional[int] = None) -> Iterator[Chunk]:
+    if max_tokens is None:
+        max_tokens = int(os.environ.get("FRAGAZ_CHUNK_TOKENS", "200"))
+    if overlap is None:
+        overlap = int(os.environ.get("FRAGAZ_CHUNK_OVERLAP", "40"))
+    chunker = _Chunker(max_tokens, overlap)
+    for level, text in iter_blocks(html, max_block_chars=max(2000, max_tokens * 20)):
+        if level is not None:
+            yield from chunker.heading(level, text)
+            continue
+        for sentence in split_sentences(text):
+            yield from chunker.add_sentence(sentence)
+    yield from chunker.flush()
@@ -0,0 +1,289 @@
+"""Context packer: monta o contexto do prompt dentro de um orçamento de tokens.
+
+Etapas de `pack`:
+
+1. junta chunks vizinhos da mesma fonte numa única passagem (índices
+   consecutivos em `chunk_index`, ou o fim de um igual ao começo do outro, como
+   na sobreposição do chunker), sem repetir o trecho sobreposto;
+2. remove frases quase duplicadas entre passagens (Jaccard de trigramas de
+   palavras acima de `FRAGAZ_CONTEXT_DEDUP`);
+3. escolhe as passagens por maximal marginal relevance (relevância = score da
+   recuperação mais sobreposição com a pergunta; redundância = cosseno entre
+   os vetores de termos) até `FRAGAZ_CONTEXT_TOKENS`; a última passagem que não
+   cabe inteira é cortada em fim de frase (ou de palavra, se nem a primeira
+   frase couber).
+
+Tokens são estimados por caracteres (~4 por token). O resultado (`Packing`)
+diz o que foi usado, juntado, cortado e descartado; os totais vão para
+`/metrics` (`context`).
+
+Configuração::
+
+    FRAGAZ_CONTEXT_TOKENS=2000
+    FRAGAZ_CONTEXT_MMR_LAMBDA=0.7
+    FRAGAZ_CONTEXT_DEDUP=0.8
+"""
+from __future__ import annotations
+
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .chunking import split_sentences
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+MIN_OVERLAP_WORDS = 6
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+def _terms(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _shingles(words: Sequence[str], n: int = 3) -> Set[Tuple[str, ...]]:
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(v * b.get(t, 0) for t, v in a.items())
+    na = math.sqrt(sum(v * v for v in a.values()))
+    nb = math.sqrt(sum(v * v for v in b.values()))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+def _overlap_words(a: List[str], b: List[str], max_words: int = 200) -> int:
+    """Tamanho do maior sufixo de `a` que é prefixo de `b` (em palavras)."""
+    for n in range(min(len(a), len(b), max_words), MIN_OVERLAP_WORDS - 1, -1):
+        if a[-n:] == b[:n]:
+            return n
+    return 0
+
+
+@dataclass
+class Passage:
+    ids: List[str]
+    source: Optional[str]
+    title: Optional[str]
+    text: str
+    score: float
+    tokens: int = 0
+    truncated: bool = False
+
+    def label(self) -> str:
+        name = self.title or self.source or (self.ids[0] if self.ids else "")
+        return f"{name} ({self.source})" if self.source and self.title and self.source != self.title else str(name)
+
+
+@dataclass
+class Packing:
+    passages: List[Passage] = field(default_factory=list)
+    budget: int = 0
+    input_tokens: int = 0
+    merged: int = 0
+    duplicates_removed: int = 0
+    dropped: List[str] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return sum(p.tokens for p in self.passages)
+
+    def report(self) -> Dict:
+        return {
+            "budget": self.budget,
+            "tokens": self.tokens,
+            "input_tokens": self.input_tokens,
+            "passages": [{"ids": p.ids, "tokens": p.tokens, "truncated": p.truncated} for p in self.passages],
+            "merged": self.merged,
+            "duplicates_removed": self.duplicates_removed,
+            "dropped": self.dropped,
+        }
+
+
+def _merge_adjacent(sources: Sequence[Dict]) -> Tuple[List[Passage], int]:
+    groups: Dict[Optional[str], List[Dict]] = {}
+    for s in sources:
+        groups.setdefault(s.get("source"), []).append(s)
+    passages: List[Passage] = []
+    merged = 0
+    for source, docs in groups.items():
+        if source is None:
+            passages.extend(Passage([str(d.get("id"))], None, d.get("title"), d.get("content") or "",
+                                    float(d.get("score") or 0.0)) for d in docs)
+            continue
+        docs = sorted(docs, key=lambda d: (d.get("chunk_index") is None, d.get("chunk_index") or 0))
+        chain: List[Tuple[Passage, Optional[int], List[str]]] = []  # (passagem, último chunk_index, palavras)
+        for d in docs:
+            text = d.get("content") or ""
+            words = text.split()
+            idx = d.get("chunk_index")
+            score = float(d.get("score") or 0.0)
+            joined = False
+            for i, (p, last_idx, p_words) in enumerate(chain):
+                n = _overlap_words(p_words, words)
+                consecutive = idx is not None and last_idx is not None and idx == last_idx + 1
+                if n or consecutive:
+                    rest = words[n:]
+                    p.text = " ".join(p_words + rest)
+                    p.ids.append(str(d.get("id")))
+                    p.score = max(p.score, score)
+                    chain[i] = (p, idx if idx is not None else last_idx, p_words + rest)
+                    merged += 1
+                    joined = True
+                    break
+            if not joined:
+                chain.append((Passage([str(d.get("id"))], source, d.get("title"), " ".join(words), score), idx, words))
+        passages.extend(p for p, _, _ in chain)
+    return passages, merged
+
+
+def _dedup_sentences(passages: List[Passage], threshold: float) -> int:
+    """Remove, de cada passagem, frases quase iguais a frases de passagens mais relevantes."""
+    seen: List[Set[Tuple[str, ...]]] = []
+    removed = 0
+    for p in sorted(passages, key=lambda p: -p.score):
+        kept = []
+        for sentence in split_sentences(p.text):
+            sh = _shingles(_terms(sentence))
+            if sh and any(len(sh & other) / len(sh | other) >= threshold for other in seen):
+                removed += 1
+                continue
+            if sh:
+                seen.append(sh)
+            kept.append(sentence)
+        p.text = " ".join(kept)
+    return removed
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    out = []
+    used = 0
+    for sentence in split_sentences(text):
+        t = estimate_tokens(sentence) + 1
+        if used + t > max_tokens:
+            break
+        out.append(sentence)
+        used += t
+    if out:
+        return " ".join(out)
+    # nem a primeira frase cabe (ex.: tabelas, texto sem pontuação): corta em fim de palavra
+    head = text.strip()[:max(0, max_tokens) * 4]
+    cut = head.rfind(" ")
+    return (head[:cut] if cut > 0 else head).rstrip()
+
+
+class ContextPacker:
+    def __init__(self, budget: int = 2000, mmr_lambda: float = 0.7, dedup_threshold: float = 0.8,
+                 min_passage_tokens: int = 40):
+        self.budget = budget
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+        self.min_passage_tokens = min_passage_tokens
+        self._lock = threading.Lock()
+        self._stats = {"prompts": 0, "input_tokens": 0, "packed_tokens": 0, "merged": 0, "duplicates_removed": 0,
+                       "dropped": 0, "truncated": 0}
+
+    def pack(self, query: str, sources: Sequence[Dict], budget: Optional[int] = None) -> Packing:
+        budget = self.budget if budget is None else budget
+        out = Packing(budget=budget, input_tokens=sum(estimate_tokens(s.get("content") or "") for s in sources))
+        passages, out.merged = _merge_adjacent(sources)
+        out.duplicates_removed = _dedup_sentences(passages, self.dedup_threshold)
+        for p in passages:
+            if not p.text.strip():
+                out.dropped.extend(p.ids)
+        passages = [p for p in passages if p.text.strip()]
+
+        q_terms = set(_terms(query))
+        vectors = [Counter(_terms(p.text)) for p in passages]
+        top = max((p.score for p in passages), default=0.0) or 1.0
+        relevance = []
+        for p, vec in zip(passages, vectors):
+            lexical = len(q_terms & vec.keys()) / len(q_terms) if q_terms else 0.0
+            relevance.append(0.7 * (p.score / top) + 0.3 * lexical)
+
+        remaining = list(range(len(passages)))
+        chosen: List[int] = []
+        left = budget
+        while remaining and left > 0:
+            def mmr(i: int) -> float:
+                redundancy = max((_cosine(vectors[i], vectors[j]) for j in chosen), default=0.0)
+                return self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy
+
+            best = max(remaining, key=mmr)
+            remaining.remove(best)
+            p = passages[best]
+            p.tokens = estimate_tokens(p.text)
+            if p.tokens > left:
+                # sobra pequena demais para valer uma passagem cortada (a primeira entra sempre)
+                if chosen and left < self.min_passage_tokens:
+                    out.dropped.extend(p.ids)
+                    continue
+                p.text = _truncate(p.text, left)
+                p.tokens = estimate_tokens(p.text)
+                p.truncated = True
+                if not p.text:
+                    out.dropped.extend(p.ids)
+                    continue
+            chosen.append(best)
+            left -= p.tokens
+        for i in remaining:
+            out.dropped.extend(passages[i].ids)
+        out.passages = [passages[i] for i in chosen]
+
+        with self._lock:
+            self._stats["prompts"] += 1
+            self._stats["input_tokens"] += out.input_tokens
+            self._stats["packed_tokens"] += out.tokens
+            self._stats["merged"] += out.merged
+            self._stats["duplicates_removed"] += out.duplicates_removed
+            self._stats["dropped"] += len(out.dropped)
+            self._stats["truncated"] += sum(1 for p in out.passages if p.truncated)
+        return out
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+        out["budget"] = self.budget
+        out["avg_packed_tokens"] = out["packed_tokens"] / out["prompts"] if out["prompts"] else 0.0
+        out["token_reduction"] = 1 - out["packed_tokens"] / out["input_tokens"] if out["input_tokens"] else 0.0
+        return out
+
+
+def from_env() -> ContextPacker:
+    return ContextPacker(
+        budget=int(os.environ.get("FRAGAZ_CONTEXT_TOKENS", "2000")),
+        mmr_lambda=float(os.environ.get("FRAGAZ_CONTEXT_MMR_LAMBDA", "0.7")),
+        dedup_threshold=float(os.environ.get("FRAGAZ_CONTEXT_DEDUP", "0.8")),
+    )
+
+
+_packer: Optional[ContextPacker] = None
+
+
+def get_packer() -> ContextPacker:
+    global _packer
+    if _packer is None:
+        _packer = from_env()
+    return _packer
+
+
+def reset_packer(packer: Optional[ContextPacker] = None) -> None:
+    global _packer
+    _packer = packer
+
+
+def stats() -> Optional[Dict]:
+    return _packer.stats() if _packer is not None else None
@@ -2,15 +2,18 @@
 """
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
 import os
 import time
-from typing import List, Optional
+from typing import Any, AsyncIterator, Awaitable, List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from . import services
+from . import generation, scores, services
 
 logger = logging.getLogger("fragaz.controllers")
 
@@ -26,12 +29,19 @@ class QueryResponse(BaseModel):
     answer: str
     confidence: dict
     sources: List[dict]
+    mode: Optional[str] = None
+    highlights: List[dict] = []
 
 
 @router.get("/health")
 def health():
     return {"status": "ok"}
 
+
+@router.get("/metrics")
+def metrics():
+    return services.runtime_stats()
+
 # --- Novos endpoints para autenticação e usuário ---
 from fastapi import Depends, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
@@ -96,27 +106,170 @@ def busca(q: str, user: dict = Depends(get_current_user)):
     return {"resultados": ["doc1", "doc2"]}
 
 
+class ClientDisconnected(Exception):
+    pass
+
+
+async def until_disconnect(request: Request, work: Awaitable[Any], poll: float = 0.25) -> Any:
+    """Aguarda `work`, cancelando-o se o cliente desconectar antes do fim."""
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait([task], timeout=poll)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def answer_query(q: str, k: int) -> dict:
+    sources = await services.retrieve_ranked_async(q, k=k)
+    answer = await generation.answer_async(q, sources)
+    confidence = _confidence(answer.text, sources)
+    logger.info("Resposta gerada (%s, chars=%d) - C=%.3f Rs=%.3f", answer.mode, len(answer.text), confidence["score"],
+                confidence["Rs"])
+    return {"answer": answer.text, "confidence": confidence, "sources": sources, "mode": answer.mode,
+            "highlights": answer.highlights}
+
+
 @router.post("/query", response_model=QueryResponse)
-def query_endpoint(req: QueryRequest):
+async def query_endpoint(req: QueryRequest, request: Request):
     try:
         logger.info("/query recebido: %s", req.q[:120])
-        sources = services.retrieve_docs(req.q, k=req.k or 5)
-        rs = 0.0
-        if sources:
-            vals = [s.get("score") for s in sources if isinstance(s.get("score"), (int, float))]
-            rs = float(sum(vals) / len(vals)) if vals else 0.0
-
-        # Simple answer generation (can be extended to use genai)
-        answer = "".join([s.get("content", "")[:500] for s in sources[:3]]) or "Sem resposta."
-        confidence = {"Rs": rs, "note": "Rs = média simples dos scores recuperados (0..1)"}
-        resp = {"answer": answer, "confidence": confidence, "sources": sources}
-        logger.info("Resposta gerada (chars=%d) - Rs=%.3f", len(answer), rs)
-        return resp
+        return await until_disconnect(request, answer_query(req.q, req.k or 5))
+    except ClientDisconnected:
+        logger.info("Cliente desconectou; /query cancelado")
+        return Response(status_code=499)
     except Exception as e:
         logger.exception("Erro no endpoint /query: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _confidence(answer: str, sources: List[dict]) -> dict:
+    """Confiança composta (`scores.py`): `score` = α·Rs + β·Cs + γ·Fs + δ·FS, todos em 0..1."""
+    return scores.get_scorer().score(answer, sources)
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_query(q: str, k: int) -> AsyncIterator[str]:
+    """Eventos SSE: `sources`, vários `token` e por fim `done` (confiança e tempos) ou `error`."""
+    t0 = time.monotonic()
+    try:
+        sources = await services.retrieve_ranked_async(q, k=k)
+        t_retrieval = time.monotonic() - t0
+        yield _sse("sources", sources)
+        t_first = None
+        pieces: List[str] = []
+        meta: dict = {}
+        async for piece in generation.stream_answer(q, sources, meta):
+            if t_first is None:
+                t_first = time.monotonic() - t0
+            pieces.append(piece)
+            yield _sse("token", {"text": piece})
+        total = time.monotonic() - t0
+        answer = "".join(pieces)
+        logger.info("Resposta transmitida (chars=%d) em %.3fs", len(answer), total)
+        yield _sse("done", {
+            "confidence": _confidence(answer, sources),
+            "mode": meta.get("mode"),
+            "highlights": meta.get("highlights", []),
+            "timing": {"retrieval_ms": round(t_retrieval * 1000, 1),
+                       "first_token_ms": round((t_first or total) * 1000, 1),
+                       "total_ms": round(total * 1000, 1)},
+        })
+    except asyncio.CancelledError:
+        logger.info("Cliente desconectou; /query/stream cancelado")
+        raise
+    except generation.StreamInterrupted as e:
+        logger.warning("Erro no endpoint /query/stream: %s", e)
+        yield _sse("error", {"detail": str(e), "truncated": True})
+    except Exception as e:
+        logger.exception("Erro no endpoint /query/stream: %s", e)
+        yield _sse("error", {"detail": str(e)})
+
+
+@router.post("/query/stream")
+async def query_stream_endpoint(req: QueryRequest):
+    """Como `/query`, mas em Server-Sent Events, com os tokens da resposta conforme são gerados."""
+    logger.info("/query/stream recebido: %s", req.q[:120])
+    return StreamingResponse(stream_query(req.q, req.k or 5), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    k: Optional[int] = 5
+    generate: bool = True
+    concurrency: Optional[int] = None
+
+
+def _ndjson(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+async def batch_query(queries: List[str], k: int, generate: bool, concurrency: int) -> AsyncIterator[str]:
+    """Uma linha NDJSON por pergunta, na ordem em que ficam prontas, e uma linha final de resumo."""
+    t0 = time.monotonic()
+    try:
+        retrieved = await asyncio.to_thread(services.retrieve_ranked_many, queries, k)
+    except Exception as e:
+        logger.exception("Erro na recuperação do /query/batch: %s", e)
+        yield _ndjson({"error": str(e)})
+        return
+    t_retrieval = time.monotonic() - t0
+    errors = 0
+    if not generate:
+        for i, (q, sources) in enumerate(zip(queries, retrieved)):
+            rs = scores.retrieval_score([s["score"] for s in sources if isinstance(s.get("score"), (int, float))])
+            yield _ndjson({"index": i, "q": q, "confidence": {"Rs": round(rs, 4)}, "sources": sources})
+    else:
+        slots = asyncio.Semaphore(concurrency)
+
+        async def answer(i: int) -> dict:
+            async with slots:
+                try:
+                    answer = await generation.answer_async(queries[i], retrieved[i])
+                except Exception as e:
+                    logger.warning("Pergunta %d do lote falhou: %s", i, e)
+                    return {"index": i, "q": queries[i], "error": str(e)}
+            return {"index": i, "q": queries[i], "answer": answer.text, "confidence": _confidence(answer.text, retrieved[i]),
+                    "sources": retrieved[i], "mode": answer.mode, "highlights": answer.highlights}
+
+        tasks = [asyncio.ensure_future(answer(i)) for i in range(len(queries))]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                item = await fut
+                errors += "error" in item
+                yield _ndjson(item)
+        finally:
+            for task in tasks:
+                task.cancel()
+    total = time.monotonic() - t0
+    logger.info("Lote de %d perguntas respondido em %.3fs (recuperação %.3fs)", len(queries), total, t_retrieval)
+    yield _ndjson({"done": True, "queries": len(queries), "errors": errors,
+                   "timing": {"retrieval_ms": round(t_retrieval * 1000, 1), "total_ms": round(total * 1000, 1)}})
+
+
+@router.post("/query/batch")
+async def query_batch_endpoint(req: BatchQueryRequest):
+    """Várias perguntas: recuperação num lote só e geração com concorrência limitada, em NDJSON."""
+    max_queries = int(os.environ.get("FRAGAZ_BATCH_MAX_QUERIES", "1000"))
+    if not req.queries:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma pergunta")
+    if len(req.queries) > max_queries:
+        raise HTTPException(status_code=413, detail=f"Máximo de {max_queries} perguntas por lote")
+    concurrency = max(1, min(req.concurrency or int(os.environ.get("FRAGAZ_BATCH_CONCURRENCY", "4")), 64))
+    logger.info("/query/batch recebido: %d perguntas", len(req.queries))
+    return StreamingResponse(batch_query(req.queries, req.k or 5, req.generate, concurrency),
+                             media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
 class ScrapeConfluenceRequest(BaseModel):
     url: str
     collection_name: Optional[str] = None
@@ -125,66 +278,61 @@ class ScrapeConfluenceRequest(BaseModel):
     title: Optional[str] = None
 
 
-@router.post("/scrape/confluence")
+@router.post("/scrape/confluence", status_code=202)
 def scrape_confluence(req: ScrapeConfluenceRequest):
+    """Enfileira a ingestão da página; acompanhe em `GET /jobs/{job_id}`."""
+    from .ingestion import get_job_queue
+    from .jobs import QueueFull
+
+    logger.info("/scrape/confluence solicitado: %s", req.url)
     try:
-        logger.info("/scrape/confluence solicitado: %s", req.url)
-        # Use the logic from services but keep controller thin
-        import requests
-        from bs4 import BeautifulSoup
-        from sentence_transformers import SentenceTransformer
-
-        headers = {"User-Agent": "FRAGAZ-Scraper/1.0"}
-        auth = None
-        if req.username and req.api_token:
-            from requests.auth import HTTPBasicAuth
-
-            auth = HTTPBasicAuth(req.username, req.api_token)
-
-        r = requests.get(req.url, headers=headers, auth=auth, timeout=30)
-        if r.status_code != 200:
-            raise HTTPException(status_code=502, detail=f"Falha ao buscar página Confluence: {r.status_code}")
-
-        soup = BeautifulSoup(r.text, "html.parser")
-        text = soup.get_text(separator="\n")
-
-        max_len = 800
-        chunks: List[str] = []
-        for para in text.splitlines():
-            p = para.strip()
-            if not p:
-                continue
-            while len(p) > max_len:
-                chunks.append(p[:max_len])
-                p = p[max_len:]
-            chunks.append(p)
-
-        if not chunks:
-            raise HTTPException(status_code=400, detail="Nenhum conteúdo extraído da página.")
-
-        emb_model = None
-        try:
-            emb_model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
-        except Exception:
-            emb_model = None
-
-        embedding_vectors = []
-        if emb_model:
-            for c in chunks:
-                embedding_vectors.append(emb_model.encode([c])[0].tolist())
-        else:
-            for c in chunks:
-                embedding_vectors.append(services._embed_text(c, dim=128))
-
-        collection_name = req.collection_name or os.environ.get("COLLECTION_NAME", "fragaz")
-        ids = [f"confluence-{int(time.time())}-{i}" for i in range(len(chunks))]
-        metadatas = [{"source": req.url, "title": req.title or req.url, "chunk_index": i} for i in range(len(chunks))]
-
-        services.add_documents_to_chroma(collection_name, chunks, metadatas, ids, embeddings=embedding_vectors)
-        logger.info("Adicionados %d chunks ao Chroma collection=%s", len(chunks), collection_name)
-        return {"status": "success", "added": len(chunks), "collection": collection_name}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("Erro em /scrape/confluence: %s", e)
-        raise HTTPException(status_code=500, detail=str(e))
+        job = get_job_queue().submit("confluence", req.model_dump())
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return {"job_id": job.id, "status": job.status}
+
+
+class CrawlConfluenceRequest(BaseModel):
+    base_url: str
+    space_key: Optional[str] = None
+    root_page_id: Optional[str] = None
+    collection_name: Optional[str] = None
+    username: Optional[str] = None
+    api_token: Optional[str] = None
+    max_pages: Optional[int] = None
+
+
+@router.post("/scrape/confluence/space", status_code=202)
+def crawl_confluence(req: CrawlConfluenceRequest):
+    """Enfileira o crawl de um espaço (`space_key`) ou de uma árvore de páginas (`root_page_id`)."""
+    from .ingestion import get_job_queue
+    from .jobs import QueueFull
+
+    if not req.space_key and not req.root_page_id:
+        raise HTTPException(status_code=400, detail="Informe space_key ou root_page_id")
+    logger.info("/scrape/confluence/space solicitado: %s %s", req.base_url, req.space_key or req.root_page_id)
+    try:
+        job = get_job_queue().submit("confluence_space", req.model_dump())
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    from .ingestion import get_job_queue
+
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job.public()
+
+
+@router.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    from .ingestion import get_job_queue
+
+    job = get_job_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job.public()
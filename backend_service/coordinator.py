@@ -0,0 +1,359 @@
+"""Coordinator: recuperação com circuit breaker e hedge entre Chroma e o índice local.
+
+Fluxo de `RetrievalCoordinator.retrieve`:
+
+1. se o breaker do Chroma estiver aberto, vai direto ao índice local;
+2. senão dispara a consulta ao Chroma e espera até o percentil configurado da
+   latência recente do Chroma (`FRAGAZ_HEDGE_PERCENTILE`);
+3. se o Chroma ainda não respondeu (ou falhou / voltou vazio), dispara o
+   índice local em paralelo e devolve o primeiro resultado bom dentro do
+   prazo da requisição (`FRAGAZ_RETRIEVAL_DEADLINE`).
+
+Falhas e timeouts do Chroma alimentam o breaker, que abre após
+`FRAGAZ_BREAKER_FAILURES` falhas consecutivas e tenta uma sonda após
+`FRAGAZ_BREAKER_COOLDOWN` segundos.
+
+`retrieve_with_origin_async` faz o mesmo no event loop, com os retrievers
+assíncronos (`primary_async` / `fallback_async`; na falta deles os síncronos
+rodam via `asyncio.to_thread`). Se a requisição for cancelada (cliente
+desconectou), as consultas em andamento são canceladas junto. Quando o índice
+local vence o hedge, a consulta ao Chroma continua em background até o prazo
+da requisição, como no caminho síncrono: se responder, alimenta a janela de
+latência e o breaker; se não, conta como falha (um Chroma travado abre o
+breaker em vez de atrasar toda pergunta pelo hedge).
+
+`retrieve_many_with_origin` atende várias perguntas com uma única consulta em
+lote ao Chroma (`primary_many`), sem hedge: se o lote falhar ou passar do
+prazo, todas vão para o índice local (`fallback_many`); perguntas que voltam
+vazias do Chroma também.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger("fragaz.coordinator")
+
+Retriever = Callable[[str, int], List[Dict]]
+AsyncRetriever = Callable[[str, int], Awaitable[List[Dict]]]
+ManyRetriever = Callable[[Sequence[str], int], List[List[Dict]]]
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0}
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.stats["successes"] += 1
+            self._failures = 0
+            self._probe_in_flight = False
+            self.state = CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.stats["failures"] += 1
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.stats["opened"] += 1
+                    logger.warning("Circuit breaker do Chroma aberto após %d falhas", self._failures)
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, state=self.state, consecutive_failures=self._failures)
+
+
+class LatencyWindow:
+    """Janela deslizante de latências para estimar percentis."""
+
+    def __init__(self, size: int = 256):
+        self._values: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return None
+        idx = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+        return values[idx]
+
+
+class RetrievalCoordinator:
+    def __init__(self, primary: Retriever, fallback: Retriever, breaker: Optional[CircuitBreaker] = None,
+                 hedge_percentile: float = 95.0, hedge_min_delay: float = 0.05, hedge_default_delay: float = 0.3,
+                 deadline: float = 3.0, max_workers: int = 16,
+                 primary_async: Optional[AsyncRetriever] = None, fallback_async: Optional[AsyncRetriever] = None,
+                 primary_many: Optional[ManyRetriever] = None, fallback_many: Optional[ManyRetriever] = None):
+        self.primary = primary
+        self.fallback = fallback
+        self.primary_async = primary_async or (lambda q, k: asyncio.to_thread(primary, q, k))
+        self.fallback_async = fallback_async or (lambda q, k: asyncio.to_thread(fallback, q, k))
+        self.primary_many = primary_many or (lambda qs, k: [primary(q, k) for q in qs])
+        self.fallback_many = fallback_many or (lambda qs, k: [fallback(q, k) for q in qs])
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.deadline = deadline
+        self.latency = LatencyWindow()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fragaz-retrieval")
+        self._lock = threading.Lock()
+        self._abandoned: Set[asyncio.Future] = set()  # primários que perderam o hedge, aguardando o prazo
+        self._stats = {
+            "requests": 0, "primary_wins": 0, "hedges": 0, "hedge_wins": 0,
+            "short_circuits": 0, "primary_failures": 0, "deadline_exceeded": 0,
+            "batches": 0, "batch_queries": 0, "batch_fallbacks": 0,
+        }
+
+    def _incr(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def hedge_delay(self) -> float:
+        p = self.latency.percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, p if p is not None else self.hedge_default_delay)
+
+    def _run_primary(self, query: str, k: int, state: Dict) -> List[Dict]:
+        t0 = time.monotonic()
+        try:
+            res = self.primary(query, k)
+        except Exception as e:
+            logger.info("Recuperação primária falhou: %s", e)
+            if not state.get("timed_out"):
+                self._incr("primary_failures")
+                self.breaker.record_failure()
+            raise
+        self.latency.add(time.monotonic() - t0)
+        if not state.get("timed_out"):
+            self.breaker.record_success()
+        return res
+
+    async def _run_primary_async(self, query: str, k: int, state: Dict) -> List[Dict]:
+        t0 = time.monotonic()
+        try:
+            res = await self.primary_async(query, k)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info("Recuperação primária falhou: %s", e)
+            if not state.get("timed_out"):
+                self._incr("primary_failures")
+                self.breaker.record_failure()
+            raise
+        self.latency.add(time.monotonic() - t0)
+        if not state.get("timed_out"):
+            self.breaker.record_success()
+        return res
+
+    def _abandon_primary(self, primary: asyncio.Future, state: Dict, t_end: float) -> None:
+        async def watch() -> None:
+            try:
+                done, _ = await asyncio.wait([primary], timeout=max(0.0, t_end - time.monotonic()))
+                if not done:
+                    state["timed_out"] = True
+                    self._incr("primary_failures")
+                    self.breaker.record_failure()
+            finally:
+                if not primary.done():
+                    primary.cancel()
+
+        task = asyncio.ensure_future(watch())
+        self._abandoned.add(task)
+        task.add_done_callback(self._abandoned.discard)
+
+    @staticmethod
+    def _good(fut) -> bool:
+        return fut.done() and not fut.cancelled() and fut.exception() is None and bool(fut.result())
+
+    def retrieve(self, query: str, k: int = 5, deadline: Optional[float] = None) -> List[Dict]:
+        return self.retrieve_with_origin(query, k, deadline)[0]
+
+    def retrieve_with_origin(self, query: str, k: int = 5, deadline: Optional[float] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Como `retrieve`, mas informa quem respondeu: "primary", "fallback" ou None."""
+        self._incr("requests")
+        if not self.breaker.allow():
+            self._incr("short_circuits")
+            return self.fallback(query, k), "fallback"
+
+        t_end = time.monotonic() + (self.deadline if deadline is None else deadline)
+        state: Dict = {}
+        primary = self._executor.submit(self._run_primary, query, k, state)
+        wait([primary], timeout=min(self.hedge_delay(), max(0.0, t_end - time.monotonic())))
+        if self._good(primary):
+            self._incr("primary_wins")
+            return primary.result(), "primary"
+
+        self._incr("hedges")
+        local = self._executor.submit(self.fallback, query, k)
+        pending = {primary, local}
+        while pending:
+            remaining = t_end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in (primary, local):
+                if fut in done and self._good(fut):
+                    self._incr("primary_wins" if fut is primary else "hedge_wins")
+                    return fut.result(), ("primary" if fut is primary else "fallback")
+        if pending:
+            if not primary.done():
+                state["timed_out"] = True
+                self.breaker.record_failure()
+            self._incr("deadline_exceeded")
+            logger.warning("Nenhum backend de recuperação respondeu dentro do prazo")
+        # resposta vazia de um backend saudável ainda é uma resposta válida
+        for fut in (local, primary):
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                return fut.result(), ("primary" if fut is primary else "fallback")
+        return [], None
+
+    async def retrieve_with_origin_async(self, query: str, k: int = 5,
+                                         deadline: Optional[float] = None) -> Tuple[List[Dict], Optional[str]]:
+        self._incr("requests")
+        if not self.breaker.allow():
+            self._incr("short_circuits")
+            return await self.fallback_async(query, k), "fallback"
+
+        t_end = time.monotonic() + (self.deadline if deadline is None else deadline)
+        state: Dict = {}
+        primary = asyncio.ensure_future(self._run_primary_async(query, k, state))
+        local: Optional[asyncio.Future] = None
+        hedge_won = False
+        try:
+            await asyncio.wait([primary], timeout=min(self.hedge_delay(), max(0.0, t_end - time.monotonic())))
+            if self._good(primary):
+                self._incr("primary_wins")
+                return primary.result(), "primary"
+
+            self._incr("hedges")
+            local = asyncio.ensure_future(self.fallback_async(query, k))
+            pending = {primary, local}
+            while pending:
+                remaining = t_end - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for fut in (primary, local):
+                    if fut in done and self._good(fut):
+                        self._incr("primary_wins" if fut is primary else "hedge_wins")
+                        hedge_won = fut is local
+                        return fut.result(), ("primary" if fut is primary else "fallback")
+            if pending:
+                if not primary.done():
+                    state["timed_out"] = True
+                    self.breaker.record_failure()
+                self._incr("deadline_exceeded")
+                logger.warning("Nenhum backend de recuperação respondeu dentro do prazo")
+            for fut in (local, primary):
+                if fut.done() and not fut.cancelled() and fut.exception() is None:
+                    hedge_won = fut is local
+                    return fut.result(), ("primary" if fut is primary else "fallback")
+            return [], None
+        finally:
+            if local is not None and not local.done():
+                local.cancel()
+            if not primary.done():
+                if hedge_won and not state.get("timed_out"):
+                    self._abandon_primary(primary, state, t_end)
+                else:
+                    primary.cancel()
+
+    def retrieve_many_with_origin(self, queries: Sequence[str], k: int = 5,
+                                  deadline: Optional[float] = None) -> List[Tuple[List[Dict], Optional[str]]]:
+        """Uma consulta em lote ao primário; o que falhar ou vier vazio vai, também em lote, ao índice local."""
+        queries = list(queries)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["batch_queries"] += len(queries)
+        out: List[Tuple[List[Dict], Optional[str]]] = [([], None)] * len(queries)
+        if not queries:
+            return out
+        results: Optional[List[List[Dict]]] = None
+        if not self.breaker.allow():
+            self._incr("short_circuits")
+        else:
+            t0 = time.monotonic()
+            fut = self._executor.submit(self.primary_many, queries, k)
+            try:
+                results = fut.result(timeout=self.deadline if deadline is None else deadline)
+                self.breaker.record_success()
+                # latência de um lote não representa a de uma pergunta: não entra na janela do hedge
+                logger.info("Lote de %d perguntas recuperado do primário em %.3fs", len(queries), time.monotonic() - t0)
+            except Exception as e:
+                fut.cancel()
+                logger.info("Recuperação primária em lote falhou: %s", e or type(e).__name__)
+                self._incr("primary_failures")
+                self.breaker.record_failure()
+        missing = list(range(len(queries)))
+        if results is not None:
+            for i, res in enumerate(results):
+                out[i] = (res, "primary")
+            missing = [i for i, res in enumerate(results) if not res]
+        if missing:
+            with self._lock:
+                self._stats["batch_fallbacks"] += len(missing)
+            local = self.fallback_many([queries[i] for i in missing], k)
+            for i, res in zip(missing, local):
+                if res or results is None:
+                    out[i] = (res, "fallback")
+        return out
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+        out["hedge_win_rate"] = out["hedge_wins"] / out["hedges"] if out["hedges"] else 0.0
+        out["hedge_delay"] = self.hedge_delay()
+        out["breaker"] = self.breaker.snapshot()
+        return out
+
+
+def from_env(primary: Retriever, fallback: Retriever, **kwargs) -> RetrievalCoordinator:
+    return RetrievalCoordinator(
+        primary,
+        fallback,
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get("FRAGAZ_BREAKER_FAILURES", "5")),
+            cooldown=float(os.environ.get("FRAGAZ_BREAKER_COOLDOWN", "30")),
+        ),
+        hedge_percentile=float(os.environ.get("FRAGAZ_HEDGE_PERCENTILE", "95")),
+        hedge_min_delay=float(os.environ.get("FRAGAZ_HEDGE_MIN_DELAY", "0.05")),
+        deadline=float(os.environ.get("FRAGAZ_RETRIEVAL_DEADLINE", "3")),
+        **kwargs,
+    )
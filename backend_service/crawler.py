@@ -0,0 +1,235 @@
+"""Crawler: ingestão concorrente de um espaço Confluence (ou de uma árvore de páginas).
+
+Descobre as páginas pela API REST do Confluence — todas as páginas de um
+espaço (`/rest/api/content?spaceKey=...`) ou a página raiz e seus filhos,
+recursivamente (`/rest/api/content/{id}/child/page`) — e busca o corpo de cada
+uma com um `httpx.AsyncClient` compartilhado (conexões reaproveitadas), com:
+
+- limite de requisições simultâneas por host (`FRAGAZ_CRAWL_CONCURRENCY`);
+- token bucket por host (`FRAGAZ_CRAWL_RATE` req/s, rajada `FRAGAZ_CRAWL_BURST`);
+- requisições condicionais (`If-None-Match` / `If-Modified-Since`): páginas que
+  responderem 304 são puladas sem download nem parse.
+
+Cada página baixada segue direto para o `sink` (por padrão chunking + upsert,
+ver `ingestion.py`) enquanto as demais continuam sendo buscadas. O ETag /
+Last-Modified só é gravado no manifesto depois que o sink terminou, então uma
+página que falhou é buscada de novo na próxima execução.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from .manifest import SourceManifest
+
+logger = logging.getLogger("fragaz.crawler")
+
+USER_AGENT = "FRAGAZ-Scraper/1.0"
+
+
+@dataclass
+class CrawledPage:
+    id: str
+    title: str
+    url: str
+    html: str
+
+
+Sink = Callable[[CrawledPage], Optional[Dict[str, Any]]]
+
+
+class TokenBucket:
+    """Limita a taxa média a `rate` req/s, permitindo rajadas de até `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ConfluenceCrawler:
+    def __init__(self, base_url: str, collection: str, manifest: SourceManifest, sink: Sink,
+                 auth: Optional[Tuple[str, str]] = None, per_host: int = 8, rate: float = 10.0, burst: int = 10,
+                 page_size: int = 50, max_pages: Optional[int] = None,
+                 progress: Optional[Callable[[float, str], None]] = None):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.collection = collection
+        self.manifest = manifest
+        self.sink = sink
+        self.auth = auth
+        self.per_host = max(1, per_host)
+        self.rate = rate
+        self.burst = burst
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.progress = progress
+        self._hosts: Dict[str, Tuple[asyncio.Semaphore, TokenBucket]] = {}
+        self.stats = {"discovered": 0, "fetched": 0, "not_modified": 0, "ingested": 0, "errors": 0, "requests": 0}
+
+    def _host_limits(self, url: str) -> Tuple[asyncio.Semaphore, TokenBucket]:
+        host = urlsplit(url).netloc
+        limits = self._hosts.get(host)
+        if limits is None:
+            limits = self._hosts[host] = (asyncio.Semaphore(self.per_host), TokenBucket(self.rate, self.burst))
+        return limits
+
+    async def _get(self, client, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None):
+        sem, bucket = self._host_limits(url)
+        async with sem:
+            await bucket.acquire()
+            self.stats["requests"] += 1
+            return await client.get(url, params=params, headers=headers)
+
+    def _api(self, path: str) -> str:
+        return urljoin(self.base_url, path.lstrip("/"))
+
+    async def _paged(self, client, path: str, params: Dict) -> AsyncIterator[Dict]:
+        start = 0
+        while True:
+            resp = await self._get(client, self._api(path), params={**params, "start": start, "limit": self.page_size})
+            resp.raise_for_status()
+            data = resp.json()
+            results = data.get("results") or []
+            for item in results:
+                yield item
+            if not results or not (data.get("_links") or {}).get("next"):
+                return
+            start += len(results)
+
+    async def discover(self, client, space_key: Optional[str] = None, root_page_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        if space_key:
+            async for item in self._paged(client, "rest/api/content", {"spaceKey": space_key, "type": "page"}):
+                yield item
+            return
+        pending = [str(root_page_id)]
+        seen = set()
+        yield {"id": str(root_page_id)}
+        while pending:
+            parent = pending.pop()
+            async for item in self._paged(client, f"rest/api/content/{parent}/child/page", {}):
+                cid = str(item.get("id"))
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                pending.append(cid)
+                yield item
+
+    def page_url(self, page_id: str) -> str:
+        return self._api(f"rest/api/content/{page_id}")
+
+    async def fetch(self, client, page_id: str) -> Optional[Tuple[CrawledPage, Optional[str], Optional[str]]]:
+        """Busca o corpo da página; devolve None se o servidor responder 304."""
+        url = self.page_url(page_id)
+        etag, last_modified = self.manifest.fetch_state(self.collection, url)
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        resp = await self._get(client, url, params={"expand": "body.storage"}, headers=headers)
+        if resp.status_code == 304:
+            return None
+        resp.raise_for_status()
+        data = resp.json()
+        html = ((data.get("body") or {}).get("storage") or {}).get("value") or ""
+        webui = (data.get("_links") or {}).get("webui")
+        source = urljoin(self.base_url, webui.lstrip("/")) if webui else url
+        page = CrawledPage(id=str(data.get("id") or page_id), title=data.get("title") or source, url=source, html=html)
+        return page, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+    async def _process(self, client, page_id: str) -> None:
+        try:
+            fetched = await self.fetch(client, page_id)
+            if fetched is None:
+                self.stats["not_modified"] += 1
+                return
+            self.stats["fetched"] += 1
+            page, etag, last_modified = fetched
+            await asyncio.to_thread(self.sink, page)
+            self.manifest.set_fetch_state(self.collection, self.page_url(page_id), etag, last_modified)
+            self.stats["ingested"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning("Falha ao processar página %s: %s", page_id, e)
+
+    def _report(self) -> None:
+        if self.progress is None:
+            return
+        done = self.stats["fetched"] + self.stats["not_modified"] + self.stats["errors"]
+        total = max(1, self.stats["discovered"])
+        self.progress(min(0.99, done / total), f"{done}/{self.stats['discovered']} páginas")
+
+    async def crawl(self, space_key: Optional[str] = None, root_page_id: Optional[str] = None, client=None) -> Dict:
+        if not space_key and not root_page_id:
+            raise ValueError("informe space_key ou root_page_id")
+        import httpx
+
+        own_client = client is None
+        if own_client:
+            client = httpx.AsyncClient(auth=self.auth, headers={"User-Agent": USER_AGENT}, timeout=30.0,
+                                       limits=httpx.Limits(max_connections=self.per_host * 2, max_keepalive_connections=self.per_host))
+        queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=self.per_host * 4)
+
+        stop: list = []  # exceção do callback de progresso (ex.: job cancelado) interrompe o crawl
+
+        async def worker():
+            while True:
+                page_id = await queue.get()
+                if page_id is None:
+                    return
+                if stop:
+                    continue
+                await self._process(client, page_id)
+                try:
+                    self._report()
+                except Exception as e:
+                    stop.append(e)
+
+        t0 = time.monotonic()
+        workers = [asyncio.create_task(worker()) for _ in range(self.per_host)]
+        try:
+            async for item in self.discover(client, space_key, root_page_id):
+                if stop or (self.max_pages is not None and self.stats["discovered"] >= self.max_pages):
+                    break
+                self.stats["discovered"] += 1
+                await queue.put(str(item["id"]))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+            if own_client:
+                await client.aclose()
+        if stop:
+            raise stop[0]
+        out = dict(self.stats, seconds=time.monotonic() - t0)
+        logger.info("Crawl de %s concluído: %s", space_key or root_page_id, out)
+        return out
+
+
+def from_env(base_url: str, collection: str, manifest: SourceManifest, sink: Sink, **kwargs) -> ConfluenceCrawler:
+    kwargs.setdefault("per_host", int(os.environ.get("FRAGAZ_CRAWL_CONCURRENCY", "8")))
+    kwargs.setdefault("rate", float(os.environ.get("FRAGAZ_CRAWL_RATE", "10")))
+    kwargs.setdefault("burst", int(os.environ.get("FRAGAZ_CRAWL_BURST", "10")))
+    return ConfluenceCrawler(base_url, collection, manifest, sink, **kwargs)
@@ -0,0 +1,236 @@
+"""Embedding cache: cache persistente de embeddings endereçado por conteúdo.
+
+A chave é sha256(modelo, versão do modelo, texto normalizado do chunk), então
+reingerir uma página que quase não mudou só recalcula os parágrafos novos. Os
+vetores ficam em um arquivo SQLite (WAL) como float32, com limite de tamanho:
+ao passar de `max_bytes`, as entradas menos usadas recentemente são removidas.
+O tamanho total fica numa linha de `embeddings_meta`, mantida por triggers
+(vale para todos os processos que usam o arquivo): cada gravação lê só essa
+linha, e a tabela só é percorrida quando o limite é ultrapassado.
+
+Configuração::
+
+    FRAGAZ_EMBED_CACHE=1
+    FRAGAZ_EMBED_CACHE_PATH=.fragaz_embeddings.sqlite
+    FRAGAZ_EMBED_CACHE_BYTES=536870912
+
+Uso::
+
+    python -m backend_service.embedding_cache compact [--path P] [--max-bytes N]
+    python -m backend_service.embedding_cache stats [--path P]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger("fragaz.embedding_cache")
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_PATH = ROOT / ".fragaz_embeddings.sqlite"
+
+_WS_RE = re.compile(r"\s+")
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    return _WS_RE.sub(" ", (text or "").strip())
+
+
+def cache_key(model: str, version: str, text: str) -> str:
+    h = hashlib.sha256()
+    for part in (model, version, normalize_text(text)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: Path, max_bytes: int = 512 * 1024 * 1024):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                dim INTEGER,
+                vector BLOB,
+                size INTEGER,
+                last_access REAL
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_access ON embeddings(last_access)")
+            conn.commit()
+            self._init_total(conn)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _init_total(conn: sqlite3.Connection) -> None:
+        # total corrente de `size`; a soma só é calculada uma vez, ao criar a linha (arquivos antigos)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings_meta (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO embeddings_meta (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM embeddings")
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS embeddings_total_insert AFTER INSERT ON embeddings
+            BEGIN UPDATE embeddings_meta SET total = total + new.size WHERE id = 0; END""")
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS embeddings_total_delete AFTER DELETE ON embeddings
+            BEGIN UPDATE embeddings_meta SET total = total - old.size WHERE id = 0; END""")
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS embeddings_total_update AFTER UPDATE OF size ON embeddings
+            BEGIN UPDATE embeddings_meta SET total = total + new.size - old.size WHERE id = 0; END""")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _total(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT total FROM embeddings_meta WHERE id = 0").fetchone()[0]
+
+    def _incr(self, key: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += value
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """Busca em lote; devolve apenas as chaves encontradas."""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        try:
+            conn = self._conn()
+            for i in range(0, len(unique), _SQL_BATCH):
+                part = unique[i:i + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                for key, vector in conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part):
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+                if found:
+                    conn.execute(f"UPDATE embeddings SET last_access = ? WHERE key IN ({marks})", [time.time(), *part])
+            conn.commit()
+        except sqlite3.Error as e:
+            self._incr("errors")
+            logger.warning("Falha ao ler cache de embeddings: %s", e)
+        hits = sum(1 for k in keys if k in found)
+        self._incr("hits", hits)
+        self._incr("misses", len(keys) - hits)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vec in items.items():
+            blob = np.asarray(vec, dtype=np.float32).tobytes()
+            rows.append((key, model, len(blob) // 4, blob, len(blob), now))
+        try:
+            conn = self._conn()
+            # upsert em vez de INSERT OR REPLACE: o REPLACE não dispara o trigger de DELETE
+            conn.executemany("INSERT INTO embeddings (key, model, dim, vector, size, last_access) VALUES (?, ?, ?, ?, ?, ?) "
+                             "ON CONFLICT(key) DO UPDATE SET model = excluded.model, dim = excluded.dim, "
+                             "vector = excluded.vector, size = excluded.size, last_access = excluded.last_access", rows)
+            conn.commit()
+            self._incr("stores", len(rows))
+            self._evict(conn)
+        except sqlite3.Error as e:
+            self._incr("errors")
+            logger.warning("Falha ao gravar cache de embeddings: %s", e)
+
+    def _evict(self, conn: sqlite3.Connection, max_bytes: Optional[int] = None) -> int:
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        total = self._total(conn)
+        if total <= limit:
+            return 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM embeddings ORDER BY last_access"):
+            if total <= limit:
+                break
+            victims.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        conn.commit()
+        self._incr("evictions", len(victims))
+        return len(victims)
+
+    def compact(self, max_bytes: Optional[int] = None) -> Dict:
+        """Aplica o limite de tamanho e devolve o espaço livre ao sistema (VACUUM)."""
+        conn = self._conn()
+        removed = self._evict(conn, max_bytes)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        return {"removed": removed, **self.stats()}
+
+    def clear(self) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM embeddings")
+        conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+        total = out["hits"] + out["misses"]
+        out["hit_rate"] = out["hits"] / total if total else 0.0
+        entries, size = 0, 0
+        # não cria o arquivo só para reportar métricas
+        if getattr(self._local, "conn", None) is not None or os.path.exists(self.path):
+            try:
+                conn = self._conn()
+                entries, size = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0], self._total(conn)
+            except sqlite3.Error:
+                entries, size = None, None
+        out.update(entries=entries, bytes=size, max_bytes=self.max_bytes, path=self.path)
+        return out
+
+
+def from_env() -> Optional[EmbeddingCache]:
+    if os.environ.get("FRAGAZ_EMBED_CACHE", "1") == "0":
+        return None
+    return EmbeddingCache(
+        Path(os.environ.get("FRAGAZ_EMBED_CACHE_PATH") or DEFAULT_PATH),
+        max_bytes=int(os.environ.get("FRAGAZ_EMBED_CACHE_BYTES", str(512 * 1024 * 1024))),
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend_service.embedding_cache")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    comp = sub.add_parser("compact", help="aplica o limite de tamanho e compacta o arquivo")
+    comp.add_argument("--path", default=None)
+    comp.add_argument("--max-bytes", type=int, default=None)
+    st = sub.add_parser("stats", help="mostra entradas e tamanho do cache")
+    st.add_argument("--path", default=None)
+    args = parser.parse_args(argv)
+
+    path = Path(args.path or os.environ.get("FRAGAZ_EMBED_CACHE_PATH") or DEFAULT_PATH)
+    cache = EmbeddingCache(path, max_bytes=int(os.environ.get("FRAGAZ_EMBED_CACHE_BYTES", str(512 * 1024 * 1024))))
+    if args.cmd == "compact":
+        out = cache.compact(args.max_bytes)
+        print(f"{out['removed']} entradas removidas; {out['entries']} entradas, {out['bytes']} bytes em {path}")
+    else:
+        out = cache.stats()
+        print(f"{out['entries']} entradas, {out['bytes']} bytes em {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,277 @@
+"""Embeddings: registro de modelos de embedding compartilhado pelo processo.
+
+Cada modelo é carregado uma única vez, numa thread própria (no startup, com
+`FRAGAZ_EMBED_WARMUP=1`, ou no primeiro uso; quem chega antes espera o mesmo
+carregamento), e codifica os textos em lotes de `FRAGAZ_EMBED_BATCH` em
+executores dedicados, para não prender o event loop nem as threads das
+requisições. São duas filas: `BULK` (ingestão, `FRAGAZ_EMBED_WORKERS`) e
+`QUERY` (perguntas, `FRAGAZ_EMBED_QUERY_WORKERS`), para que uma pergunta não
+espere atrás dos lotes de um job de ingestão. Sem `sentence-transformers` (ou
+se o modelo falhar) cai no embedding determinístico `services._embed_text`.
+
+Com o cache de `embedding_cache.py`, só os chunks que não estão no cache vão
+para o modelo.
+
+Configuração::
+
+    FRAGAZ_EMBED_MODEL=all-MiniLM-L6-v2
+    FRAGAZ_EMBED_MODEL_VERSION=1
+    FRAGAZ_EMBED_DEVICE=cpu
+    FRAGAZ_EMBED_BATCH=32
+    FRAGAZ_EMBED_WORKERS=1
+    FRAGAZ_EMBED_QUERY_WORKERS=1
+    FRAGAZ_EMBED_WARMUP=0
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import embedding_cache
+from .embedding_cache import EmbeddingCache
+
+logger = logging.getLogger("fragaz.embeddings")
+
+FALLBACK_DIM = 128
+BULK, QUERY = "bulk", "query"
+
+Loader = Callable[[str, str], Any]
+
+
+def _load_sentence_transformer(name: str, device: str):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(name, device=device)
+
+
+def fallback_encode(texts: Sequence[str]) -> List[List[float]]:
+    from .services import _embed_text
+
+    return [_embed_text(t, dim=FALLBACK_DIM) for t in texts]
+
+
+class EmbeddingService:
+    def __init__(self, model_name: str, device: str = "cpu", batch_size: int = 32, workers: int = 1,
+                 loader: Optional[Loader] = None, cache: Optional[EmbeddingCache] = None, version: str = "1",
+                 query_workers: int = 1):
+        self.model_name = model_name
+        self.version = version
+        self.cache = cache
+        self.device = device
+        self.batch_size = max(1, batch_size)
+        self._loader = loader or _load_sentence_transformer
+        self._model = None
+        self._load_failed = False
+        self._load_lock = threading.Lock()
+        self._load_future: Optional[Future] = None
+        self._executors = {
+            BULK: ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="fragaz-embed"),
+            QUERY: ThreadPoolExecutor(max_workers=max(1, query_workers), thread_name_prefix="fragaz-embed-query"),
+        }
+        self._lock = threading.Lock()
+        self._batch_latency: deque = deque(maxlen=256)
+        self._stats = {"batches": 0, "query_batches": 0, "chunks": 0, "encode_seconds": 0.0, "fallback_chunks": 0,
+                       "load_seconds": 0.0, "load_failures": 0}
+
+    @property
+    def backend(self) -> str:
+        if self._model is not None:
+            return "model"
+        return "fallback" if self._load_failed else "unloaded"
+
+    def _load(self, future: Future) -> None:
+        t0 = time.monotonic()
+        try:
+            self._model = self._loader(self.model_name, self.device)
+            logger.info("Modelo de embedding carregado: %s (%.1fs)", self.model_name, time.monotonic() - t0)
+        except Exception as e:
+            self._load_failed = True
+            self._stats["load_failures"] += 1
+            logger.warning("Modelo de embedding %s indisponível (%s) — usando embedding determinístico", self.model_name, e)
+        self._stats["load_seconds"] = time.monotonic() - t0
+        future.set_result(self._model)
+
+    def load(self) -> Future:
+        """Dispara o carregamento (uma vez, em thread própria) e devolve o future com o modelo ou None."""
+        with self._load_lock:
+            if self._load_future is None:
+                self._load_future = Future()
+                threading.Thread(target=self._load, args=(self._load_future,), name="fragaz-embed-load",
+                                 daemon=True).start()
+            return self._load_future
+
+    def model(self):
+        """Modelo carregado (espera o carregamento em andamento); None se ele não estiver disponível."""
+        if self._model is not None or self._load_failed:
+            return self._model
+        return self.load().result()
+
+    def warmup(self) -> Future:
+        """Carrega o modelo em background sem bloquear quem chama."""
+        return self.load()
+
+    def _encode_batch(self, batch: Sequence[str], lane: str = BULK) -> Tuple[List[List[float]], bool]:
+        model = self.model()
+        t0 = time.monotonic()
+        vectors = None
+        if model is not None:
+            try:
+                vectors = [list(map(float, v)) for v in model.encode(list(batch), batch_size=len(batch))]
+            except Exception as e:
+                logger.warning("Falha ao codificar lote com %s: %s", self.model_name, e)
+        fallback = vectors is None
+        if fallback:
+            vectors = fallback_encode(batch)
+        elapsed = time.monotonic() - t0
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["query_batches"] += int(lane == QUERY)
+            self._stats["chunks"] += len(batch)
+            self._stats["encode_seconds"] += elapsed
+            if fallback:
+                self._stats["fallback_chunks"] += len(batch)
+            self._batch_latency.append(elapsed)
+        return vectors, fallback
+
+    def submit(self, texts: Sequence[str], lane: str = BULK) -> List[Future]:
+        texts = list(texts)
+        executor = self._executors[lane]
+        return [executor.submit(self._encode_batch, texts[i:i + self.batch_size], lane)
+                for i in range(0, len(texts), self.batch_size)]
+
+    def _combine(self, texts: Sequence[str], results) -> Tuple[List[List[float]], bool]:
+        out: List[List[float]] = []
+        any_fallback = False
+        for vectors, fallback in results:
+            out.extend(vectors)
+            any_fallback = any_fallback or fallback
+        # um lote que caiu no fallback teria outra dimensão: refaz tudo no fallback
+        if len({len(v) for v in out}) > 1:
+            logger.warning("Lotes com dimensões diferentes — recodificando com embedding determinístico")
+            return fallback_encode(texts), True
+        return out, any_fallback
+
+    def _encode_model(self, texts: Sequence[str], lane: str = BULK) -> Tuple[List[List[float]], bool]:
+        return self._combine(texts, [fut.result() for fut in self.submit(texts, lane)])
+
+    def _cache_plan(self, texts: Sequence[str]) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+        keys = [embedding_cache.cache_key(self.model_name, self.version, t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        return keys, found, missing
+
+    def _cache_store(self, found: Dict[str, List[float]], missing: Dict[str, str],
+                     encoded: Tuple[List[List[float]], bool]) -> None:
+        vectors, fallback = encoded
+        fresh = dict(zip(missing.keys(), vectors))
+        if not fallback:
+            self.cache.put_many(self.model_name, fresh)
+        found.update(fresh)
+
+    def encode(self, texts: Sequence[str], use_cache: bool = True, lane: str = BULK) -> List[List[float]]:
+        """Vetores dos textos; perguntas usam `lane=QUERY` para não esperar atrás da ingestão."""
+        texts = list(texts)
+        if self.cache is None or not use_cache or not texts or self.model() is None:
+            return self._encode_model(texts, lane)[0]
+        keys, found, missing = self._cache_plan(texts)
+        if missing:
+            self._cache_store(found, missing, self._encode_model(list(missing.values()), lane))
+        return [found[k] for k in keys]
+
+    async def encode_async(self, texts: Sequence[str], use_cache: bool = True, lane: str = QUERY) -> List[List[float]]:
+        """Como `encode`, esperando os futures do executor da fila sem ocupar outra thread."""
+        texts = list(texts)
+        model = await asyncio.wrap_future(self.load())
+
+        async def encode_model(batch: List[str]) -> Tuple[List[List[float]], bool]:
+            results = await asyncio.gather(*(asyncio.wrap_future(f) for f in self.submit(batch, lane)))
+            return self._combine(batch, results)
+
+        if self.cache is None or not use_cache or not texts or model is None:
+            return (await encode_model(texts))[0]
+        executor = self._executors[lane]
+        loop = asyncio.get_running_loop()
+        keys, found, missing = await loop.run_in_executor(executor, self._cache_plan, texts)
+        if missing:
+            encoded = await encode_model(list(missing.values()))
+            await loop.run_in_executor(executor, self._cache_store, found, missing, encoded)
+        return [found[k] for k in keys]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+            latencies = sorted(self._batch_latency)
+        out["model"] = self.model_name
+        out["version"] = self.version
+        out["backend"] = self.backend
+        out["batch_size"] = self.batch_size
+        out["chunks_per_sec"] = out["chunks"] / out["encode_seconds"] if out["encode_seconds"] else 0.0
+        out["batch_latency_avg"] = sum(latencies) / len(latencies) if latencies else 0.0
+        out["batch_latency_p95"] = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+        out["cache"] = self.cache.stats() if self.cache is not None else None
+        return out
+
+    def close(self) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
+
+
+_services: Dict[str, EmbeddingService] = {}
+_services_lock = threading.Lock()
+
+
+def default_model_name() -> str:
+    return os.environ.get("FRAGAZ_EMBED_MODEL", "all-MiniLM-L6-v2")
+
+
+def get_embedding_service(model_name: Optional[str] = None) -> EmbeddingService:
+    name = model_name or default_model_name()
+    service = _services.get(name)
+    if service is None:
+        with _services_lock:
+            service = _services.get(name)
+            if service is None:
+                service = EmbeddingService(
+                    name,
+                    device=os.environ.get("FRAGAZ_EMBED_DEVICE", "cpu"),
+                    batch_size=int(os.environ.get("FRAGAZ_EMBED_BATCH", "32")),
+                    workers=int(os.environ.get("FRAGAZ_EMBED_WORKERS", "1")),
+                    query_workers=int(os.environ.get("FRAGAZ_EMBED_QUERY_WORKERS", "1")),
+                    cache=embedding_cache.from_env(),
+                    version=os.environ.get("FRAGAZ_EMBED_MODEL_VERSION", "1"),
+                )
+                _services[name] = service
+    return service
+
+
+def register_embedding_service(service: EmbeddingService) -> None:
+    with _services_lock:
+        old = _services.get(service.model_name)
+        _services[service.model_name] = service
+    if old is not None and old is not service:
+        old.close()
+
+
+def reset_embedding_services() -> None:
+    with _services_lock:
+        services = list(_services.values())
+        _services.clear()
+    for service in services:
+        service.close()
+
+
+def warmup_enabled() -> bool:
+    return os.environ.get("FRAGAZ_EMBED_WARMUP", "0") == "1"
+
+
+def stats() -> Dict:
+    return {name: service.stats() for name, service in list(_services.items())}
@@ -0,0 +1,236 @@
+"""Extractive: resposta extrativa para quando não há LLM.
+
+Usada no fallback da geração (provedor desligado, fora do ar, lotado ou
+cortado por custo). As fontes recuperadas são quebradas em frases e cada frase
+recebe um score contra a pergunta, calculado para todas de uma vez:
+
+- léxico: cobertura dos termos da pergunta (tokenização de `lexical.py`),
+  ponderada pelo IDF dos termos entre as frases candidatas;
+- semântico: cosseno entre a pergunta e a frase, com o modelo de embedding se
+  ele já estiver carregado (`FRAGAZ_EXTRACTIVE_DENSE=1`, na fila de perguntas
+  do serviço; frases repetidas saem de um LRU em memória de
+  `FRAGAZ_EXTRACTIVE_VECTORS` vetores, fora do cache persistente dos chunks)
+  ou com os vetores de termos de `scores.py`;
+- um peso pequeno para o score de recuperação da fonte.
+
+As melhores frases (sem quase-duplicatas e com pelo menos metade do score da
+melhor) formam a resposta, na ordem em que aparecem nas fontes e com a citação
+`[n]` da fonte; cada frase usada vira um destaque com os offsets em `content`
+da fonte, para o cliente marcar o trecho.
+
+Configuração::
+
+    FRAGAZ_FALLBACK=extractive        # extractive | snippets
+    FRAGAZ_EXTRACTIVE_SENTENCES=3
+    FRAGAZ_EXTRACTIVE_CHARS=600
+    FRAGAZ_EXTRACTIVE_LEXICAL=0.6
+    FRAGAZ_EXTRACTIVE_DENSE=1
+    FRAGAZ_EXTRACTIVE_VECTORS=4096
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import scores
+from .chunking import sentence_spans
+from .lexical import tokenize
+
+logger = logging.getLogger("fragaz.extractive")
+
+MIN_WORDS = 4
+
+
+@dataclass
+class Highlight:
+    source: int  # posição da fonte na lista recuperada
+    id: Optional[str]
+    start: int
+    end: int
+    score: float
+    text: str
+
+    def public(self) -> Dict:
+        return {"source": self.source, "id": self.id, "start": self.start, "end": self.end, "score": round(self.score, 4)}
+
+
+@dataclass
+class Extract:
+    text: str
+    highlights: List[Highlight] = field(default_factory=list)
+    dense: bool = False
+
+
+def _label(source: Dict) -> str:
+    return str(source.get("title") or source.get("source") or source.get("id") or "")
+
+
+def _lexical_scores(query: str, texts: Sequence[str]) -> np.ndarray:
+    q_terms = {t: j for j, t in enumerate(dict.fromkeys(tokenize(query)))}
+    presence = np.zeros((len(texts), len(q_terms)), dtype=np.float32)
+    if not q_terms:
+        return presence.sum(axis=1)
+    for i, text in enumerate(texts):
+        cols = [q_terms[t] for t in set(tokenize(text)) if t in q_terms]
+        presence[i, cols] = 1.0
+    idf = np.log1p(len(texts) / (1.0 + presence.sum(axis=0)))
+    return presence @ idf / idf.sum()
+
+
+class ExtractiveAnswerer:
+    def __init__(self, max_sentences: int = 3, max_chars: int = 600, lexical_weight: float = 0.6,
+                 redundancy: float = 0.8, dense: bool = True, min_relative: float = 0.5, vector_cache: int = 4096):
+        self.max_sentences = max(1, max_sentences)
+        self.min_relative = min_relative
+        self.max_chars = max(80, max_chars)
+        self.lexical_weight = lexical_weight
+        self.redundancy = redundancy
+        self.dense = dense
+        self.vector_cache = max(0, vector_cache)
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"answers": 0, "dense": 0, "sentences_scored": 0, "vector_hits": 0, "seconds": 0.0}
+
+    def _dense_model(self):
+        if not self.dense:
+            return None
+        from .embeddings import get_embedding_service
+
+        service = get_embedding_service()
+        # carregar o modelo aqui custaria segundos: só usa se já estiver pronto
+        return service if service.backend == "model" else None
+
+    def _dense_vectors(self, service, query: str, texts: Sequence[str]) -> np.ndarray:
+        """Vetores normalizados da pergunta e das frases; frases já vistas saem do LRU."""
+        from .embeddings import QUERY
+
+        with self._lock:
+            known = {t: self._vectors[t] for t in texts if t in self._vectors}
+            for t in known:
+                self._vectors.move_to_end(t)
+            self._stats["vector_hits"] += len(known)
+        missing = list(dict.fromkeys(t for t in texts if t not in known))
+        # o cache persistente é dos chunks da ingestão: frases e perguntas ficam fora dele
+        raw = np.asarray(service.encode([query, *missing], use_cache=False, lane=QUERY), dtype=np.float32)
+        norms = np.linalg.norm(raw, axis=1, keepdims=True)
+        raw = np.divide(raw, norms, out=np.zeros_like(raw), where=norms > 0)
+        fresh = dict(zip(missing, raw[1:]))
+        if self.vector_cache:
+            with self._lock:
+                self._vectors.update(fresh)
+                while len(self._vectors) > self.vector_cache:
+                    self._vectors.popitem(last=False)
+        known.update(fresh)
+        return np.vstack([raw[:1], *(known[t][None, :] for t in texts)])
+
+    def _semantic(self, query: str, texts: Sequence[str], term_vecs: np.ndarray) -> Tuple[np.ndarray, bool]:
+        service = self._dense_model()
+        if service is not None:
+            try:
+                vecs = self._dense_vectors(service, query, texts)
+                return np.clip(vecs[1:] @ vecs[0], 0.0, 1.0), True
+            except Exception as e:
+                logger.warning("Embedding indisponível na resposta extrativa, usando vetores de termos: %s", e)
+        return np.clip(term_vecs[1:] @ term_vecs[0], 0.0, 1.0), False
+
+    def answer(self, query: str, sources: Sequence[Dict]) -> Extract:
+        t0 = time.perf_counter()
+        candidates: List[Tuple[int, int, int]] = []  # (fonte, início, fim)
+        texts: List[str] = []
+        for i, src in enumerate(sources):
+            content = src.get("content") or ""
+            for start, end in sentence_spans(content):
+                candidates.append((i, start, end))
+                texts.append(content[start:end])
+        if not texts:
+            return Extract("")
+
+        term_vecs = scores.hashed_vectors([query, *texts])
+        lexical = _lexical_scores(query, texts)
+        semantic, dense = self._semantic(query, texts, term_vecs)
+        prior = np.array([float(sources[i].get("score") or 0.0) for i, _, _ in candidates], dtype=np.float32)
+        final = 0.9 * (self.lexical_weight * lexical + (1 - self.lexical_weight) * semantic) + 0.1 * np.clip(prior, 0.0, 1.0)
+        short = np.array([len(t.split()) < MIN_WORDS for t in texts])
+        final = np.where(short, 0.5 * final, final)
+
+        chosen: List[int] = []
+        used = 0
+        order = np.argsort(-final, kind="stable")
+        # frases bem abaixo da melhor só encheriam a resposta
+        floor = self.min_relative * float(final[order[0]])
+        for idx in order:
+            if len(chosen) >= self.max_sentences or (chosen and final[idx] < floor):
+                break
+            if chosen and float(np.max(term_vecs[1 + np.array(chosen)] @ term_vecs[1 + idx])) >= self.redundancy:
+                continue
+            if chosen and used + len(texts[idx]) > self.max_chars:
+                continue
+            chosen.append(int(idx))
+            used += len(texts[idx])
+
+        highlights = []
+        for idx in sorted(chosen, key=lambda j: candidates[j]):
+            i, start, end = candidates[idx]
+            text = texts[idx]
+            if len(text) > self.max_chars:
+                cut = text.rfind(" ", 0, self.max_chars)
+                text = text[:cut if cut > 0 else self.max_chars]
+                end = start + len(text)
+                text += "…"
+            highlights.append(Highlight(i, sources[i].get("id"), start, end, float(final[idx]), text))
+        cited = sorted({h.source for h in highlights})
+        body = " ".join(f"{h.text} [{h.source + 1}]" for h in highlights)
+        refs = "; ".join(f"[{i + 1}] {_label(sources[i])}" for i in cited)
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            self._stats["answers"] += 1
+            self._stats["dense"] += int(dense)
+            self._stats["sentences_scored"] += len(texts)
+            self._stats["seconds"] += elapsed
+        return Extract(f"{body}\n\nFontes: {refs}", highlights, dense)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+        out["avg_ms"] = 1000 * out["seconds"] / out["answers"] if out["answers"] else 0.0
+        return out
+
+
+def fallback_mode() -> str:
+    return os.environ.get("FRAGAZ_FALLBACK", "extractive").strip().lower()
+
+
+def from_env() -> ExtractiveAnswerer:
+    return ExtractiveAnswerer(
+        max_sentences=int(os.environ.get("FRAGAZ_EXTRACTIVE_SENTENCES", "3")),
+        max_chars=int(os.environ.get("FRAGAZ_EXTRACTIVE_CHARS", "600")),
+        lexical_weight=float(os.environ.get("FRAGAZ_EXTRACTIVE_LEXICAL", "0.6")),
+        dense=os.environ.get("FRAGAZ_EXTRACTIVE_DENSE", "1") != "0",
+        vector_cache=int(os.environ.get("FRAGAZ_EXTRACTIVE_VECTORS", "4096")),
+    )
+
+
+_answerer: Optional[ExtractiveAnswerer] = None
+
+
+def get_answerer() -> ExtractiveAnswerer:
+    global _answerer
+    if _answerer is None:
+        _answerer = from_env()
+    return _answerer
+
+
+def reset_answerer(answerer: Optional[ExtractiveAnswerer] = None) -> None:
+    global _answerer
+    _answerer = answerer
+
+
+def stats() -> Optional[Dict]:
+    return _answerer.stats() if _answerer is not None else None
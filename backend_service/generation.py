@@ -0,0 +1,290 @@
+"""Generation: geração da resposta final a partir das fontes recuperadas.
+
+Usa o provedor de LLM configurado (`llm.py`: Gemini quando há chave e
+`ENABLE_GENAI` não é "0", ou o stub local); sem provedor devolve um fallback
+com os trechos mais relevantes. Respostas do LLM passam pelo cache semântico
+de `answer_cache.py`, com a pergunta codificada pelo modelo de `embeddings.py`
+(fila `QUERY`); sem o modelo, o cache só reaproveita a mesma pergunta.
+
+`generate_answer_async` é a versão usada por `/query`: chama o LLM pela API
+assíncrona do provedor e roda as etapas de CPU (embedding da
+pergunta, busca no cache) em threads, sem bloquear o event loop.
+`stream_answer` entrega a mesma resposta em pedaços, conforme o LLM gera
+(`/query/stream`); o fallback e as respostas do cache saem pelo mesmo caminho.
+Se o provedor falhar depois de já ter mandado tokens, o stream termina com
+`StreamInterrupted` (o controller manda `error`, não `done`).
+
+Sem LLM, o fallback é a resposta extrativa de `extractive.py` (as frases das
+fontes mais relevantes para a pergunta, com offsets para destaque), ou os
+trechos crus das fontes com `FRAGAZ_FALLBACK=snippets`.
+
+Toda chamada ao provedor passa pelo limite de concorrência de
+`llm_limits.py`; se não houver vaga a tempo, a resposta cai no fallback.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+
+from . import answer_cache, context_packer, extractive, llm, llm_limits
+from .answer_cache import AnswerCache
+from .llm_limits import LLMBusy
+from .result_cache import normalize_query
+
+logger = logging.getLogger("fragaz.generation")
+
+NO_CONTEXT_ANSWER = "Não foi possível recuperar contexto relevante para responder à pergunta."
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_ready = False
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    global _answer_cache, _answer_cache_ready
+    if not _answer_cache_ready:
+        _answer_cache = answer_cache.from_env()
+        _answer_cache_ready = True
+    return _answer_cache
+
+
+def reset_answer_cache(cache: Optional[AnswerCache] = None) -> None:
+    global _answer_cache, _answer_cache_ready
+    _answer_cache, _answer_cache_ready = cache, cache is not None
+
+
+def embed_query(query: str) -> List[float]:
+    from .embeddings import QUERY, get_embedding_service
+
+    return get_embedding_service().encode([normalize_query(query)], use_cache=False, lane=QUERY)[0]
+
+
+def semantic_embeddings() -> bool:
+    """Se `embed_query` usa o modelo; no fallback (hash) a similaridade não é semântica."""
+    from .embeddings import get_embedding_service
+
+    return get_embedding_service().backend == "model"
+
+
+def _lookup(cache: AnswerCache, qv, sources: List[Dict]) -> Optional[str]:
+    return cache.lookup(qv, sources, exact=not semantic_embeddings())
+
+
+def build_prompt(query: str, sources: List[Dict]) -> str:
+    """Prompt com o contexto montado por `context_packer` (orçamento de tokens, MMR, sem duplicatas)."""
+    packing = context_packer.get_packer().pack(query, sources)
+    logger.info("Contexto: %d passagens, %d/%d tokens (entrada %d), %d chunks juntados, %d frases duplicadas, descartados %s",
+                len(packing.passages), packing.tokens, packing.budget, packing.input_tokens, packing.merged,
+                packing.duplicates_removed, packing.dropped)
+    ctx = "\n\n---\n\n".join(f"[{i}] {p.label()}\n{p.text}" for i, p in enumerate(packing.passages, 1))
+    return f"Contexto:\n{ctx}\n\nPergunta: {query}\n\nResponda de forma objetiva e fundamente suas afirmações citando as fontes ([1], [2]...) quando possível."  # noqa: E501
+
+
+def llm_enabled() -> bool:
+    return llm.enabled()
+
+
+def _flight_key(query: str, sources: List[Dict], model_name: str):
+    return (model_name, normalize_query(query), answer_cache.source_signature(sources))
+
+
+def generate_llm(query: str, sources: List[Dict]) -> Optional[str]:
+    """Chama o LLM; devolve None se ele não estiver configurado, estiver lotado ou falhar.
+
+    Chamadas idênticas em andamento são coalescidas e o total de chamadas
+    simultâneas é limitado (ver `llm_limits.py`).
+    """
+    if not llm_enabled():
+        return None
+
+    def call() -> str:
+        client = llm.get_client()
+        with llm_limits.get_limiter().slot(client.model):
+            return client.generate(build_prompt(query, sources))
+
+    try:
+        return llm_limits.get_single_flight().do(_flight_key(query, sources, llm.model_name()), call)
+    except LLMBusy as e:
+        logger.warning("%s; usando fallback de contexto", e)
+        return None
+    except Exception:
+        logger.exception("Chamada ao LLM falhou, usando fallback de contexto")
+        return None
+
+
+async def generate_llm_async(query: str, sources: List[Dict]) -> Optional[str]:
+    """Como `generate_llm`, sem ocupar thread enquanto espera o provedor."""
+    if not llm_enabled():
+        return None
+
+    async def call() -> str:
+        client = llm.get_client()
+        async with llm_limits.get_limiter().slot_async(client.model):
+            return await client.generate_async(build_prompt(query, sources))
+
+    try:
+        return await llm_limits.get_single_flight().do_async(_flight_key(query, sources, llm.model_name()), call)
+    except asyncio.CancelledError:
+        raise
+    except LLMBusy as e:
+        logger.warning("%s; usando fallback de contexto", e)
+        return None
+    except Exception:
+        logger.exception("Chamada ao LLM falhou, usando fallback de contexto")
+        return None
+
+
+@dataclass
+class Answer:
+    text: str
+    mode: str  # "llm", "cache", "extractive", "snippets" ou "empty"
+    highlights: List[Dict] = field(default_factory=list)
+
+
+def snippets_answer(query: str, sources: List[Dict]) -> str:
+    snippets = "\n\n---\n\n".join([f"Fonte: {s.get('source') or s.get('title') or s.get('id')}\n{(s.get('content') or '')[:1000]}" for s in sources[:3]])
+    return f"(Fallback) Não foi possível gerar via LLM. Trechos relevantes:\n\n{snippets}\n\nPergunta: {query}"
+
+
+def fallback(query: str, sources: List[Dict]) -> Answer:
+    """Resposta sem LLM: extrativa (padrão) ou os trechos das fontes."""
+    if extractive.fallback_mode() != "snippets":
+        try:
+            ex = extractive.get_answerer().answer(query, sources)
+            if ex.highlights:
+                return Answer(ex.text, "extractive", [h.public() for h in ex.highlights])
+        except Exception:
+            logger.exception("Resposta extrativa falhou, usando os trechos das fontes")
+    return Answer(snippets_answer(query, sources), "snippets")
+
+
+def fallback_answer(query: str, sources: List[Dict]) -> str:
+    return fallback(query, sources).text
+
+
+def generate_answer_from_context(query: str, sources: List[Dict]) -> str:
+    """Tenta gerar resposta com genai (com cache semântico); senão fallback concatenação."""
+    if not sources:
+        return NO_CONTEXT_ANSWER
+
+    cache = get_answer_cache() if llm_enabled() else None
+    qv = None
+    if cache is not None:
+        qv = embed_query(query)
+        cached = _lookup(cache, qv, sources)
+        if cached is not None:
+            logger.info("Resposta servida do cache semântico")
+            return cached
+
+    t0 = time.monotonic()
+    answer = generate_llm(query, sources)
+    if answer is None:
+        return fallback_answer(query, sources)
+    if cache is not None:
+        cache.store(qv, sources, answer, cost=time.monotonic() - t0)
+    return answer
+
+
+async def answer_async(query: str, sources: List[Dict]) -> Answer:
+    """Versão assíncrona de `generate_answer_from_context`, dizendo de onde veio a resposta."""
+    if not sources:
+        return Answer(NO_CONTEXT_ANSWER, "empty")
+
+    cache = get_answer_cache() if llm_enabled() else None
+    qv = None
+    if cache is not None:
+        qv = await asyncio.to_thread(embed_query, query)
+        cached = await asyncio.to_thread(_lookup, cache, qv, sources)
+        if cached is not None:
+            logger.info("Resposta servida do cache semântico")
+            return Answer(cached, "cache")
+
+    t0 = time.monotonic()
+    answer = await generate_llm_async(query, sources)
+    if answer is None:
+        return await asyncio.to_thread(fallback, query, sources)
+    if cache is not None:
+        cache.store(qv, sources, answer, cost=time.monotonic() - t0)
+    return Answer(answer, "llm")
+
+
+async def generate_answer_async(query: str, sources: List[Dict]) -> str:
+    return (await answer_async(query, sources)).text
+
+
+def _pieces(text: str, size: int = 64) -> List[str]:
+    # respostas prontas (cache, fallback) saem em pedaços de ~`size` chars, quebrando em espaço
+    out, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            cut = text.rfind(" ", start, end)
+            end = cut + 1 if cut > start else end
+        out.append(text[start:end])
+        start = end
+    return out
+
+
+class StreamInterrupted(RuntimeError):
+    """O LLM falhou no meio do stream, depois de já ter entregado parte da resposta."""
+
+
+async def _stream_llm(query: str, sources: List[Dict]) -> AsyncIterator[str]:
+    # streams não são coalescidos (cada cliente consome o seu), só limitados
+    client = llm.get_client()
+    async with llm_limits.get_limiter().slot_async(client.model):
+        async for piece in client.stream_async(build_prompt(query, sources)):
+            yield piece
+
+
+async def stream_answer(query: str, sources: List[Dict], meta: Optional[Dict] = None) -> AsyncIterator[str]:
+    """Pedaços da resposta de `generate_answer_async`, na ordem em que ficam prontos.
+
+    Se `meta` for passado, recebe `mode` e `highlights` da resposta (ver `Answer`).
+    """
+    meta = {} if meta is None else meta
+    meta.update(mode="empty", highlights=[])
+    if not sources:
+        yield NO_CONTEXT_ANSWER
+        return
+
+    cache = get_answer_cache() if llm_enabled() else None
+    qv = None
+    if cache is not None:
+        qv = await asyncio.to_thread(embed_query, query)
+        cached = await asyncio.to_thread(_lookup, cache, qv, sources)
+        if cached is not None:
+            logger.info("Resposta servida do cache semântico")
+            meta["mode"] = "cache"
+            for piece in _pieces(cached):
+                yield piece
+            return
+
+    parts: List[str] = []
+    if llm_enabled():
+        t0 = time.monotonic()
+        try:
+            async for piece in _stream_llm(query, sources):
+                parts.append(piece)
+                yield piece
+        except asyncio.CancelledError:
+            raise
+        except LLMBusy as e:
+            logger.warning("%s; usando fallback de contexto", e)
+        except Exception as e:
+            if parts:
+                # o cliente já recebeu parte da resposta: não dá para trocar pelo fallback nem fingir que terminou
+                meta["mode"] = "llm"
+                raise StreamInterrupted(f"resposta do LLM interrompida após {len(parts)} pedaços: {e}") from e
+            logger.exception("Streaming do LLM falhou, usando fallback de contexto")
+        if parts:
+            meta["mode"] = "llm"
+            if cache is not None:
+                cache.store(qv, sources, "".join(parts).strip(), cost=time.monotonic() - t0)
+            return
+    answer = await asyncio.to_thread(fallback, query, sources)
+    meta.update(mode=answer.mode, highlights=answer.highlights)
+    for piece in _pieces(answer.text):
+        yield piece
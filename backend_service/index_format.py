@@ -0,0 +1,175 @@
+"""Formato binário do índice local (`.fragaz_index.bin`).
+
+Layout (little-endian, blocos alinhados em 64 bytes)::
+
+    header   128 bytes  magic, versão, dtype, count, dim, n_fields e offsets
+    emb      count*dim  embeddings normalizados (float32 ou float16)
+    norms    count      normas originais (float32)
+    offsets  n_fields*(count+1) int64 — offsets de cada campo dentro do blob
+    blob     UTF-8      id/title/content/source concatenados
+
+O leitor usa `mmap` somente leitura e devolve views NumPy sobre o arquivo, sem
+cópia; vários workers na mesma máquina compartilham o page cache. A escrita é
+sempre feita em arquivo temporário + `os.replace`, para que leitores com o
+arquivo antigo mapeado não sejam afetados.
+
+Uso::
+
+    python -m backend_service.index_format convert .fragaz_index.json .fragaz_index.bin [--float16]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .local_index import TEXT_FIELDS, IndexSnapshot, StringColumn
+
+MAGIC = b"FRGZIDX\x00"
+VERSION = 1
+HEADER_SIZE = 128
+ALIGN = 64
+_HEADER = struct.Struct("<8sIIQIIQQQQQ")
+_DTYPES = {0: np.float32, 1: np.float16}
+_DTYPE_CODES = {np.dtype(np.float32): 0, np.dtype(np.float16): 1}
+
+
+class IndexFormatError(ValueError):
+    pass
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def is_binary_index(path: Path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_index(path: Path, snapshot: IndexSnapshot, dtype=np.float32) -> Path:
+    """Grava `snapshot` no formato binário de forma atômica."""
+    path = Path(path)
+    dtype = np.dtype(dtype)
+    if dtype not in _DTYPE_CODES:
+        raise IndexFormatError(f"dtype não suportado: {dtype}")
+    count, dim = len(snapshot), snapshot.dim
+
+    blob_parts: List[bytes] = []
+    offsets = np.zeros((len(TEXT_FIELDS), count + 1), dtype=np.int64)
+    base = 0
+    for fi, field in enumerate(TEXT_FIELDS):
+        col = snapshot.columns[field]
+        raw = bytes(col.blob[int(col.offsets[0]):int(col.offsets[-1])]) if count else b""
+        offsets[fi] = col.offsets - col.offsets[0] + base if count else base
+        blob_parts.append(raw)
+        base += len(raw)
+    blob = b"".join(blob_parts)
+
+    emb = np.ascontiguousarray(snapshot.matrix, dtype=dtype).reshape(count, dim)
+    norms = np.ascontiguousarray(snapshot.norms, dtype=np.float32)
+    emb_off = HEADER_SIZE
+    norms_off = _align(emb_off + emb.nbytes)
+    offsets_off = _align(norms_off + norms.nbytes)
+    blob_off = _align(offsets_off + offsets.nbytes)
+
+    header = _HEADER.pack(MAGIC, VERSION, _DTYPE_CODES[dtype], count, dim, len(TEXT_FIELDS),
+                          emb_off, norms_off, offsets_off, blob_off, len(blob))
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        for off, data in ((0, header), (emb_off, emb.tobytes()), (norms_off, norms.tobytes()),
+                          (offsets_off, offsets.tobytes()), (blob_off, blob)):
+            f.seek(off)
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def open_snapshot(path: Path, signature: Tuple = ()) -> IndexSnapshot:
+    """Mapeia o arquivo binário e devolve um `IndexSnapshot` sem copiar os dados."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER_SIZE:
+            raise IndexFormatError("arquivo de índice truncado")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    (magic, version, dtype_code, count, dim, n_fields,
+     emb_off, norms_off, offsets_off, blob_off, blob_size) = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise IndexFormatError("magic inválido")
+    if version != VERSION:
+        raise IndexFormatError(f"versão de índice não suportada: {version}")
+    if n_fields != len(TEXT_FIELDS) or dtype_code not in _DTYPES:
+        raise IndexFormatError("cabeçalho de índice inválido")
+    if blob_off + blob_size > len(mm):
+        raise IndexFormatError("arquivo de índice truncado")
+
+    matrix = np.frombuffer(mm, dtype=_DTYPES[dtype_code], count=count * dim, offset=emb_off).reshape(count, dim)
+    norms = np.frombuffer(mm, dtype=np.float32, count=count, offset=norms_off)
+    offsets = np.frombuffer(mm, dtype=np.int64, count=n_fields * (count + 1), offset=offsets_off).reshape(n_fields, count + 1)
+    blob = memoryview(mm)[blob_off:blob_off + blob_size]
+    columns = {field: StringColumn(blob, offsets[fi]) for fi, field in enumerate(TEXT_FIELDS)}
+    snap = IndexSnapshot(columns, matrix, norms, signature)
+    snap.buffer = mm  # mantém o mapeamento vivo enquanto o snapshot existir
+    return snap
+
+
+def iter_entries(snapshot: IndexSnapshot) -> Iterator[Dict]:
+    """Reconstrói as entradas no formato do JSON legado (com `embedding`)."""
+    for row in range(len(snapshot)):
+        entry = {f: snapshot.columns[f][row] for f in TEXT_FIELDS}
+        vec = np.asarray(snapshot.matrix[row], dtype=np.float32) * snapshot.norms[row]
+        entry["embedding"] = vec.tolist()
+        yield entry
+
+
+def preferred_index_path(json_path: Path, bin_path: Optional[Path] = None) -> Path:
+    """Arquivo do índice local a carregar: o binário (por padrão o `.bin` irmão do JSON) tem preferência.
+
+    Única regra de escolha, usada por `services.index_path` e pelo `backend.py` legado.
+    """
+    bin_path = Path(json_path).with_suffix(".bin") if bin_path is None else Path(bin_path)
+    return bin_path if bin_path.exists() else Path(json_path)
+
+
+def read_entries(path: Path) -> List[Dict]:
+    return list(iter_entries(open_snapshot(path)))
+
+
+def convert_json_index(src: Path, dst: Path, dtype=np.float32) -> IndexSnapshot:
+    entries: Sequence[Dict] = json.loads(Path(src).read_text(encoding="utf-8"))
+    from . import lexical
+
+    snapshot = IndexSnapshot.from_entries(entries)
+    write_index(dst, snapshot, dtype=dtype)
+    if lexical.lexical_enabled():
+        lexical.build_for(snapshot, dst)
+    return snapshot
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend_service.index_format")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    conv = sub.add_parser("convert", help="converte .fragaz_index.json para o formato binário")
+    conv.add_argument("src")
+    conv.add_argument("dst")
+    conv.add_argument("--float16", action="store_true", help="grava embeddings em float16")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "convert":
+        snap = convert_json_index(Path(args.src), Path(args.dst), dtype=np.float16 if args.float16 else np.float32)
+        print(f"{len(snap)} entradas (dim={snap.dim}) gravadas em {args.dst}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
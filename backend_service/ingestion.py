@@ -0,0 +1,141 @@
+"""Ingestion: busca de páginas Confluence, chunking e upsert, executados como jobs.
+
+`POST /scrape/confluence` só enfileira um job (ver `jobs.py`); o trabalho
+pesado roda em `ingest_confluence`, no pool de workers da fila, com
+progresso por etapa e checagem de cancelamento entre elas e a cada janela de
+chunks gravada.
+`POST /scrape/confluence/space` enfileira um crawl de espaço/árvore de páginas
+(`crawler.py`), que usa o mesmo pipeline de chunking + upsert por página.
+"""
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Union
+
+from . import jobs
+from .chunking import iter_chunks
+from .jobs import JobContext, JobQueue
+
+logger = logging.getLogger("fragaz.ingestion")
+
+
+class IngestionError(RuntimeError):
+    """Falha esperada da ingestão (página inacessível, sem conteúdo...)."""
+
+
+def fetch_page(url: str, username: Optional[str] = None, api_token: Optional[str] = None) -> Iterator[str]:
+    """Corpo da página em pedaços, sem materializar a resposta inteira."""
+    import requests
+
+    headers = {"User-Agent": "FRAGAZ-Scraper/1.0"}
+    auth = None
+    if username and api_token:
+        from requests.auth import HTTPBasicAuth
+
+        auth = HTTPBasicAuth(username, api_token)
+    r = requests.get(url, headers=headers, auth=auth, timeout=30, stream=True)
+    if r.status_code != 200:
+        r.close()
+        raise IngestionError(f"Falha ao buscar página Confluence: {r.status_code}")
+    r.encoding = r.encoding or "utf-8"
+
+    def pieces() -> Iterator[str]:
+        with r:
+            yield from r.iter_content(chunk_size=65536, decode_unicode=True)
+
+    return pieces()
+
+
+def _collection(payload: Dict[str, Any]) -> str:
+    return payload.get("collection_name") or os.environ.get("COLLECTION_NAME", "fragaz")
+
+
+def ingest_html(collection_name: str, url: str, title: str, html: Union[str, Iterable[str]],
+                require_content: bool = False, on_window: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """Chunking + upsert incremental de uma página, os dois em streaming.
+
+    Os chunks saem de `iter_chunks` e vão direto para `upsert_source_stream`,
+    que diffa, codifica e grava em janelas: a página nunca fica inteira em
+    memória, nem como texto nem como vetores.
+    """
+    from . import services
+
+    chunks = ((chunk.text, {"source": url, "title": title, "section": chunk.section, "chunk_index": chunk.index})
+              for chunk in iter_chunks(html))
+    first = next(chunks, None)
+    if first is None and require_content:
+        raise IngestionError("Nenhum conteúdo extraído da página.")
+    return services.upsert_source_stream(collection_name, url, itertools.chain([first] if first else [], chunks),
+                                         on_window=on_window)
+
+
+def ingest_confluence(payload: Dict[str, Any], ctx: Optional[JobContext] = None) -> Dict[str, Any]:
+    def step(fraction: float, message: str) -> None:
+        if ctx is not None:
+            ctx.progress(fraction, message)
+
+    url = payload["url"]
+    step(0.05, "buscando página")
+    html = fetch_page(url, payload.get("username"), payload.get("api_token"))
+    collection_name = _collection(payload)
+    step(0.2, "extraindo texto e gravando chunks")
+    windows = itertools.count(1)
+
+    def on_window(done: int) -> None:
+        # total de chunks desconhecido (streaming): o progresso se aproxima de 0.95
+        step(0.95 - 0.75 * 0.8 ** next(windows), f"{done} chunks gravados")  # levanta JobCancelled
+
+    summary = ingest_html(collection_name, url, payload.get("title") or url, html, require_content=True,
+                          on_window=on_window)
+    logger.info("Confluence %s sincronizado com collection=%s: %s", url, collection_name, summary)
+    return {**summary, "collection": collection_name}
+
+
+def crawl_confluence(payload: Dict[str, Any], ctx: Optional[JobContext] = None) -> Dict[str, Any]:
+    import asyncio
+
+    from . import crawler, services
+
+    collection_name = _collection(payload)
+    auth = (payload["username"], payload["api_token"]) if payload.get("username") and payload.get("api_token") else None
+    c = crawler.from_env(
+        payload["base_url"],
+        collection_name,
+        services.get_manifest(),
+        sink=lambda page: ingest_html(collection_name, page.url, page.title, page.html),
+        auth=auth,
+        max_pages=payload.get("max_pages"),
+        progress=ctx.progress if ctx is not None else None,
+    )
+    out = asyncio.run(c.crawl(space_key=payload.get("space_key"), root_page_id=payload.get("root_page_id")))
+    return {**out, "collection": collection_name}
+
+
+HANDLERS = {"confluence": ingest_confluence, "confluence_space": crawl_confluence}
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = jobs.from_env(HANDLERS)
+    return _queue
+
+
+def reset_job_queue(q: Optional[JobQueue] = None) -> None:
+    global _queue
+    with _queue_lock:
+        old, _queue = _queue, q
+    if old is not None and old is not q:
+        old.shutdown()
+
+
+def job_queue_stats() -> Optional[Dict]:
+    return _queue.stats() if _queue is not None else None
@@ -0,0 +1,346 @@
+"""Jobs: fila de jobs de ingestão em background com workers limitados.
+
+`JobQueue.submit` registra o job e devolve na hora; um pool fixo de
+`FRAGAZ_JOB_WORKERS` threads executa os handlers, que reportam progresso e
+checam cancelamento via `JobContext`. Com mais de `FRAGAZ_JOB_QUEUE_SIZE` jobs
+aguardando, `submit` levanta `QueueFull` (o controller responde 429).
+
+O estado dos jobs fica em um `JobStore`: `MemoryJobStore` (padrão) ou
+`SQLiteJobStore`, que sobrevive a reinícios — jobs que ainda estavam na fila
+voltam a ser executados e os que estavam rodando são marcados como falhos.
+Credenciais do payload (`SECRET_KEYS`) ficam só em memória: o SQLite grava o
+payload sem elas e o job perde as credenciais ao terminar. Um job na fila que
+dependia delas não é retomado após reinício (falha pedindo novo envio). Jobs
+terminados há mais de `FRAGAZ_JOB_RETENTION_HOURS` são apagados do SQLite.
+
+Configuração::
+
+    FRAGAZ_JOB_WORKERS=2
+    FRAGAZ_JOB_QUEUE_SIZE=100
+    FRAGAZ_JOB_STORE=memory | sqlite
+    FRAGAZ_JOB_STORE_PATH=.fragaz_jobs.sqlite
+    FRAGAZ_JOB_RETENTION_HOURS=168
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger("fragaz.jobs")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINAL_STATES = (SUCCEEDED, FAILED, CANCELLED)
+SECRET_KEYS = ("username", "api_token", "password", "token")
+REDACTED_KEY = "redacted"
+
+
+class QueueFull(RuntimeError):
+    """A fila atingiu o limite de jobs aguardando."""
+
+
+class JobCancelled(Exception):
+    """Levantada dentro do handler quando o job foi cancelado."""
+
+
+@dataclass
+class Job:
+    kind: str
+    payload: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    progress: float = 0.0
+    message: str = ""
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def public(self) -> Dict[str, Any]:
+        """Visão exposta pela API (sem o payload, que pode conter credenciais)."""
+        out = asdict(self)
+        out.pop("payload")
+        return out
+
+
+def strip_secrets(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Payload sem credenciais; as chaves removidas ficam listadas em `REDACTED_KEY`."""
+    removed = sorted(k for k in SECRET_KEYS if payload.get(k))
+    out = {k: v for k, v in payload.items() if k not in SECRET_KEYS}
+    if removed:
+        out[REDACTED_KEY] = sorted(set(out.get(REDACTED_KEY) or []) | set(removed))
+    return out
+
+
+class JobStore(ABC):
+    @abstractmethod
+    def save(self, job: Job) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        ...
+
+    def unfinished(self) -> List[Job]:
+        return []
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self, max_finished: int = 1000):
+        self.max_finished = max_finished
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.status in FINAL_STATES]
+            if len(finished) > self.max_finished:
+                finished.sort(key=lambda j: j.finished_at or 0.0)
+                for old in finished[:len(finished) - self.max_finished]:
+                    del self._jobs[old.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+class SQLiteJobStore(JobStore):
+    """Estado dos jobs em SQLite (sem credenciais); permite retomar a fila após reinício."""
+
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, path: Path, retention: float = 7 * 86400.0):
+        self.path = str(path)
+        self.retention = retention
+        self._local = threading.local()
+        self._cache: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, created_at REAL, data TEXT, "
+                         "finished_at REAL)")
+            try:
+                conn.execute("ALTER TABLE jobs ADD COLUMN finished_at REAL")  # arquivos de antes da retenção
+            except sqlite3.OperationalError:
+                pass
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._cache[job.id] = job
+            if job.status in FINAL_STATES:
+                self._cache.pop(job.id, None)
+        data = asdict(job)
+        data["payload"] = strip_secrets(job.payload)
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO jobs (id, status, created_at, data, finished_at) VALUES (?, ?, ?, ?, ?)",
+                     (job.id, job.status, job.created_at, json.dumps(data, ensure_ascii=False, default=str),
+                      job.finished_at))
+        conn.commit()
+        if job.status in FINAL_STATES:
+            self.prune()
+
+    def prune(self, now: Optional[float] = None, force: bool = False) -> int:
+        """Apaga jobs terminados há mais de `retention` segundos (no máximo uma vez por minuto)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if not force and now - self._last_prune < self.PRUNE_INTERVAL:
+                return 0
+            self._last_prune = now
+        conn = self._conn()
+        cur = conn.execute("DELETE FROM jobs WHERE status IN (?, ?, ?) AND COALESCE(finished_at, created_at) < ?",
+                           (*FINAL_STATES, now - self.retention))
+        conn.commit()
+        if cur.rowcount:
+            logger.info("%d jobs terminados removidos do store", cur.rowcount)
+        return cur.rowcount
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._cache.get(job_id)
+        if job is not None:
+            return job
+        row = self._conn().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(**json.loads(row[0])) if row else None
+
+    def unfinished(self) -> List[Job]:
+        rows = self._conn().execute("SELECT data FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)).fetchall()
+        return [Job(**json.loads(r[0])) for r in rows]
+
+
+class JobContext:
+    """Passado ao handler: progresso e checagem de cancelamento."""
+
+    def __init__(self, job: Job, store: JobStore):
+        self.job = job
+        self._store = store
+
+    @property
+    def cancelled(self) -> bool:
+        return self.job.cancel_requested
+
+    def check_cancelled(self) -> None:
+        if self.job.cancel_requested:
+            raise JobCancelled(self.job.id)
+
+    def progress(self, fraction: float, message: str = "") -> None:
+        self.check_cancelled()
+        self.job.progress = max(0.0, min(1.0, float(fraction)))
+        if message:
+            self.job.message = message
+        self._store.save(self.job)
+
+
+Handler = Callable[[Dict[str, Any], JobContext], Optional[Dict[str, Any]]]
+
+
+class JobQueue:
+    def __init__(self, handlers: Dict[str, Handler], store: Optional[JobStore] = None, workers: int = 2,
+                 max_queued: int = 100):
+        self.handlers = dict(handlers)
+        self.store = store or MemoryJobStore()
+        self.max_queued = max(1, max_queued)
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue()
+        self._waiting: Set[str] = set()  # ids na fila; quem sai daqui (worker ou cancel) é dono do job
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "run_seconds": 0.0}
+        self._threads = [threading.Thread(target=self._worker, name=f"fragaz-job-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for t in self._threads:
+            t.start()
+        self._recover()
+
+    def _recover(self) -> None:
+        for job in self.store.unfinished():
+            if job.status == RUNNING or job.kind not in self.handlers:
+                job.status, job.error, job.finished_at = FAILED, "interrompido por reinício do processo", time.time()
+                self.store.save(job)
+                continue
+            if job.payload.get(REDACTED_KEY):
+                job.status, job.finished_at = FAILED, time.time()
+                job.error = "credenciais não são persistidas; envie o job de novo"
+                self.store.save(job)
+                continue
+            with self._lock:
+                self._waiting.add(job.id)
+            self._queue.put(job)
+            logger.info("Job %s retomado da fila persistida", job.id)
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"tipo de job desconhecido: {kind}")
+        with self._lock:
+            if len(self._waiting) >= self.max_queued:
+                self._stats["rejected"] += 1
+                raise QueueFull(f"fila de jobs cheia ({self.max_queued})")
+            job = Job(kind=kind, payload=payload)
+            self._waiting.add(job.id)
+            self._stats["submitted"] += 1
+        self.store.save(job)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Jobs na fila são cancelados na hora; em execução, no próximo checkpoint."""
+        job = self.store.get(job_id)
+        if job is None or job.status in FINAL_STATES:
+            return job
+        job.cancel_requested = True
+        with self._lock:
+            queued = job_id in self._waiting
+            self._waiting.discard(job_id)
+        if queued:
+            # libera a vaga na fila já; o worker descarta o job quando o tirar da fila
+            self._finish(job, CANCELLED)
+        else:
+            self.store.save(job)
+        return job
+
+    def _finish(self, job: Job, status: str, started: Optional[float] = None) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        job.payload = strip_secrets(job.payload)
+        self.store.save(job)
+        with self._lock:
+            self._stats[status] += 1
+            if started is not None:
+                self._stats["run_seconds"] += time.monotonic() - started
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.id not in self._waiting:
+                    continue  # cancelado enquanto aguardava
+                self._waiting.discard(job.id)
+            # pode ter sido recarregado do store enquanto aguardava
+            job = self.store.get(job.id) or job
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+                continue
+            job.status, job.started_at = RUNNING, time.time()
+            self.store.save(job)
+            started = time.monotonic()
+            try:
+                job.result = self.handlers[job.kind](job.payload, JobContext(job, self.store))
+                job.progress = 1.0
+                self._finish(job, SUCCEEDED, started)
+            except JobCancelled:
+                self._finish(job, CANCELLED, started)
+            except Exception as e:
+                logger.exception("Job %s (%s) falhou", job.id, job.kind)
+                job.error = str(e)
+                self._finish(job, FAILED, started)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats, queued=len(self._waiting))
+        out["workers"] = len(self._threads)
+        out["max_queued"] = self.max_queued
+        return out
+
+    def shutdown(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+
+
+def from_env(handlers: Dict[str, Handler]) -> JobQueue:
+    mode = os.environ.get("FRAGAZ_JOB_STORE", "memory").strip().lower()
+    store: JobStore
+    if mode == "sqlite":
+        store = SQLiteJobStore(Path(os.environ.get("FRAGAZ_JOB_STORE_PATH") or (ROOT / ".fragaz_jobs.sqlite")),
+                               retention=3600.0 * float(os.environ.get("FRAGAZ_JOB_RETENTION_HOURS", "168")))
+    else:
+        store = MemoryJobStore()
+    return JobQueue(
+        handlers,
+        store=store,
+        workers=int(os.environ.get("FRAGAZ_JOB_WORKERS", "2")),
+        max_queued=int(os.environ.get("FRAGAZ_JOB_QUEUE_SIZE", "100")),
+    )
@@ -0,0 +1,253 @@
+"""Lexical: índice invertido BM25 para o fallback local e fusão híbrida (RRF).
+
+A tokenização é voltada ao português: minúsculas, remoção de acentos,
+stopwords e um stemmer leve (plurais e sufixos mais comuns). As postings ficam
+em arrays CSR ordenados por documento com o impacto BM25 já pré-calculado, de
+modo que a consulta é só uma soma por termo. A busca usa MaxScore: depois que
+o top-k se estabiliza, os termos restantes (de menor limite superior) só
+atualizam documentos que ainda podem entrar no top-k.
+
+O índice é construído junto com o índice local e persistido como
+`<index>.bm25.npz`. Desabilite com `FRAGAZ_LEXICAL=0`.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .local_index import top_k
+
+logger = logging.getLogger("fragaz.lexical")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+STOPWORDS = frozenset("""
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles depois
+do dos e ela elas ele eles em entre era essa essas esse esses esta estas este estes eu foi for ha isso
+isto ja la lhe lhes mais mas me mesmo meu minha muito na nao nas nem no nos nossa nosso num numa o os
+ou para pela pelas pelo pelos por qual quando que quem se sem ser seu seus sua suas so tambem te tem
+ter um uma umas uns voce voces vos como onde porque pois esta estao sao deve devo posso pode
+""".split())
+
+# sufixos testados do mais longo para o mais curto; o radical mínimo tem 3 letras
+_SUFFIXES = (
+    ("amentos", ""), ("imentos", ""), ("amento", ""), ("imento", ""),
+    ("acoes", "a"), ("icoes", "i"), ("acao", "a"), ("icao", "i"),
+    ("mente", ""), ("idades", ""), ("idade", ""),
+    ("istas", ""), ("ista", ""), ("ismos", ""), ("ismo", ""),
+    ("aveis", "avel"), ("iveis", "ivel"),
+    ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"),
+    ("res", "r"), ("zes", "z"), ("ns", "m"), ("s", ""),
+)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(token: str) -> str:
+    for suffix, repl in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) + len(repl) >= 3:
+            token = token[: len(token) - len(suffix)] + repl
+            break
+    # feminino/masculino: "senha"/"senhas" e "transacao"/"transacoes" já convergem;
+    # remove a vogal temática final de palavras longas
+    if len(token) > 4 and token[-1] in "aeo":
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(t) for t in _TOKEN_RE.findall(fold(text or "")) if t not in STOPWORDS and len(t) > 1]
+
+
+def lexical_enabled() -> bool:
+    return os.environ.get("FRAGAZ_LEXICAL", "1") != "0"
+
+
+def lexical_path(index_path: Path) -> Path:
+    index_path = Path(index_path)
+    return index_path.with_name(index_path.stem + ".bm25.npz")
+
+
+class BM25Index:
+    def __init__(self, terms: Sequence[str], post_offsets: np.ndarray, post_docs: np.ndarray, post_impacts: np.ndarray, n_docs: int, fingerprint: int = 0):
+        self.vocab: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.terms = list(terms)
+        self.post_offsets = post_offsets
+        self.post_docs = post_docs
+        self.post_impacts = post_impacts
+        self.n_docs = n_docs
+        self.fingerprint = fingerprint
+        # limite superior do score de cada termo (para o MaxScore)
+        nonempty = post_offsets[1:] > post_offsets[:-1]
+        self.max_impact = np.zeros(len(self.terms), dtype=np.float32)
+        if len(post_impacts):
+            self.max_impact[nonempty] = np.maximum.reduceat(post_impacts, post_offsets[:-1][nonempty])
+
+    @classmethod
+    def build(cls, texts: Sequence[str], k1: float = BM25_K1, b: float = BM25_B, fingerprint: int = 0) -> "BM25Index":
+        vocab: Dict[str, int] = {}
+        rows: List[int] = []
+        cols: List[int] = []
+        tfs: List[int] = []
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                rows.append(vocab.setdefault(term, len(vocab)))
+                cols.append(doc)
+                tfs.append(tf)
+        term_ids = np.asarray(rows, dtype=np.int32)
+        docs = np.asarray(cols, dtype=np.int32)
+        tf = np.asarray(tfs, dtype=np.float32)
+        order = np.lexsort((docs, term_ids))
+        term_ids, docs, tf = term_ids[order], docs[order], tf[order]
+
+        n = len(texts)
+        df = np.bincount(term_ids, minlength=len(vocab)).astype(np.float32)
+        post_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df.astype(np.int64), out=post_offsets[1:])
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_len.mean()) if n and doc_len.mean() > 0 else 1.0
+        norm = k1 * (1.0 - b + b * doc_len[docs] / avgdl)
+        impacts = (idf[term_ids] * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32)
+        terms = sorted(vocab, key=vocab.get)
+        return cls(terms, post_offsets, docs, impacts, n, fingerprint)
+
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.post_offsets[term_id], self.post_offsets[term_id + 1]
+        return self.post_docs[start:end], self.post_impacts[start:end]
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        term_ids = sorted({self.vocab[t] for t in tokenize(query) if t in self.vocab}, key=lambda t: -self.max_impact[t])
+        if not term_ids or k <= 0:
+            return []
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        remaining = float(sum(self.max_impact[t] for t in term_ids))
+        candidates: Optional[np.ndarray] = None
+        for t in term_ids:
+            docs, impacts = self.postings(t)
+            if candidates is None:
+                scores[docs] += impacts
+                remaining -= float(self.max_impact[t])
+                touched = np.flatnonzero(scores)
+                if len(touched) >= k:
+                    threshold = float(np.partition(scores[touched], len(touched) - k)[len(touched) - k])
+                    if remaining < threshold:
+                        # nenhum documento ainda com score 0 alcança o top-k
+                        candidates = touched
+            else:
+                pos = np.searchsorted(docs, candidates)
+                pos[pos == len(docs)] = 0
+                hit = docs[pos] == candidates if len(docs) else np.zeros(len(candidates), dtype=bool)
+                scores[candidates[hit]] += impacts[pos[hit]]
+        touched = np.flatnonzero(scores) if candidates is None else candidates
+        ranked = top_k(scores[touched], k)
+        return [(int(touched[i]), sc) for i, sc in ranked if sc > 0]
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(tmp, terms=np.array(self.terms, dtype=str), post_offsets=self.post_offsets,
+                 post_docs=self.post_docs, post_impacts=self.post_impacts,
+                 meta=np.array([self.n_docs, self.fingerprint], dtype=np.int64))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            n_docs, fp = (int(v) for v in data["meta"])
+            return cls(data["terms"].tolist(), data["post_offsets"], data["post_docs"], data["post_impacts"], n_docs, fp)
+
+
+def build_for(snapshot, index_path: Optional[Path] = None, fp: Optional[int] = None) -> BM25Index:
+    from .ann import fingerprint
+
+    texts = [f"{snapshot.columns['title'][i]}\n{snapshot.columns['content'][i]}" for i in range(len(snapshot))]
+    bm25 = BM25Index.build(texts, fingerprint=fingerprint(snapshot) if fp is None else fp)
+    if index_path is not None:
+        try:
+            bm25.save(lexical_path(index_path))
+        except OSError as e:
+            logger.warning("Não foi possível persistir índice BM25: %s", e)
+    return bm25
+
+
+def attach(snapshot, index_path: Path, fp: Optional[int] = None) -> None:
+    """Anexa o BM25 ao snapshot, carregando `<index>.bm25.npz` ou construindo."""
+    from .ann import fingerprint
+
+    if not lexical_enabled() or len(snapshot) == 0:
+        return
+    fp = fingerprint(snapshot) if fp is None else fp
+    path = lexical_path(index_path)
+    bm25 = None
+    if path.exists():
+        try:
+            bm25 = BM25Index.load(path)
+            if bm25.fingerprint != fp or bm25.n_docs != len(snapshot):
+                logger.info("Índice BM25 obsoleto, reconstruindo: %s", path)
+                bm25 = None
+        except Exception as e:
+            logger.warning("Falha ao carregar índice BM25 %s: %s", path, e)
+            bm25 = None
+    if bm25 is None:
+        bm25 = build_for(snapshot, index_path, fp)
+        logger.info("Índice BM25 construído: %d documentos, %d termos", bm25.n_docs, len(bm25.terms))
+    snapshot.lexical = bm25
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Funde listas ranqueadas: score(d) = soma de 1 / (k + posição)."""
+    fused: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for pos, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + pos)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def _fuse(snapshot, query: str, vector: List[Tuple[int, float]], k: int, depth: int) -> List[Tuple[int, float]]:
+    if snapshot.lexical is None:
+        return vector[:k]
+    lexical = [row for row, _ in snapshot.lexical.search(query, depth)]
+    if not lexical:
+        return vector[:k]
+    best = 2.0 / (RRF_K + 1)
+    return [(row, sc / best) for row, sc in reciprocal_rank_fusion([lexical, [row for row, _ in vector]])[:k]]
+
+
+def hybrid_search(snapshot, query: str, query_vec, k: int, depth: Optional[int] = None) -> List[Tuple[int, float]]:
+    """Busca vetorial + BM25 fundidas por RRF; score normalizado em 0..1."""
+    depth = depth or max(2 * k, 20)
+    if snapshot.lexical is None:
+        return snapshot.search(query_vec, k)
+    return _fuse(snapshot, query, snapshot.search(query_vec, depth), k, depth)
+
+
+def hybrid_search_many(snapshot, queries: Sequence[str], query_vecs, k: int,
+                       depth: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+    """`hybrid_search` em lote: a parte vetorial sai de um único `search_many`."""
+    depth = depth or max(2 * k, 20)
+    vectors = snapshot.search_many(query_vecs, k if snapshot.lexical is None else depth)
+    return [_fuse(snapshot, q, vec, k, depth) for q, vec in zip(queries, vectors)]
+
+
+def hybrid_top_k(snapshot, query: str, query_vec, k: int) -> List[Dict]:
+    return [snapshot.entry(row, sc) for row, sc in hybrid_search(snapshot, query, query_vec, k)]
+
+
+def hybrid_top_k_many(snapshot, queries: Sequence[str], query_vecs, k: int) -> List[List[Dict]]:
+    return [[snapshot.entry(row, sc) for row, sc in hits] for hits in hybrid_search_many(snapshot, queries, query_vecs, k)]
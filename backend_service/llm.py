@@ -0,0 +1,381 @@
+"""LLM: cliente de provedor criado uma vez por processo, com prazo, retry e métricas.
+
+`LLMClient` embrulha um provedor (`GeminiProvider` ou `StubProvider`) e aplica
+em toda chamada:
+
+- prazo por chamada (`FRAGAZ_LLM_TIMEOUT` segundos, incluindo as novas tentativas);
+- novas tentativas só para erros transitórios (timeout, conexão, 429/5xx), até
+  `FRAGAZ_LLM_RETRIES` por chamada e limitadas por um orçamento global
+  (`RetryBudget`): cada chamada deposita `FRAGAZ_LLM_RETRY_RATIO` de crédito e
+  cada retry gasta 1, então numa pane do provedor os retries não multiplicam a
+  carga;
+- estatísticas de latência, tokens (do `usage_metadata` do provedor quando
+  houver, senão estimados por palavras) e erros.
+
+O `GeminiProvider` configura o SDK e monta o `GenerativeModel` uma única vez,
+reaproveitando o transporte (conexões quentes) entre requisições. O
+`StubProvider` é local e determinístico, com latência configurável, para testes
+de carga do `/query` sem rede.
+
+Configuração::
+
+    FRAGAZ_LLM_PROVIDER=gemini        # gemini | stub | off
+    GEMINI_MODEL=gemini-2.5-flash
+    FRAGAZ_LLM_TIMEOUT=30
+    FRAGAZ_LLM_RETRIES=2
+    FRAGAZ_LLM_RETRY_RATIO=0.1
+    FRAGAZ_LLM_STUB_LATENCY=0.2       # segundos até o primeiro token
+    FRAGAZ_LLM_STUB_TOKEN_DELAY=0.01  # segundos entre tokens
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("fragaz.llm")
+
+_RETRYABLE_NAMES = ("timeout", "deadline", "unavailable", "exhausted", "connect", "internalserver", "toomanyrequests")
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    name = type(exc).__name__.lower()
+    return any(n in name for n in _RETRYABLE_NAMES)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text.split())
+
+
+class Completion:
+    __slots__ = ("text", "prompt_tokens", "output_tokens")
+
+    def __init__(self, text: str, prompt_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, model: str, api_key: str):
+        import genai as _genai
+
+        self.model = model
+        _genai.configure(api_key=api_key)
+        self._model = _genai.GenerativeModel(model)
+        logger.info("Provedor genai inicializado (modelo: %s)", model)
+
+    @staticmethod
+    def _completion(resp) -> Completion:
+        text = (getattr(resp, "text", None) or str(resp)).strip()
+        usage = getattr(resp, "usage_metadata", None)
+        return Completion(text, getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None))
+
+    def generate(self, prompt: str, timeout: float) -> Completion:
+        return self._completion(self._model.generate_content(prompt, request_options={"timeout": timeout}))
+
+    async def generate_async(self, prompt: str, timeout: float) -> Completion:
+        generate = getattr(self._model, "generate_content_async", None)
+        if generate is None:
+            return await asyncio.to_thread(self.generate, prompt, timeout)
+        return self._completion(await generate(prompt, request_options={"timeout": timeout}))
+
+    async def stream_async(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        generate = getattr(self._model, "generate_content_async", None)
+        if generate is None:
+            yield (await asyncio.to_thread(self.generate, prompt, timeout)).text
+            return
+        async for chunk in await generate(prompt, stream=True, request_options={"timeout": timeout}):
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+
+class StubProvider:
+    """Provedor local: resposta determinística derivada do prompt, sem rede."""
+
+    name = "stub"
+
+    def __init__(self, model: str = "stub", latency: float = 0.2, token_delay: float = 0.01):
+        self.model = model
+        self.latency = latency
+        self.token_delay = token_delay
+
+    def _tokens(self, prompt: str) -> List[str]:
+        context, _, question = prompt.partition("\n\nPergunta: ")
+        question = question.split("\n\n", 1)[0].strip()
+        context = context.replace("Contexto:\n", "", 1)
+        first = next((p.strip() for p in context.split("\n\n---\n\n") if p.strip()), "")
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        text = f"[stub {digest}] Sobre \"{question}\": {' '.join(first.split()[:40])}"
+        words = text.split(" ")
+        return [w + " " for w in words[:-1]] + words[-1:]
+
+    def _duration(self, n: int) -> float:
+        return self.latency + self.token_delay * max(0, n - 1)
+
+    def generate(self, prompt: str, timeout: float) -> Completion:
+        tokens = self._tokens(prompt)
+        duration = self._duration(len(tokens))
+        if duration > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"stub excedeu o prazo de {timeout:.2f}s")
+        time.sleep(duration)
+        return Completion("".join(tokens), estimate_tokens(prompt), len(tokens))
+
+    async def generate_async(self, prompt: str, timeout: float) -> Completion:
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self._duration(len(tokens)))
+        return Completion("".join(tokens), estimate_tokens(prompt), len(tokens))
+
+    async def stream_async(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(self._tokens(prompt)):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield token
+
+
+class RetryBudget:
+    """Cada chamada deposita `ratio` de crédito (até `max_tokens`); cada retry gasta 1."""
+
+    def __init__(self, ratio: float = 0.1, initial: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = min(initial, max_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    @property
+    def available(self) -> float:
+        return self._tokens
+
+
+class LLMClient:
+    def __init__(self, provider, timeout: float = 30.0, retries: int = 2, budget: Optional[RetryBudget] = None,
+                 backoff_base: float = 0.25):
+        self.provider = provider
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.budget = budget or RetryBudget()
+        self.backoff_base = backoff_base
+        self._lock = threading.Lock()
+        self._latency: Deque[float] = deque(maxlen=256)
+        self._stats = {"calls": 0, "errors": 0, "retries": 0, "retries_denied": 0, "timeouts": 0,
+                       "prompt_tokens": 0, "output_tokens": 0, "seconds": 0.0}
+
+    @property
+    def model(self) -> str:
+        return self.provider.model
+
+    def _incr(self, key: str, value=1) -> None:
+        with self._lock:
+            self._stats[key] += value
+
+    def _record(self, prompt: str, completion: Completion, seconds: float) -> None:
+        with self._lock:
+            self._stats["prompt_tokens"] += completion.prompt_tokens or estimate_tokens(prompt)
+            self._stats["output_tokens"] += completion.output_tokens or estimate_tokens(completion.text)
+            self._stats["seconds"] += seconds
+            self._latency.append(seconds)
+
+    def _retry_delay(self, exc: BaseException, attempt: int, remaining: float) -> Optional[float]:
+        """Espera antes da próxima tentativa, ou None se não deve tentar de novo."""
+        if isinstance(exc, (TimeoutError, asyncio.TimeoutError)):
+            self._incr("timeouts")
+        if attempt >= self.retries or not is_retryable(exc):
+            return None
+        delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+        if delay >= remaining:
+            return None
+        if not self.budget.withdraw():
+            self._incr("retries_denied")
+            return None
+        self._incr("retries")
+        logger.info("Erro transitório no LLM (%s); nova tentativa %d em %.2fs", exc, attempt + 1, delay)
+        return delay
+
+    def _begin(self) -> Tuple[float, float]:
+        self._incr("calls")
+        self.budget.deposit()
+        t0 = time.monotonic()
+        return t0, t0 + self.timeout
+
+    def generate(self, prompt: str) -> str:
+        t0, t_end = self._begin()
+        attempt = 0
+        while True:
+            try:
+                completion = self.provider.generate(prompt, max(0.001, t_end - time.monotonic()))
+                break
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, t_end - time.monotonic())
+                if delay is None:
+                    self._incr("errors")
+                    raise
+                attempt += 1
+                time.sleep(delay)
+        self._record(prompt, completion, time.monotonic() - t0)
+        return completion.text
+
+    async def generate_async(self, prompt: str) -> str:
+        t0, t_end = self._begin()
+        attempt = 0
+        while True:
+            remaining = max(0.001, t_end - time.monotonic())
+            try:
+                completion = await asyncio.wait_for(self.provider.generate_async(prompt, remaining), remaining)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, t_end - time.monotonic())
+                if delay is None:
+                    self._incr("errors")
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+        self._record(prompt, completion, time.monotonic() - t0)
+        return completion.text
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        """Pedaços da resposta; só tenta de novo enquanto nenhum pedaço foi entregue."""
+        t0, t_end = self._begin()
+        attempt = 0
+        parts: List[str] = []
+        while True:
+            stream = self.provider.stream_async(prompt, max(0.001, t_end - time.monotonic())).__aiter__()
+            try:
+                while True:
+                    remaining = t_end - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"LLM excedeu o prazo de {self.timeout:.1f}s")
+                    try:
+                        piece = await asyncio.wait_for(stream.__anext__(), remaining)
+                    except StopAsyncIteration:
+                        break
+                    parts.append(piece)
+                    yield piece
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = None if parts else self._retry_delay(e, attempt, t_end - time.monotonic())
+                if delay is None:
+                    if parts and isinstance(e, (TimeoutError, asyncio.TimeoutError)):
+                        self._incr("timeouts")
+                    self._incr("errors")
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+        text = "".join(parts)
+        self._record(prompt, Completion(text), time.monotonic() - t0)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+            latencies = sorted(self._latency)
+        out.update(provider=self.provider.name, model=self.model, retry_budget=round(self.budget.available, 2))
+        out["latency_avg"] = sum(latencies) / len(latencies) if latencies else 0.0
+        out["latency_p95"] = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+        out["output_tokens_per_sec"] = out["output_tokens"] / out["seconds"] if out["seconds"] else 0.0
+        out["error_rate"] = out["errors"] / out["calls"] if out["calls"] else 0.0
+        return out
+
+
+def provider_name() -> str:
+    name = os.environ.get("FRAGAZ_LLM_PROVIDER", "gemini").strip().lower()
+    if name == "gemini" and os.environ.get("ENABLE_GENAI", "1") == "0":
+        return "off"
+    return name
+
+
+def _api_key() -> Optional[str]:
+    return os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+
+
+def enabled() -> bool:
+    if _client is not None:
+        return True
+    name = provider_name()
+    if name == "stub":
+        return True
+    return name == "gemini" and bool(_api_key())
+
+
+def model_name() -> str:
+    if _client is not None:
+        return _client.model
+    if provider_name() == "stub":
+        return os.environ.get("FRAGAZ_LLM_STUB_MODEL", "stub")
+    return os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+
+
+def from_env() -> LLMClient:
+    name = provider_name()
+    if name == "stub":
+        provider = StubProvider(
+            model=os.environ.get("FRAGAZ_LLM_STUB_MODEL", "stub"),
+            latency=float(os.environ.get("FRAGAZ_LLM_STUB_LATENCY", "0.2")),
+            token_delay=float(os.environ.get("FRAGAZ_LLM_STUB_TOKEN_DELAY", "0.01")),
+        )
+    elif name == "gemini" and _api_key():
+        provider = GeminiProvider(os.environ.get("GEMINI_MODEL", "gemini-2.5-flash"), _api_key())
+    else:
+        raise RuntimeError(f"provedor de LLM indisponível: {name}")
+    return LLMClient(
+        provider,
+        timeout=float(os.environ.get("FRAGAZ_LLM_TIMEOUT", "30")),
+        retries=int(os.environ.get("FRAGAZ_LLM_RETRIES", "2")),
+        budget=RetryBudget(ratio=float(os.environ.get("FRAGAZ_LLM_RETRY_RATIO", "0.1"))),
+    )
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = from_env()
+    return _client
+
+
+def reset_client(client: Optional[LLMClient] = None) -> None:
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def stats() -> Optional[Dict]:
+    return _client.stats() if _client is not None else None
@@ -0,0 +1,301 @@
+"""LLM limits: coalescência de chamadas idênticas e limite de concorrência no provedor.
+
+`SingleFlight` junta requisições de geração idênticas em andamento (mesma
+pergunta normalizada, mesmo conjunto de fontes, mesmo modelo) numa única
+chamada ao provedor; quem chega depois espera o resultado da primeira. No
+caminho assíncrono a chamada roda numa task própria, então o cancelamento de
+quem a disparou não derruba os demais; ela só é cancelada quando ninguém mais
+espera por ela.
+
+`ConcurrencyLimiter` limita as chamadas simultâneas ao provedor, no total
+(`FRAGAZ_LLM_CONCURRENCY`) e por modelo (`FRAGAZ_LLM_MODEL_CONCURRENCY`, um
+número para todos os modelos ou `modelo=n,modelo=n`). Quem não consegue vaga
+em `FRAGAZ_LLM_QUEUE_TIMEOUT` segundos recebe `LLMBusy`; a fila é FIFO e
+serve tanto threads quanto corrotinas.
+
+Configuração::
+
+    FRAGAZ_LLM_CONCURRENCY=8
+    FRAGAZ_LLM_MODEL_CONCURRENCY=4
+    FRAGAZ_LLM_QUEUE_TIMEOUT=10
+    FRAGAZ_LLM_COALESCE=1
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Iterator, List, Optional
+
+
+class LLMBusy(RuntimeError):
+    """Nenhuma vaga no provedor dentro do tempo de fila."""
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, List] = {}  # chave -> [task, nº de quem espera]
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def do_async(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await factory()
+        key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            entry = self._tasks.get(key)
+            if entry is None:
+                entry = self._tasks[key] = [asyncio.ensure_future(factory()), 0]
+                self._stats["calls"] += 1
+
+                def forget(_, entry=entry):
+                    with self._lock:
+                        if self._tasks.get(key) is entry:
+                            del self._tasks[key]
+
+                entry[0].add_done_callback(forget)
+            else:
+                self._stats["coalesced"] += 1
+            entry[1] += 1
+        task = entry[0]
+        try:
+            return await asyncio.shield(task)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                orphan = entry[1] == 0 and not task.done()
+            if orphan:
+                task.cancel()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats, in_flight=len(self._calls) + len(self._tasks), enabled=self.enabled)
+        total = out["calls"] + out["coalesced"]
+        out["coalesced_rate"] = out["coalesced"] / total if total else 0.0
+        return out
+
+
+class _Waiter:
+    __slots__ = ("model", "granted", "wake")
+
+    def __init__(self, model: str, wake: Callable[[], None]):
+        self.model = model
+        self.granted = False
+        self.wake = wake
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int = 8, per_model: Optional[Dict[str, int]] = None, default_per_model: Optional[int] = None,
+                 queue_timeout: float = 10.0):
+        self.limit = max(1, limit)
+        self.per_model = dict(per_model or {})
+        self.default_per_model = default_per_model
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._active_by_model: Dict[str, int] = {}
+        self._waiters: Deque[_Waiter] = deque()
+        self._stats = {"requests": 0, "queued": 0, "timeouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0,
+                       "max_queue_depth": 0}
+
+    def _model_limit(self, model: str) -> int:
+        return self.per_model.get(model, self.default_per_model or self.limit)
+
+    def _fits(self, model: str) -> bool:
+        return self._active < self.limit and self._active_by_model.get(model, 0) < self._model_limit(model)
+
+    def _take(self, model: str) -> None:
+        self._active += 1
+        self._active_by_model[model] = self._active_by_model.get(model, 0) + 1
+
+    def _grant_waiters(self) -> None:
+        # chamado com self._lock; FIFO, mas um modelo lotado não bloqueia os outros
+        for w in list(self._waiters):
+            if self._active >= self.limit:
+                break
+            if self._fits(w.model):
+                self._waiters.remove(w)
+                self._take(w.model)
+                w.granted = True
+                w.wake()
+
+    def _release(self, model: str) -> None:
+        with self._lock:
+            self._active -= 1
+            self._active_by_model[model] -= 1
+            self._grant_waiters()
+
+    def _enqueue(self, model: str, wake: Callable[[], None]) -> Optional[_Waiter]:
+        """Pega a vaga se houver (devolve None); senão entra na fila."""
+        with self._lock:
+            self._stats["requests"] += 1
+            if not self._waiters and self._fits(model):
+                self._take(model)
+                return None
+            w = _Waiter(model, wake)
+            self._waiters.append(w)
+            self._stats["queued"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiters))
+            return w
+
+    def _abandon(self, w: _Waiter) -> bool:
+        """Sai da fila; devolve True se a vaga já tinha sido concedida."""
+        with self._lock:
+            if w.granted:
+                return True
+            self._waiters.remove(w)
+            return False
+
+    def _record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._stats["wait_seconds"] += seconds
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], seconds)
+
+    def _timeout(self, model: str) -> LLMBusy:
+        with self._lock:
+            self._stats["timeouts"] += 1
+        return LLMBusy(f"LLM ocupado: nenhuma vaga para {model} em {self.queue_timeout:.1f}s")
+
+    @contextmanager
+    def slot(self, model: str) -> Iterator[None]:
+        t0 = time.monotonic()
+        event = threading.Event()
+        w = self._enqueue(model, event.set)
+        if w is not None and not event.wait(self.queue_timeout) and not self._abandon(w):
+            raise self._timeout(model)
+        self._record_wait(time.monotonic() - t0)
+        try:
+            yield
+        finally:
+            self._release(model)
+
+    @asynccontextmanager
+    async def slot_async(self, model: str) -> AsyncIterator[None]:
+        t0 = time.monotonic()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+
+        w = self._enqueue(model, wake)
+        if w is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(w):
+                    raise self._timeout(model)
+            except asyncio.CancelledError:
+                if self._abandon(w):
+                    self._release(model)
+                raise
+        self._record_wait(time.monotonic() - t0)
+        try:
+            yield
+        finally:
+            self._release(model)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+            out.update(active=self._active, active_by_model=dict(self._active_by_model), queue_depth=len(self._waiters),
+                       limit=self.limit)
+        served = out["requests"] - out["timeouts"] - out["queue_depth"]
+        out["avg_wait_seconds"] = out["wait_seconds"] / served if served > 0 else 0.0
+        return out
+
+
+def parse_model_limits(value: str) -> Dict[str, int]:
+    out = {}
+    for part in value.split(","):
+        if "=" in part:
+            name, n = part.split("=", 1)
+            out[name.strip()] = int(n)
+    return out
+
+
+def limiter_from_env() -> ConcurrencyLimiter:
+    per_model = os.environ.get("FRAGAZ_LLM_MODEL_CONCURRENCY", "").strip()
+    return ConcurrencyLimiter(
+        limit=int(os.environ.get("FRAGAZ_LLM_CONCURRENCY", "8")),
+        per_model=parse_model_limits(per_model),
+        default_per_model=int(per_model) if per_model.isdigit() else None,
+        queue_timeout=float(os.environ.get("FRAGAZ_LLM_QUEUE_TIMEOUT", "10")),
+    )
+
+
+_limiter: Optional[ConcurrencyLimiter] = None
+_flight: Optional[SingleFlight] = None
+_init_lock = threading.Lock()
+
+
+def get_limiter() -> ConcurrencyLimiter:
+    global _limiter
+    if _limiter is None:
+        with _init_lock:
+            if _limiter is None:
+                _limiter = limiter_from_env()
+    return _limiter
+
+
+def get_single_flight() -> SingleFlight:
+    global _flight
+    if _flight is None:
+        with _init_lock:
+            if _flight is None:
+                _flight = SingleFlight(enabled=os.environ.get("FRAGAZ_LLM_COALESCE", "1") != "0")
+    return _flight
+
+
+def reset(limiter: Optional[ConcurrencyLimiter] = None, flight: Optional[SingleFlight] = None) -> None:
+    global _limiter, _flight
+    with _init_lock:
+        _limiter, _flight = limiter, flight
+
+
+def stats() -> Dict:
+    return {
+        "limiter": _limiter.stats() if _limiter is not None else None,
+        "single_flight": _flight.stats() if _flight is not None else None,
+    }
@@ -0,0 +1,323 @@
+"""Local index: índice de fallback residente em memória.
+
+Mantém o índice local (`.fragaz_index.bin` ou `.fragaz_index.json`) carregado
+uma única vez por processo, com os embeddings em uma matriz contígua já
+normalizada e os campos de texto em colunas compactas (blob UTF-8 + offsets).
+O índice é recarregado automaticamente quando o arquivo muda (mtime/tamanho).
+
+Os aceleradores opcionais (IVF, quantização, BM25) são carregados ou
+construídos numa thread própria depois que o snapshot é publicado: até ficarem
+prontos, as buscas usam a busca exata (e só a vetorial, sem BM25), sem esperar
+o build nem o lock do índice.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("fragaz.local_index")
+
+TEXT_FIELDS = ("id", "title", "content", "source")
+SCORE_BLOCK_ROWS = 65536
+SCORE_BLOCK_CELLS = 1 << 24  # limite de (queries × linhas) por bloco em `search_many`
+
+
+class StringColumn:
+    """Coluna de strings armazenada como um único blob UTF-8 + offsets."""
+
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values: Iterable[Optional[str]]) -> "StringColumn":
+        encoded = [(v if isinstance(v, str) else ("" if v is None else str(v))).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(b"".join(encoded), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+
+class IndexSnapshot:
+    """Visão imutável do índice local em um instante (os aceleradores são anexados depois, ver `accelerators`).
+
+    `matrix` guarda os embeddings normalizados (linhas de norma 1, ou zero para
+    entradas sem embedding); `norms` guarda as normas originais.
+    """
+
+    def __init__(self, columns: Dict[str, StringColumn], matrix: np.ndarray, norms: np.ndarray, signature: Tuple = ()):
+        self.columns = columns
+        self.matrix = matrix
+        self.norms = norms
+        self.signature = signature
+        self.buffer = None  # mmap do arquivo binário, quando houver
+        self.ann = None  # índice aproximado opcional (ver `ann.py`)
+        self.quant = None  # códigos quantizados opcionais (ver `quantization.py`)
+        self.lexical = None  # índice BM25 (ver `lexical.py`)
+        self.accelerators: Optional[Future] = None  # build em background dos três acima
+        self.fingerprint: Optional[int] = None  # `ann.fingerprint`, calculado uma vez para os três
+
+    @classmethod
+    def empty(cls, signature: Tuple = ()) -> "IndexSnapshot":
+        columns = {f: StringColumn.from_strings([]) for f in TEXT_FIELDS}
+        return cls(columns, np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.float32), signature)
+
+    @classmethod
+    def from_entries(cls, entries: Sequence[Dict], signature: Tuple = ()) -> "IndexSnapshot":
+        if not entries:
+            return cls.empty(signature)
+        dim = max((len(e.get("embedding") or []) for e in entries), default=0)
+        matrix = np.zeros((len(entries), dim), dtype=np.float32)
+        for i, e in enumerate(entries):
+            emb = e.get("embedding") or []
+            # entradas com dimensão diferente ficam zeradas (score 0)
+            if len(emb) == dim:
+                matrix[i] = emb
+        columns = {f: StringColumn.from_strings(e.get(f) for e in entries) for f in TEXT_FIELDS}
+        return cls.from_matrix(columns, matrix, signature)
+
+    @classmethod
+    def from_matrix(cls, columns: Dict[str, StringColumn], matrix: np.ndarray, signature: Tuple = ()) -> "IndexSnapshot":
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1).astype(np.float32) if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+        safe = np.where(norms > 0, norms, 1.0).astype(np.float32)
+        matrix /= safe[:, None]
+        return cls(columns, matrix, norms, signature)
+
+    def __len__(self) -> int:
+        return int(self.matrix.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1]) if self.matrix.ndim == 2 else 0
+
+    def scores(self, query_vec: Sequence[float]) -> np.ndarray:
+        """Similaridade cosseno da query contra todas as entradas (um único matvec)."""
+        q = np.asarray(query_vec, dtype=np.float32)
+        qn = float(np.linalg.norm(q))
+        if qn == 0 or q.shape[0] != self.dim:
+            return np.zeros(len(self), dtype=np.float32)
+        q = q / qn
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ q
+        # float16 (mmap): converte em blocos para não materializar a matriz inteira
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = self.matrix[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ q
+        return out
+
+    def scores_many(self, query_vecs: Sequence[Sequence[float]]) -> np.ndarray:
+        """Como `scores`, para várias queries de uma vez: matriz (queries × entradas), um único matmul."""
+        q = np.zeros((len(query_vecs), self.dim), dtype=np.float32)
+        for i, v in enumerate(query_vecs):
+            if len(v) == self.dim:
+                q[i] = v
+        qn = np.linalg.norm(q, axis=1, keepdims=True)
+        q = np.divide(q, qn, out=np.zeros_like(q), where=qn > 0)
+        if self.matrix.dtype == np.float32:
+            return q @ self.matrix.T
+        out = np.empty((len(q), len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = self.matrix[start:start + SCORE_BLOCK_ROWS]
+            out[:, start:start + len(block)] = q @ block.astype(np.float32).T
+        return out
+
+    def search_many(self, query_vecs: Sequence[Sequence[float]], k: int) -> List[List[Tuple[int, float]]]:
+        """`search` para várias queries; sem ANN/quantização, um matmul por bloco de queries."""
+        n = len(self)
+        if n == 0 or k <= 0:
+            return [[] for _ in query_vecs]
+        if self.ann is not None or self.quant is not None:
+            return [self.search(v, k) for v in query_vecs]
+        step = max(1, SCORE_BLOCK_CELLS // n)
+        out: List[List[Tuple[int, float]]] = []
+        for start in range(0, len(query_vecs), step):
+            out.extend(top_k_many(self.scores_many(query_vecs[start:start + step]), k))
+        return out
+
+    def search(self, query_vec: Sequence[float], k: int) -> List[Tuple[int, float]]:
+        """Retorna (linha, score) dos top-k ordenados por score decrescente."""
+        n = len(self)
+        if n == 0 or k <= 0:
+            return []
+        if self.ann is not None:
+            return self.ann.search(self.matrix, query_vec, k)
+        if self.quant is not None:
+            return self.quant.search(query_vec, k, matrix=self.matrix)
+        return top_k(self.scores(query_vec), k)
+
+    def entry(self, row: int, score: Optional[float] = None) -> Dict:
+        doc = {f: self.columns[f][row] or None for f in TEXT_FIELDS}
+        doc["score"] = float(score) if score is not None else None
+        return doc
+
+    def top_k(self, query_vec: Sequence[float], k: int) -> List[Dict]:
+        return [self.entry(row, sc) for row, sc in self.search(query_vec, k)]
+
+
+def top_k(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """Top-k via `argpartition` (O(n)) seguido de ordenação só dos k vencedores."""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return []
+    if k < n:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    return [(int(i), float(scores[i])) for i in idx]
+
+
+def top_k_many(scores: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+    """`top_k` de cada linha de uma matriz (queries × entradas)."""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return [[] for _ in range(scores.shape[0])]
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape)
+    top = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-top, axis=1, kind="stable")
+    idx = np.take_along_axis(idx, order, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return [[(int(i), float(sc)) for i, sc in zip(ri, rs)] for ri, rs in zip(idx.tolist(), top.tolist())]
+
+
+def file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_snapshot(path: Path, signature: Tuple) -> IndexSnapshot:
+    from . import index_format
+
+    if index_format.is_binary_index(path):
+        return index_format.open_snapshot(path, signature)
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return IndexSnapshot.from_entries(data, signature)
+
+
+class LocalIndex:
+    """Índice local compartilhado pelo processo, com hot reload por mtime/tamanho."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._build_lock = threading.Lock()  # um build de aceleradores por vez (mesmos arquivos sidecar)
+        self.reloads = 0
+
+    def snapshot(self, wait: bool = False) -> IndexSnapshot:
+        """Snapshot atual; com `wait=True`, espera também os aceleradores dele ficarem prontos."""
+        snap = self._current()
+        if wait and snap.accelerators is not None:
+            snap.accelerators.result()
+        return snap
+
+    def _current(self) -> IndexSnapshot:
+        sig = file_signature(self.path)
+        current = self._snapshot
+        if current is not None and current.signature == sig:
+            return current
+        with self._lock:
+            current = self._snapshot
+            if current is not None and current.signature == sig:
+                return current
+            if sig is None:
+                logger.info("Índice local não encontrado: %s", self.path)
+                snap = IndexSnapshot.empty(None)
+            else:
+                try:
+                    snap = _read_snapshot(self.path, sig)
+                    self.reloads += 1
+                    logger.info("Índice local carregado: %d entradas (dim=%d)", len(snap), snap.dim)
+                    snap.accelerators = Future()
+                except Exception as e:
+                    logger.error("Falha ao carregar índice local: %s", e)
+                    # mantém a versão anterior (se houver) até o arquivo mudar de novo
+                    if current is not None:
+                        snap = IndexSnapshot(current.columns, current.matrix, current.norms, sig)
+                        snap.ann, snap.quant, snap.lexical = current.ann, current.quant, current.lexical
+                        snap.accelerators = current.accelerators
+                    else:
+                        snap = IndexSnapshot.empty(sig)
+            self._snapshot = snap
+            if snap.accelerators is not None and snap.accelerators is not getattr(current, "accelerators", None):
+                self._start_accelerators(snap)
+            return snap
+
+    def _start_accelerators(self, snap: IndexSnapshot) -> None:
+        threading.Thread(target=self._build_accelerators, args=(snap,), name="fragaz-index-accel",
+                         daemon=True).start()
+
+    def _build_accelerators(self, snap: IndexSnapshot) -> None:
+        with self._build_lock:
+            try:
+                # o arquivo já mudou de novo: o snapshot seguinte terá o seu próprio build
+                if self._snapshot is snap:
+                    self._attach_accelerators(snap)
+            finally:
+                snap.accelerators.set_result(snap)
+
+    def _attach_accelerators(self, snap: IndexSnapshot) -> None:
+        from . import ann, lexical, quantization
+
+        if ann.ann_mode() == "ivf" or quantization.quant_mode() or lexical.lexical_enabled():
+            # uma passada pelo índice inteiro, antes de a quantização trocar a matriz por um mmap
+            snap.fingerprint = ann.fingerprint(snap)
+        try:
+            ann.attach(snap, self.path, snap.fingerprint)
+        except Exception as e:
+            logger.warning("Índice ANN indisponível, usando busca exata: %s", e)
+            snap.ann = None
+        try:
+            quantization.attach(snap, self.path, snap.fingerprint)
+        except Exception as e:
+            logger.warning("Quantização indisponível, usando vetores float: %s", e)
+            snap.quant = None
+        try:
+            lexical.attach(snap, self.path, snap.fingerprint)
+        except Exception as e:
+            logger.warning("Índice BM25 indisponível, usando só a busca vetorial: %s", e)
+            snap.lexical = None
+
+    def search(self, query_vec: Sequence[float], k: int) -> List[Dict]:
+        return self.snapshot().top_k(query_vec, k)
+
+
+_indexes: Dict[Path, LocalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_local_index(path: Path) -> LocalIndex:
+    """Retorna o `LocalIndex` do processo para `path` (criado sob demanda)."""
+    key = Path(path).resolve()
+    idx = _indexes.get(key)
+    if idx is None:
+        with _indexes_lock:
+            idx = _indexes.get(key)
+            if idx is None:
+                idx = _indexes[key] = LocalIndex(key)
+    return idx
@@ -0,0 +1,135 @@
+"""Manifest: ids estáveis de chunks e manifesto por fonte para upsert incremental.
+
+O id de um chunk é derivado da URL da fonte e do hash do conteúdo
+(`<hash da fonte>-<hash do conteúdo>`, com sufixo para parágrafos repetidos na
+mesma página), então reingerir a mesma página produz os mesmos ids. O
+manifesto guarda, por (coleção, fonte), os ids gravados e o hash dos
+metadados de cada um; na reingestão, `services.upsert_source_stream` compara
+cada janela de chunks com `SourceManifest.entries` para saber o que adicionar,
+o que atualizar (mesmo conteúdo, metadados diferentes, ex.: o chunk mudou de
+posição) e o que remover, e grava o resultado com `replace_hashes`.
+
+O mesmo arquivo guarda o ETag / Last-Modified de cada URL buscada pelo
+crawler, para requisições condicionais.
+
+Configuração::
+
+    FRAGAZ_MANIFEST_PATH=.fragaz_manifest.sqlite
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .embedding_cache import normalize_text
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_PATH = ROOT / ".fragaz_manifest.sqlite"
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkIds:
+    """Ids dos chunks de uma fonte, na ordem em que aparecem (para ingestão em janelas)."""
+
+    def __init__(self, source: str):
+        self.prefix = _sha(source)[:16]
+        self._seen: Dict[str, int] = {}
+
+    def __call__(self, chunk: str) -> str:
+        digest = _sha(normalize_text(chunk))[:24]
+        n = self._seen.get(digest, 0)
+        self._seen[digest] = n + 1
+        return f"{self.prefix}-{digest}" if n == 0 else f"{self.prefix}-{digest}-{n}"
+
+
+def chunk_ids(source: str, chunks: Sequence[str]) -> List[str]:
+    return list(map(ChunkIds(source), chunks))
+
+
+def meta_hash(meta: Dict) -> str:
+    return _sha(json.dumps(meta, sort_keys=True, ensure_ascii=False, default=str))[:16]
+
+
+class SourceManifest:
+    def __init__(self, path: Path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS manifest (
+                collection TEXT,
+                source TEXT,
+                chunk_id TEXT,
+                meta_hash TEXT,
+                updated_at REAL,
+                PRIMARY KEY (collection, source, chunk_id)
+            )""")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS fetch_state (
+                collection TEXT,
+                url TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL,
+                PRIMARY KEY (collection, url)
+            )""")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def entries(self, collection: str, source: str) -> Dict[str, str]:
+        rows = self._conn().execute("SELECT chunk_id, meta_hash FROM manifest WHERE collection = ? AND source = ?",
+                                    (collection, source)).fetchall()
+        return dict(rows)
+
+    def has_source(self, collection: str, source: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM manifest WHERE collection = ? AND source = ? LIMIT 1",
+                                    (collection, source)).fetchone() is not None
+
+    def replace_hashes(self, collection: str, source: str, entries: Iterable[Tuple[str, str]]) -> None:
+        """Troca as entradas de `source` pelos pares (id, hash dos metadados de `meta_hash`)."""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM manifest WHERE collection = ? AND source = ?", (collection, source))
+            conn.executemany("INSERT INTO manifest (collection, source, chunk_id, meta_hash, updated_at) VALUES (?, ?, ?, ?, ?)",
+                             ((collection, source, cid, mh, now) for cid, mh in entries))
+
+    def fetch_state(self, collection: str, url: str) -> Tuple[Optional[str], Optional[str]]:
+        row = self._conn().execute("SELECT etag, last_modified FROM fetch_state WHERE collection = ? AND url = ?",
+                                   (collection, url)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def set_fetch_state(self, collection: str, url: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO fetch_state (collection, url, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                         (collection, url, etag, last_modified, time.time()))
+
+    def drop_collection(self, collection: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM manifest WHERE collection = ?", (collection,))
+            conn.execute("DELETE FROM fetch_state WHERE collection = ?", (collection,))
+
+    def stats(self) -> Dict:
+        sources, chunks = self._conn().execute("SELECT COUNT(DISTINCT collection || '\x00' || source), COUNT(*) FROM manifest").fetchone()
+        return {"sources": sources, "chunks": chunks, "path": self.path}
+
+
+def from_env() -> SourceManifest:
+    return SourceManifest(Path(os.environ.get("FRAGAZ_MANIFEST_PATH") or DEFAULT_PATH))
@@ -0,0 +1,376 @@
+"""Quantização dos embeddings do índice local (int8 escalar e product quantization).
+
+A pontuação é assimétrica: a query continua em float32 e é comparada
+diretamente com os códigos quantizados —
+
+- int8: `score = codes @ (q * scale) + q @ offset` (dequantização fatorada na query);
+- PQ: uma tabela de lookup `(m, 256)` com o produto da query por cada centróide
+  de cada subespaço; o score de uma linha é a soma de `m` lookups.
+
+Opcionalmente os `rerank` melhores candidatos são repontuados com os vetores em
+precisão total (somente essas linhas são lidas do arquivo mapeado). Com os
+códigos anexados, a matriz float32 de um índice JSON (que estaria inteira em
+RAM) é gravada em `<índice>.f32.npy` e passa a ser um mmap desse arquivo: em
+memória ficam só os códigos.
+
+Habilitado por deployment via ambiente::
+
+    FRAGAZ_QUANT=int8 | pq     # vazio desabilita
+    FRAGAZ_QUANT_RERANK=50     # 0 = sem rerank
+    FRAGAZ_PQ_M=16             # subespaços do PQ (deve dividir a dimensão)
+
+Medição do recall perdido nos dados reais::
+
+    python -m backend_service.quantization eval .fragaz_index.bin --mode pq --k 10
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .local_index import top_k
+
+logger = logging.getLogger("fragaz.quantization")
+
+SCORE_BLOCK_ROWS = 2048  # blocos pequenos: a conversão int8 -> float32 fica no cache
+PQ_CENTROIDS = 256
+
+
+def quant_mode() -> str:
+    return os.environ.get("FRAGAZ_QUANT", "").strip().lower()
+
+
+def quant_path(index_path: Path, mode: str) -> Path:
+    index_path = Path(index_path)
+    return index_path.with_name(f"{index_path.stem}.{mode}.npz")
+
+
+def _kmeans_l2(x: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+        labels = np.argmax(x @ centroids.T - 0.5 * (centroids * centroids).sum(1), axis=1)
+        counts = np.bincount(labels, minlength=k)
+        nonempty = counts > 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.add.reduceat(x[np.argsort(labels, kind="stable")], starts[nonempty], axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+    return centroids
+
+
+class _Quantizer(ABC):
+    mode = ""
+
+    def __init__(self):
+        self.fingerprint = 0
+        self.rerank = 0
+
+    @abstractmethod
+    def scores(self, q: np.ndarray) -> np.ndarray:
+        ...
+
+    @property
+    @abstractmethod
+    def size(self) -> int:
+        ...
+
+    @property
+    @abstractmethod
+    def dim(self) -> int:
+        ...
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        ...
+
+    @abstractmethod
+    def arrays(self) -> Dict[str, np.ndarray]:
+        ...
+
+    def search(self, query_vec, k: int, matrix: Optional[np.ndarray] = None, rerank: Optional[int] = None) -> List[Tuple[int, float]]:
+        q = np.asarray(query_vec, dtype=np.float32)
+        qn = float(np.linalg.norm(q))
+        if qn == 0 or k <= 0 or q.shape[0] != self.dim:
+            return []
+        q = q / qn
+        rerank = self.rerank if rerank is None else rerank
+        approx = self.scores(q)
+        if matrix is None or rerank <= 0:
+            return top_k(approx, k)
+        cand = np.array([i for i, _ in top_k(approx, max(k, rerank))], dtype=np.int64)
+        cand.sort()
+        exact = np.asarray(matrix[cand], dtype=np.float32) @ q
+        return [(int(cand[i]), sc) for i, sc in top_k(exact, k)]
+
+
+class ScalarQuantizer(_Quantizer):
+    """int8 por dimensão: `x ≈ codes * scale + offset` (4x menor que float32)."""
+
+    mode = "int8"
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray, offset: np.ndarray):
+        super().__init__()
+        self.codes = codes
+        self.scale = scale
+        self.offset = offset
+
+    @classmethod
+    def train(cls, matrix: np.ndarray) -> "ScalarQuantizer":
+        lo = np.full(matrix.shape[1], np.inf, dtype=np.float32)
+        hi = np.full(matrix.shape[1], -np.inf, dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            lo = np.minimum(lo, block.min(0))
+            hi = np.maximum(hi, block.max(0))
+        scale = np.where(hi > lo, (hi - lo) / 255.0, 1.0).astype(np.float32)
+        offset = (lo + 128.0 * scale).astype(np.float32)
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            codes[start:start + len(block)] = np.clip(np.rint((block - offset) / scale), -128, 127)
+        return cls(codes, scale, offset)
+
+    def scores(self, q: np.ndarray) -> np.ndarray:
+        qs = q * self.scale
+        bias = float(q @ self.offset)
+        out = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SCORE_BLOCK_ROWS):
+            block = self.codes[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ qs
+        return out + bias
+
+    @property
+    def size(self) -> int:
+        return int(self.codes.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.codes.shape[1])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scale.nbytes + self.offset.nbytes)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"codes": self.codes, "scale": self.scale, "offset": self.offset}
+
+
+class ProductQuantizer(_Quantizer):
+    """PQ com `m` subespaços de 256 centróides: `m` bytes por vetor."""
+
+    mode = "pq"
+
+    def __init__(self, codes: np.ndarray, codebooks: np.ndarray):
+        super().__init__()
+        self.codes = codes  # (m, n) uint8 — um subespaço por linha, leitura contígua
+        self.codebooks = codebooks  # (m, 256, dsub) float32
+
+    @property
+    def m(self) -> int:
+        return int(self.codebooks.shape[0])
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, m: int = 16, sample: int = 64 * PQ_CENTROIDS, seed: int = 0) -> "ProductQuantizer":
+        n, dim = matrix.shape
+        if dim % m:
+            raise ValueError(f"m={m} não divide a dimensão {dim}")
+        dsub = dim // m
+        rng = np.random.default_rng(seed)
+        train = np.asarray(matrix[np.sort(rng.choice(n, min(n, sample), replace=False))], dtype=np.float32)
+        ks = min(PQ_CENTROIDS, len(train))
+        codebooks = np.zeros((m, PQ_CENTROIDS, dsub), dtype=np.float32)
+        for j in range(m):
+            codebooks[j, :ks] = _kmeans_l2(train[:, j * dsub:(j + 1) * dsub], ks, seed=seed + j)
+        pq = cls(np.empty((m, n), dtype=np.uint8), codebooks)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            pq.codes[:, start:start + len(block)] = pq.encode(block).T
+        return pq
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        dsub = self.codebooks.shape[2]
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            cb = self.codebooks[j]
+            sub = x[:, j * dsub:(j + 1) * dsub]
+            codes[:, j] = np.argmax(sub @ cb.T - 0.5 * (cb * cb).sum(1), axis=1)
+        return codes
+
+    def lookup_table(self, q: np.ndarray) -> np.ndarray:
+        dsub = self.codebooks.shape[2]
+        return np.einsum("jcd,jd->jc", self.codebooks, q.reshape(self.m, dsub))
+
+    def scores(self, q: np.ndarray) -> np.ndarray:
+        lut = self.lookup_table(q)
+        out = np.zeros(self.codes.shape[1], dtype=np.float32)
+        for j in range(self.m):
+            out += lut[j][self.codes[j]]
+        return out
+
+    @property
+    def size(self) -> int:
+        return int(self.codes.shape[1])
+
+    @property
+    def dim(self) -> int:
+        return int(self.m * self.codebooks.shape[2])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.codebooks.nbytes)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"codes": self.codes, "codebooks": self.codebooks}
+
+
+_CLASSES = {"int8": ScalarQuantizer, "pq": ProductQuantizer}
+
+
+def train(matrix: np.ndarray, mode: str, pq_m: int = 16) -> _Quantizer:
+    if mode == "int8":
+        return ScalarQuantizer.train(matrix)
+    if mode == "pq":
+        return ProductQuantizer.train(matrix, m=pq_m)
+    raise ValueError(f"modo de quantização desconhecido: {mode}")
+
+
+def save(quantizer: _Quantizer, path: Path) -> None:
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(tmp, fingerprint=np.array([quantizer.fingerprint], dtype=np.int64), **quantizer.arrays())
+    os.replace(tmp, path)
+
+
+def load(path: Path, mode: str) -> _Quantizer:
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files if name != "fingerprint"}
+        quantizer = _CLASSES[mode](**arrays)
+        quantizer.fingerprint = int(data["fingerprint"][0])
+    return quantizer
+
+
+def attach(snapshot, index_path: Path, fp: Optional[int] = None) -> None:
+    """Anexa o quantizador configurado em `FRAGAZ_QUANT` ao snapshot (carrega do disco ou treina)."""
+    from .ann import fingerprint
+
+    mode = quant_mode()
+    if mode not in _CLASSES or len(snapshot) == 0:
+        return
+    fp = fingerprint(snapshot) if fp is None else fp
+    path = quant_path(index_path, mode)
+    quantizer = None
+    if path.exists():
+        try:
+            quantizer = load(path, mode)
+            if quantizer.fingerprint != fp or quantizer.size != len(snapshot):
+                logger.info("Códigos quantizados obsoletos, retreinando: %s", path)
+                quantizer = None
+        except Exception as e:
+            logger.warning("Falha ao carregar códigos quantizados %s: %s", path, e)
+            quantizer = None
+    if quantizer is None:
+        quantizer = train(snapshot.matrix, mode, pq_m=int(os.environ.get("FRAGAZ_PQ_M", "16")))
+        quantizer.fingerprint = fp
+        try:
+            save(quantizer, path)
+        except OSError as e:
+            logger.warning("Não foi possível persistir códigos quantizados: %s", e)
+        logger.info("Quantização %s treinada: %d entradas, %d bytes", mode, len(snapshot), quantizer.nbytes)
+    quantizer.rerank = int(os.environ.get("FRAGAZ_QUANT_RERANK", "50"))
+    snapshot.quant = quantizer
+    release_matrix(snapshot, index_path)
+
+
+def matrix_path(index_path: Path) -> Path:
+    index_path = Path(index_path)
+    return index_path.with_name(f"{index_path.stem}.f32.npy")
+
+
+def release_matrix(snapshot, index_path: Path) -> None:
+    """Troca a matriz float32 residente por um mmap em disco (só as linhas do rerank são lidas)."""
+    if snapshot.buffer is not None or isinstance(snapshot.matrix, np.memmap):
+        return  # índice binário: a matriz já é um mmap do próprio arquivo
+    path = matrix_path(index_path)
+    tmp = path.with_name(path.name + ".tmp.npy")
+    try:
+        np.save(tmp, snapshot.matrix)
+        os.replace(tmp, path)
+        snapshot.matrix = np.load(path, mmap_mode="r")
+    except OSError as e:
+        logger.warning("Não foi possível mapear a matriz em disco, mantendo-a em memória: %s", e)
+        return
+    logger.info("Matriz float32 liberada da memória (mmap em %s)", path)
+
+
+def evaluate(matrix: np.ndarray, quantizer: _Quantizer, queries: np.ndarray, k: int = 10, rerank: int = 50) -> Dict:
+    """Mede recall@k (com e sem rerank), latência média e compressão frente ao float32."""
+    hits = hits_rr = 0
+    t_q = t_rr = 0.0
+    for q in queries:
+        q = q / np.linalg.norm(q)
+        truth = {i for i, _ in top_k(np.asarray(matrix, dtype=np.float32) @ q, k)}
+        t0 = time.perf_counter()
+        approx = quantizer.search(q, k, rerank=0)
+        t1 = time.perf_counter()
+        reranked = quantizer.search(q, k, matrix=matrix, rerank=rerank)
+        t2 = time.perf_counter()
+        t_q += t1 - t0
+        t_rr += t2 - t1
+        hits += len(truth & {i for i, _ in approx})
+        hits_rr += len(truth & {i for i, _ in reranked})
+    total = max(1, len(queries) * k)
+    float_bytes = matrix.shape[0] * matrix.shape[1] * 4
+    return {
+        "mode": quantizer.mode,
+        "k": k,
+        "recall": hits / total,
+        "recall_rerank": hits_rr / total,
+        "rerank": rerank,
+        "ms_per_query": 1000.0 * t_q / max(1, len(queries)),
+        "ms_per_query_rerank": 1000.0 * t_rr / max(1, len(queries)),
+        "bytes": quantizer.nbytes,
+        "compression": float_bytes / max(1, quantizer.nbytes),
+    }
+
+
+def main(argv=None) -> int:
+    from .local_index import LocalIndex
+
+    parser = argparse.ArgumentParser(prog="python -m backend_service.quantization")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    ev = sub.add_parser("eval", help="mede a perda de recall da quantização no índice local")
+    ev.add_argument("index")
+    ev.add_argument("--mode", choices=sorted(_CLASSES), default="int8")
+    ev.add_argument("--k", type=int, default=10)
+    ev.add_argument("--queries", type=int, default=200)
+    ev.add_argument("--rerank", type=int, default=50)
+    ev.add_argument("--pq-m", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    matrix = LocalIndex(Path(args.index)).snapshot().matrix
+    if not len(matrix):
+        print("índice vazio")
+        return 1
+    rng = np.random.default_rng(0)
+    # queries = vetores do próprio índice com ruído
+    queries = np.asarray(matrix[rng.choice(len(matrix), min(args.queries, len(matrix)))], dtype=np.float32)
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    quantizer = train(matrix, args.mode, pq_m=args.pq_m)
+    report = evaluate(matrix, quantizer, queries, k=args.k, rerank=args.rerank)
+    for key, value in report.items():
+        print(f"{key:>20}: {value:.4f}" if isinstance(value, float) else f"{key:>20}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,208 @@
+"""Rerank: reordenação dos candidatos recuperados com um cross-encoder em CPU.
+
+Opcional (`FRAGAZ_RERANK=1`). Com ele ligado, `/query` recupera um conjunto
+maior de candidatos (`FRAGAZ_RERANK_CANDIDATES`, ex.: 50), pontua os pares
+(pergunta, chunk) com um cross-encoder pequeno (`FRAGAZ_RERANK_MODEL`, via
+`sentence_transformers.CrossEncoder`) num único lote com padding e manda só os
+`k` melhores para a geração.
+
+Scores de pares ficam num cache LRU em memória, pela pergunta normalizada e
+pelo hash do conteúdo do chunk, então perguntas repetidas não pagam o modelo de
+novo. O estágio tem orçamento de latência (`FRAGAZ_RERANK_BUDGET` segundos): se
+a estimativa para os pares que faltam (média móvel do custo por par) não couber
+no orçamento, ele é pulado e a ordem da recuperação é mantida. Sem o modelo
+(dependência ausente, falha de load, ou ainda carregando em background), o
+estágio também é pulado.
+
+Configuração::
+
+    FRAGAZ_RERANK=0
+    FRAGAZ_RERANK_MODEL=cross-encoder/ms-marco-MiniLM-L-6-v2
+    FRAGAZ_RERANK_CANDIDATES=50
+    FRAGAZ_RERANK_BUDGET=0.25
+    FRAGAZ_RERANK_CACHE=10000
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .answer_cache import content_hash
+from .result_cache import normalize_query
+
+logger = logging.getLogger("fragaz.rerank")
+
+Loader = Callable[[str], Any]
+
+
+def _load_cross_encoder(name: str):
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(name, device="cpu")
+
+
+class Reranker:
+    def __init__(self, model_name: str, loader: Optional[Loader] = None, candidates: int = 50, budget: float = 0.25,
+                 cache_size: int = 10000, max_chars: int = 2000):
+        self.model_name = model_name
+        self.candidates = max(1, candidates)
+        self.budget = budget
+        self.cache_size = cache_size
+        self.max_chars = max_chars
+        self._loader = loader or _load_cross_encoder
+        self._model = None
+        self._load_failed = False
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._per_pair: Optional[float] = None  # média móvel de segundos por par
+        self._stats = {"calls": 0, "reranked": 0, "skipped_budget": 0, "skipped_unavailable": 0, "pairs_scored": 0,
+                       "cache_hits": 0, "seconds": 0.0, "over_budget": 0, "top1_changed": 0}
+
+    def model(self):
+        if self._model is not None or self._load_failed:
+            return self._model
+        with self._load_lock:
+            if self._model is None and not self._load_failed:
+                t0 = time.monotonic()
+                try:
+                    self._model = self._loader(self.model_name)
+                    logger.info("Cross-encoder carregado: %s (%.1fs)", self.model_name, time.monotonic() - t0)
+                except Exception as e:
+                    self._load_failed = True
+                    logger.warning("Cross-encoder %s indisponível (%s) — rerank desligado", self.model_name, e)
+        return self._model
+
+    def _key(self, query: str, doc: Dict) -> str:
+        raw = f"{self.model_name}\x00{normalize_query(query)}\x00{content_hash(doc.get('content'))}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def _incr(self, key: str, value=1) -> None:
+        with self._lock:
+            self._stats[key] += value
+
+    def _score_pairs(self, model, query: str, docs: Sequence[Dict]) -> List[float]:
+        pairs = [(query, (d.get("content") or "")[:self.max_chars]) for d in docs]
+        # um lote só: o CrossEncoder faz padding até o maior par do lote
+        scores = model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        return [float(s) for s in scores]
+
+    def rerank(self, query: str, docs: Sequence[Dict], k: int) -> List[Dict]:
+        """Os `k` melhores de `docs` pelo cross-encoder (ou os `k` primeiros, se o estágio for pulado)."""
+        self._incr("calls")
+        docs = list(docs)
+        if len(docs) <= 1:
+            return docs[:k]
+        model = self._model
+        if model is None:
+            # o load (segundos) não cabe no orçamento: carrega em background e pula desta vez
+            if not self._load_failed and self._load_lock.acquire(blocking=False):
+                self._load_lock.release()
+                threading.Thread(target=self.model, name="fragaz-rerank-load", daemon=True).start()
+            self._incr("skipped_unavailable")
+            return docs[:k]
+
+        t0 = time.monotonic()
+        keys = [self._key(query, d) for d in docs]
+        with self._lock:
+            scores: Dict[str, float] = {}
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+            per_pair = self._per_pair
+        missing = [i for i, key in enumerate(keys) if key not in scores]
+        self._incr("cache_hits", len(keys) - len(missing))
+        if missing and per_pair is not None and per_pair * len(missing) > self.budget:
+            with self._lock:
+                self._stats["skipped_budget"] += 1
+                # a estimativa decai para que o estágio volte a ser testado depois de um pico
+                self._per_pair = per_pair * 0.9
+            logger.info("Rerank pulado: %d pares estimados em %.3fs (orçamento %.3fs)", len(missing), per_pair * len(missing), self.budget)
+            return docs[:k]
+
+        if missing:
+            t_model = time.monotonic()
+            try:
+                fresh = self._score_pairs(model, query, [docs[i] for i in missing])
+            except Exception as e:
+                logger.warning("Rerank falhou, mantendo a ordem da recuperação: %s", e)
+                self._incr("skipped_unavailable")
+                return docs[:k]
+            cost = (time.monotonic() - t_model) / len(missing)
+            with self._lock:
+                self._per_pair = cost if self._per_pair is None else 0.8 * self._per_pair + 0.2 * cost
+                for i, score in zip(missing, fresh):
+                    scores[keys[i]] = score
+                    self._cache[keys[i]] = score
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+                self._stats["pairs_scored"] += len(missing)
+
+        order = sorted(range(len(docs)), key=lambda i: -scores[keys[i]])
+        out = [dict(docs[i], rerank_score=scores[keys[i]]) for i in order[:k]]
+        elapsed = time.monotonic() - t0
+        with self._lock:
+            self._stats["reranked"] += 1
+            self._stats["seconds"] += elapsed
+            if elapsed > self.budget:
+                self._stats["over_budget"] += 1
+            if order[0] != 0:
+                self._stats["top1_changed"] += 1
+        return out
+
+    async def rerank_async(self, query: str, docs: Sequence[Dict], k: int) -> List[Dict]:
+        return await asyncio.to_thread(self.rerank, query, docs, k)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats, cache_entries=len(self._cache), per_pair_seconds=self._per_pair)
+        out["model"] = self.model_name
+        out["loaded"] = self._model is not None
+        out["avg_seconds"] = out["seconds"] / out["reranked"] if out["reranked"] else 0.0
+        return out
+
+
+def enabled() -> bool:
+    return os.environ.get("FRAGAZ_RERANK", "0") == "1"
+
+
+def from_env() -> Reranker:
+    return Reranker(
+        os.environ.get("FRAGAZ_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+        candidates=int(os.environ.get("FRAGAZ_RERANK_CANDIDATES", "50")),
+        budget=float(os.environ.get("FRAGAZ_RERANK_BUDGET", "0.25")),
+        cache_size=int(os.environ.get("FRAGAZ_RERANK_CACHE", "10000")),
+    )
+
+
+_reranker: Optional[Reranker] = None
+_reranker_ready = False
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[Reranker]:
+    """Reranker do processo, ou None se o estágio estiver desligado."""
+    global _reranker, _reranker_ready
+    if not _reranker_ready:
+        with _reranker_lock:
+            if not _reranker_ready:
+                _reranker = from_env() if enabled() else None
+                _reranker_ready = True
+    return _reranker
+
+
+def reset_reranker(reranker: Optional[Reranker] = None) -> None:
+    global _reranker, _reranker_ready
+    with _reranker_lock:
+        _reranker, _reranker_ready = reranker, reranker is not None
+
+
+def stats() -> Optional[Dict]:
+    return _reranker.stats() if _reranker is not None else None
@@ -0,0 +1,337 @@
+"""Result cache: cache dos resultados de `retrieve_docs`.
+
+A chave é (coleção, k, texto normalizado da query). Os valores são guardados
+serializados em JSON, o que dá o tamanho exato para o orçamento de memória e
+evita que o chamador altere a entrada em cache.
+
+Backends:
+
+- `MemoryBackend`: LRU em processo com TTL e orçamento em bytes;
+- `SQLiteBackend`: arquivo SQLite compartilhado pelos workers da máquina
+  (as invalidações feitas por um worker valem para todos). O tamanho total
+  fica numa linha de `result_cache_meta` mantida por triggers, como no cache de
+  embeddings: a tabela só é percorrida quando o orçamento estoura.
+
+Invalidação: gravações no Chroma (`add_documents_to_chroma`,
+`delete_collection`) removem as entradas da coleção afetada; resultados vindos
+do índice local guardam a assinatura (mtime/tamanho) do arquivo do índice e
+deixam de valer assim que ele é reescrito. Como o índice local só responde
+quando o Chroma está fora (ou lento), esses resultados ficam no cache por
+`FRAGAZ_RESULT_CACHE_FALLBACK_TTL`, bem menos que o TTL normal: assim que o
+Chroma volta, as perguntas voltam a ser respondidas por ele.
+
+Configuração::
+
+    FRAGAZ_RESULT_CACHE=memory | sqlite | off
+    FRAGAZ_RESULT_CACHE_TTL=300
+    FRAGAZ_RESULT_CACHE_FALLBACK_TTL=30
+    FRAGAZ_RESULT_CACHE_BYTES=67108864
+    FRAGAZ_RESULT_CACHE_PATH=.fragaz_cache.sqlite
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("fragaz.result_cache")
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    return _WS_RE.sub(" ", (text or "").strip().lower())
+
+
+class CacheBackend(ABC):
+    """Interface dos backends: valores são strings JSON, `tag` é a coleção."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, tag: str, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def invalidate_tag(self, tag: str) -> int:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, Tuple[str, str, float, int]]" = OrderedDict()  # valor, tag, expira, bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[2] < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def _drop(self, key: str) -> None:
+        self._bytes -= self._data.pop(key)[3]
+
+    def set(self, key: str, value: str, tag: str, ttl: float) -> None:
+        size = len(value.encode("utf-8"))  # o orçamento é em bytes, não em caracteres
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, tag, time.monotonic() + ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def invalidate_tag(self, tag: str) -> int:
+        with self._lock:
+            keys = [k for k, item in self._data.items() if item[1] == tag]
+            for k in keys:
+                self._drop(k)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._data), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+
+class SQLiteBackend(CacheBackend):
+    """Backend compartilhado entre processos em um arquivo SQLite (WAL)."""
+
+    def __init__(self, path: Path, max_bytes: int = 64 * 1024 * 1024):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.evictions = 0
+        conn = self._conn()
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS result_cache (
+            key TEXT PRIMARY KEY,
+            tag TEXT,
+            value TEXT,
+            size INTEGER,
+            expires REAL,
+            last_access REAL
+        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS result_cache_tag ON result_cache(tag)")
+        conn.execute("CREATE INDEX IF NOT EXISTS result_cache_access ON result_cache(last_access)")
+        conn.commit()
+        self._init_total(conn)
+
+    @staticmethod
+    def _init_total(conn: sqlite3.Connection) -> None:
+        # total corrente de `size`; a soma só é calculada uma vez, ao criar a linha (arquivos antigos)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS result_cache_meta (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO result_cache_meta (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM result_cache")
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS result_cache_total_insert AFTER INSERT ON result_cache
+            BEGIN UPDATE result_cache_meta SET total = total + new.size WHERE id = 0; END""")
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS result_cache_total_delete AFTER DELETE ON result_cache
+            BEGIN UPDATE result_cache_meta SET total = total - old.size WHERE id = 0; END""")
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS result_cache_total_update AFTER UPDATE OF size ON result_cache
+            BEGIN UPDATE result_cache_meta SET total = total + new.size - old.size WHERE id = 0; END""")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _total(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT total FROM result_cache_meta WHERE id = 0").fetchone()[0]
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT value, expires FROM result_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE result_cache SET last_access = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return row[0]
+
+    def set(self, key: str, value: str, tag: str, ttl: float) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        conn = self._conn()
+        now = time.time()
+        # upsert em vez de INSERT OR REPLACE: o REPLACE não dispara o trigger de DELETE
+        conn.execute("INSERT INTO result_cache (key, tag, value, size, expires, last_access) VALUES (?, ?, ?, ?, ?, ?) "
+                     "ON CONFLICT(key) DO UPDATE SET tag = excluded.tag, value = excluded.value, size = excluded.size, "
+                     "expires = excluded.expires, last_access = excluded.last_access",
+                     (key, tag, value, size, now + ttl, now))
+        if self._total(conn) > self.max_bytes:
+            conn.execute("DELETE FROM result_cache WHERE expires < ?", (now,))
+            total = self._total(conn)
+            victims = []
+            for k, size in conn.execute("SELECT key, size FROM result_cache ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                victims.append((k,))
+                total -= size
+            conn.executemany("DELETE FROM result_cache WHERE key = ?", victims)
+            self.evictions += len(victims)
+        conn.commit()
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+        conn.commit()
+
+    def invalidate_tag(self, tag: str) -> int:
+        conn = self._conn()
+        n = conn.execute("DELETE FROM result_cache WHERE tag = ?", (tag,)).rowcount
+        conn.commit()
+        return n
+
+    def clear(self) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM result_cache")
+        conn.commit()
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        entries, size = conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0], self._total(conn)
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes, "evictions": self.evictions, "path": self.path}
+
+
+class RetrievalCache:
+    def __init__(self, backend: CacheBackend, ttl: float = 300.0, fallback_ttl: float = 30.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl  # resultados do índice local (Chroma fora), ver docstring do módulo
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0, "errors": 0}
+
+    def _incr(self, key: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += value
+
+    @staticmethod
+    def key(query: str, k: int, collection: str) -> str:
+        return json.dumps([collection, int(k), normalize_query(query)], ensure_ascii=False)
+
+    def get(self, query: str, k: int, collection: str, validate: Optional[Callable[[Any], bool]] = None):
+        key = self.key(query, k, collection)
+        try:
+            raw = self.backend.get(key)
+        except Exception as e:
+            self._incr("errors")
+            logger.warning("Falha ao ler cache de recuperação: %s", e)
+            return None
+        if raw is None:
+            self._incr("misses")
+            return None
+        entry = json.loads(raw)
+        if validate is not None and not validate(entry.get("meta")):
+            self._incr("stale")
+            self._incr("misses")
+            try:
+                self.backend.delete(key)
+            except Exception as e:
+                self._incr("errors")
+                logger.warning("Falha ao remover entrada obsoleta do cache de recuperação: %s", e)
+            return None
+        self._incr("hits")
+        return entry["value"]
+
+    def put(self, query: str, k: int, collection: str, value: Any, meta: Any = None, ttl: Optional[float] = None) -> None:
+        try:
+            payload = json.dumps({"value": value, "meta": meta}, ensure_ascii=False)
+            self.backend.set(self.key(query, k, collection), payload, collection, self.ttl if ttl is None else ttl)
+        except Exception as e:
+            self._incr("errors")
+            logger.warning("Falha ao gravar cache de recuperação: %s", e)
+
+    def invalidate(self, collection: str) -> int:
+        n = self.backend.invalidate_tag(collection)
+        self._incr("invalidations")
+        logger.info("Cache de recuperação invalidado: coleção=%s (%d entradas)", collection, n)
+        return n
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+        total = out["hits"] + out["misses"]
+        out["hit_rate"] = out["hits"] / total if total else 0.0
+        out.update(self.backend.stats())
+        return out
+
+
+def from_env(root: Path) -> Optional[RetrievalCache]:
+    mode = os.environ.get("FRAGAZ_RESULT_CACHE", "memory").strip().lower()
+    if mode in ("", "0", "off", "none"):
+        return None
+    max_bytes = int(os.environ.get("FRAGAZ_RESULT_CACHE_BYTES", str(64 * 1024 * 1024)))
+    ttl = float(os.environ.get("FRAGAZ_RESULT_CACHE_TTL", "300"))
+    fallback_ttl = float(os.environ.get("FRAGAZ_RESULT_CACHE_FALLBACK_TTL", "30"))
+    if mode == "sqlite":
+        path = Path(os.environ.get("FRAGAZ_RESULT_CACHE_PATH") or (root / ".fragaz_cache.sqlite"))
+        backend: CacheBackend = SQLiteBackend(path, max_bytes=max_bytes)
+    else:
+        backend = MemoryBackend(max_bytes=max_bytes)
+    return RetrievalCache(backend, ttl=ttl, fallback_ttl=min(ttl, fallback_ttl))
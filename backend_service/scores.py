@@ -0,0 +1,269 @@
+"""Scores: confiança composta das respostas do `/query`.
+
+    C = α·Rs + β·Cs + γ·Fs + δ·FS     (pesos normalizados; cada termo em 0..1)
+
+- `Rs` (recuperação): média dos scores das fontes com peso 1/log(i+1) pela
+  posição, como num DCG;
+- `Cs` (consistência): similaridade média entre a resposta e cada fonte;
+- `Fs` (fidelidade): 1 - frases sem suporte / frases da resposta;
+- `FS` (fatos): suporte médio das frases, ponderado pelo tamanho de cada uma
+  (suporte = maior similaridade da frase com alguma fonte).
+
+As funções `*_scores` recebem lotes (uma linha por resposta; listas de tamanhos
+diferentes vêm completadas com NaN por `pad`) e são vetorizadas com NumPy; as
+versões escalares (`retrieval_score`, ...) são a mesma conta para uma resposta.
+
+`Rs` usa as similaridades que a recuperação já devolve. A resposta não tem
+embedding no pipeline e codificá-la seria mais uma chamada ao modelo, então
+`Cs`/`Fs`/`FS` comparam vetores de termos com hashing (`hashed_vectors`),
+calculados em CPU em microssegundos por resposta.
+
+Configuração::
+
+    FRAGAZ_CONFIDENCE_WEIGHTS=0.40,0.25,0.20,0.15
+    FRAGAZ_CONFIDENCE_SUPPORT=0.35
+"""
+from __future__ import annotations
+
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .chunking import split_sentences
+
+DEFAULT_WEIGHTS = (0.40, 0.25, 0.20, 0.15)
+
+_WORD_RE = re.compile(r"\w{3,}", re.UNICODE)
+_buckets: Dict[str, int] = {}
+_MAX_BUCKETS = 200_000
+BATCH_SLICE = 256
+
+
+def clamp01(x: float) -> float:
+    return max(0.0, min(1.0, float(x)))
+
+
+def pad(rows: Sequence[Sequence[float]], width: Optional[int] = None) -> np.ndarray:
+    """Lista de listas (tamanhos diferentes) -> matriz float64 completada com NaN."""
+    width = max((len(r) for r in rows), default=0) if width is None else width
+    out = np.full((len(rows), width), np.nan)
+    for i, r in enumerate(rows):
+        n = min(len(r), width)
+        if n:
+            out[i, :n] = np.asarray(r[:n], dtype=np.float64)
+    return out
+
+
+def _2d(x) -> np.ndarray:
+    a = np.asarray(x, dtype=np.float64)
+    return a.reshape(1, -1) if a.ndim < 2 else a
+
+
+def _masked_mean(a: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    valid = ~np.isnan(a)
+    w = valid.astype(np.float64) if weights is None else np.where(valid, weights, 0.0)
+    num = (w * np.where(valid, a, 0.0)).sum(axis=1)
+    den = w.sum(axis=1)
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+
+def retrieval_scores(sims) -> np.ndarray:
+    s = _2d(sims)
+    w = 1.0 / np.log(np.arange(2, s.shape[1] + 2, dtype=np.float64))
+    return np.clip(_masked_mean(np.clip(s, 0.0, 1.0), np.broadcast_to(w, s.shape)), 0.0, 1.0)
+
+
+def consistency_scores(resp_chunk_sims) -> np.ndarray:
+    return np.clip(_masked_mean(_2d(resp_chunk_sims)), 0.0, 1.0)
+
+
+def faithfulness_scores(n_unsupported, n_total, eps: float = 1e-6) -> np.ndarray:
+    u = np.atleast_1d(np.asarray(n_unsupported, dtype=np.float64))
+    n = np.atleast_1d(np.asarray(n_total, dtype=np.float64))
+    return np.where(n <= 0, 1.0, np.clip(1.0 - u / (n + eps), 0.0, 1.0))
+
+
+def fact_scores(entail_probs, weights=None) -> np.ndarray:
+    p = np.clip(_2d(entail_probs), 0.0, 1.0)
+    plain = _masked_mean(p)
+    if weights is None:
+        return np.clip(plain, 0.0, 1.0)
+    w = np.maximum(_2d(weights)[:, :p.shape[1]], 0.0)
+    w = np.where(np.isnan(w), 0.0, w)
+    weighted = _masked_mean(p, np.broadcast_to(w, p.shape))
+    # sem peso positivo (ou sem pesos para as frases), cai na média simples
+    has_weight = np.where(np.isnan(p), 0.0, np.broadcast_to(w, p.shape)).sum(axis=1) > 0
+    return np.clip(np.where(has_weight, weighted, plain), 0.0, 1.0)
+
+
+def confidence_scores(Rs, Cs, Fs, FS, weights: Sequence[float] = DEFAULT_WEIGHTS) -> np.ndarray:
+    w = np.asarray(weights, dtype=np.float64)
+    total = w.sum()
+    w = w / (total if total > 0 else 1.0)
+    parts = np.stack([np.clip(np.atleast_1d(np.asarray(x, dtype=np.float64)), 0.0, 1.0) for x in (Rs, Cs, Fs, FS)])
+    return np.clip(w @ parts, 0.0, 1.0)
+
+
+def retrieval_score(similarities_01: List[float]) -> float:
+    return float(retrieval_scores([similarities_01])[0]) if similarities_01 else 0.0
+
+
+def consistency_score(resp_chunk_sim_01: List[float]) -> float:
+    return float(consistency_scores([resp_chunk_sim_01])[0]) if resp_chunk_sim_01 else 0.0
+
+
+def faithfulness_score(n_unsupported: int, n_total: int, eps: float = 1e-6) -> float:
+    return float(faithfulness_scores(n_unsupported, n_total, eps)[0])
+
+
+def fact_score(entail_probs_01: List[float], weights: Optional[List[float]] = None) -> float:
+    if not entail_probs_01:
+        return 0.0
+    if weights is not None:
+        weights = pad([weights], len(entail_probs_01))
+    return float(fact_scores([entail_probs_01], weights)[0])
+
+
+def confidence_score(Rs: float, Cs: float, Fs: float, FS: float,
+                     alpha: float = 0.40, beta: float = 0.25,
+                     gamma: float = 0.20, delta: float = 0.15) -> float:
+    return float(confidence_scores(Rs, Cs, Fs, FS, (alpha, beta, gamma, delta))[0])
+
+
+def _code(term: str) -> int:
+    code = zlib.crc32(term.encode("utf-8"))
+    if len(_buckets) < _MAX_BUCKETS:
+        _buckets[term] = code
+    return code
+
+
+def _term_counts(texts: Sequence[str], dim: int) -> Tuple[np.ndarray, List[int]]:
+    """Contagem de termos por texto (hashing em `dim` posições) e o número de termos de cada um."""
+    get = _buckets.get
+    counts: List[int] = []
+    codes: List[int] = []
+    for text in texts:
+        terms = _WORD_RE.findall(text.lower())
+        found = [get(t) for t in terms]
+        if None in found:
+            found = [c if c is not None else _code(t) for c, t in zip(found, terms)]
+        counts.append(len(found))
+        codes.extend(found)
+    rows = np.repeat(np.arange(len(texts), dtype=np.int64), counts)
+    flat = np.bincount(rows * dim + np.asarray(codes, dtype=np.int64) % dim, minlength=len(texts) * dim)
+    return flat.reshape(len(texts), dim).astype(np.float32), counts
+
+
+def _normalize(counts: np.ndarray) -> np.ndarray:
+    m = np.log1p(counts)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return np.divide(m, norms, out=np.zeros_like(m), where=norms > 0)
+
+
+def hashed_vectors(texts: Sequence[str], dim: int = 1024) -> np.ndarray:
+    """Vetores de termos (tf sublinear, hashing em `dim` posições), normalizados."""
+    return _normalize(_term_counts(texts, dim)[0])
+
+
+class ConfidenceScorer:
+    def __init__(self, weights: Sequence[float] = DEFAULT_WEIGHTS, support_threshold: float = 0.35, dim: int = 1024):
+        self.weights = tuple(float(w) for w in weights)
+        self.support_threshold = support_threshold
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._stats = {"responses": 0, "batches": 0, "seconds": 0.0}
+
+    def _evidence(self, answers: Sequence[str], sources: Sequence[Sequence[Dict]]):
+        """Similaridades resposta×fonte e suporte por frase; os textos do lote são vetorizados de uma vez."""
+        sentences = [split_sentences(a) or ([a] if a.strip() else []) for a in answers]
+        chunks = [[s.get("content") or "" for s in srcs] for srcs in sources]
+        texts = [t for sents in sentences for t in sents]
+        n_sentences = len(texts)
+        texts.extend(t for cs in chunks for t in cs)
+        counts, n_terms = _term_counts(texts, self.dim)
+        vecs = _normalize(counts)
+
+        resp_chunk, support, lengths = [], [], []
+        s0, c0 = 0, n_sentences
+        for sents, cs in zip(sentences, chunks):
+            ns, nc = len(sents), len(cs)
+            # o vetor da resposta é a soma das contagens das suas frases (sem tokenizar de novo)
+            answer = _normalize(counts[s0:s0 + ns].sum(axis=0, keepdims=True))
+            if nc:
+                sims = vecs[c0:c0 + nc] @ np.concatenate([answer, vecs[s0:s0 + ns]]).T
+                resp_chunk.append(sims[:, 0])
+                support.append(sims[:, 1:].max(axis=0) if ns else np.zeros(0))
+            else:
+                resp_chunk.append([])
+                support.append(np.zeros(ns))
+            lengths.append(n_terms[s0:s0 + ns])
+            s0, c0 = s0 + ns, c0 + nc
+        return resp_chunk, support, lengths
+
+    def score_batch(self, answers: Sequence[str], sources: Sequence[Sequence[Dict]]) -> List[Dict]:
+        t0 = time.perf_counter()
+        out: List[Dict] = []
+        # fatias limitam a matriz de vetores de termos (textos × dim) em lotes grandes
+        for i in range(0, len(answers), BATCH_SLICE):
+            out.extend(self._score_slice(answers[i:i + BATCH_SLICE], sources[i:i + BATCH_SLICE]))
+        with self._lock:
+            self._stats["responses"] += len(answers)
+            self._stats["batches"] += 1
+            self._stats["seconds"] += time.perf_counter() - t0
+        return out
+
+    def _score_slice(self, answers: Sequence[str], sources: Sequence[Sequence[Dict]]) -> List[Dict]:
+        sims = [[float(s["score"]) for s in srcs if isinstance(s.get("score"), (int, float))] for srcs in sources]
+        resp_chunk, support, lengths = self._evidence(answers, sources)
+        support_m = pad(support)
+        rs = retrieval_scores(pad(sims))
+        cs = consistency_scores(pad(resp_chunk))
+        fs = faithfulness_scores(np.sum(support_m < self.support_threshold, axis=1), np.sum(~np.isnan(support_m), axis=1))
+        fact = fact_scores(support_m, pad(lengths, support_m.shape[1]))
+        total = confidence_scores(rs, cs, fs, fact, self.weights)
+        return [{"score": round(float(c), 4), "Rs": round(float(r), 4), "Cs": round(float(x), 4),
+                 "Fs": round(float(f), 4), "FS": round(float(g), 4)}
+                for c, r, x, f, g in zip(total, rs, cs, fs, fact)]
+
+    def score(self, answer: str, sources: Sequence[Dict]) -> Dict:
+        return self.score_batch([answer], [sources])[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+        out["weights"] = list(self.weights)
+        out["avg_us_per_response"] = 1e6 * out["seconds"] / out["responses"] if out["responses"] else 0.0
+        return out
+
+
+def from_env() -> ConfidenceScorer:
+    raw = os.environ.get("FRAGAZ_CONFIDENCE_WEIGHTS", "").strip()
+    weights = tuple(float(v) for v in raw.split(",")) if raw else DEFAULT_WEIGHTS
+    if len(weights) != 4 or not all(math.isfinite(w) for w in weights):
+        weights = DEFAULT_WEIGHTS
+    return ConfidenceScorer(weights, support_threshold=float(os.environ.get("FRAGAZ_CONFIDENCE_SUPPORT", "0.35")))
+
+
+_scorer: Optional[ConfidenceScorer] = None
+
+
+def get_scorer() -> ConfidenceScorer:
+    global _scorer
+    if _scorer is None:
+        _scorer = from_env()
+    return _scorer
+
+
+def reset_scorer(scorer: Optional[ConfidenceScorer] = None) -> None:
+    global _scorer
+    _scorer = scorer
+
+
+def stats() -> Optional[Dict]:
+    return _scorer.stats() if _scorer is not None else None
@@ -4,12 +4,22 @@ Este módulo centraliza a lógica de acesso ao ChromaDB, OCI e geração de embe
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import os
 import time
+from concurrent.futures import wait
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import (chroma_pool, context_packer, coordinator, embeddings, extractive, generation, index_format, ingestion,
+               lexical, llm, llm_limits, manifest, rerank, result_cache, scores, vector_writer)
+from .chroma_pool import ChromaUnavailable, get_pool
+from .coordinator import RetrievalCoordinator
+from .local_index import file_signature, get_local_index
+from .manifest import SourceManifest
+from .result_cache import RetrievalCache
 
 logger = logging.getLogger("fragaz.services")
 
@@ -22,6 +32,7 @@ from db_classes.services.log_acao_service import LogAcaoService
 
 ROOT = Path(__file__).resolve().parent.parent
 INDEX_FILE = ROOT / ".fragaz_index.json"
+INDEX_BIN_FILE = ROOT / ".fragaz_index.bin"
 CHROMA_DIR = ROOT / ".chromadb_fragaz"
 
 
@@ -54,12 +65,20 @@ def _cosine_sim(a: List[float], b: List[float]) -> float:
         return dot / (lena * lenb)
 
 
+def index_path() -> Path:
+    """Arquivo do índice local: o binário (`.fragaz_index.bin`) tem preferência sobre o JSON."""
+    return index_format.preferred_index_path(INDEX_FILE, INDEX_BIN_FILE)
+
+
 def load_index() -> List[Dict]:
-    if not INDEX_FILE.exists():
-        logger.info("Índice local não encontrado: %s", INDEX_FILE)
+    path = index_path()
+    if not path.exists():
+        logger.info("Índice local não encontrado: %s", path)
         return []
     try:
-        return json.loads(INDEX_FILE.read_text(encoding="utf-8"))
+        if index_format.is_binary_index(path):
+            return index_format.read_entries(path)
+        return json.loads(path.read_text(encoding="utf-8"))
     except Exception as e:
         logger.error("Falha ao carregar índice local: %s", e)
         return []
@@ -79,6 +98,7 @@ def get_oci_client():
 
 
 def get_chroma_client():
+    """Cria um cliente Chroma novo; no caminho quente use `chroma_pool.get_pool()`."""
     try:
         import chromadb as _chromadb
         chroma_host = os.environ.get("CHROMA_SERVER_IP")
@@ -99,55 +119,404 @@ def get_chroma_client():
         return None
 
 
-def retrieve_docs(query: str, k: int = 5) -> List[Dict]:
+async def get_async_chroma_client():
+    """Cliente `chromadb.AsyncHttpClient` para o Chroma remoto; no caminho quente use `chroma_pool.get_async_chroma()`."""
+    try:
+        import chromadb as _chromadb
+
+        chroma_token = os.environ.get("CHROMA_AUTH_TOKEN")
+        return await _chromadb.AsyncHttpClient(host=os.environ["CHROMA_SERVER_IP"], port=int(os.environ["CHROMA_SERVER_PORT"]),
+                                               headers={"X-Chroma-Token": chroma_token})
+    except Exception as e:
+        logger.warning("Chroma client assíncrono não disponível: %s", e)
+        return None
+
+
+def _chroma_results(res: Dict, row: int = 0) -> List[Dict]:
     results = []
-    client = get_chroma_client()
-    if client:
-        try:
-            collection_name = os.environ.get("COLLECTION_NAME", "fragaz")
-            coll = client.get_collection(collection_name)
-            res = coll.query(query_texts=[query], n_results=k, include=["documents", "metadatas", "ids", "distances"])  # type: ignore
-            ids = res.get("ids", [[]])[0]
-            docs = res.get("documents", [[]])[0]
-            metas = res.get("metadatas", [[]])[0]
-            dists = res.get("distances", [[]])[0]
-            for _id, doc, meta, dist in zip(ids, docs, metas, dists):
-                results.append({
-                    "id": _id,
-                    "title": meta.get("title") if isinstance(meta, dict) else None,
-                    "content": doc,
-                    "source": meta.get("source") if isinstance(meta, dict) else None,
-                    "score": float(max(0.0, 1.0 - dist)) if isinstance(dist, (int, float)) else None,
-                })
-            if results:
-                logger.info("Recuperado %d docs de Chroma", len(results))
-                return results
-        except Exception as e:
-            logger.exception("Chroma falhou: %s", e)
-
-    entries = load_index()
-    if not entries:
-        logger.info("Nenhum documento local para recuperar.")
-        return []
-    # entries expected as dicts with 'embedding'
-    qv = _embed_text(query, dim=len(entries[0].get('embedding', [])) if entries and entries[0].get('embedding') else 128)
-    scored = [(e, _cosine_sim(qv, e.get('embedding', []))) for e in entries]
-    scored.sort(key=lambda t: t[1], reverse=True)
-    for e, sc in scored[:k]:
+    ids = res.get("ids", [[]])[row]
+    docs = res.get("documents", [[]])[row]
+    metas = res.get("metadatas", [[]])[row]
+    dists = res.get("distances", [[]])[row]
+    for _id, doc, meta, dist in zip(ids, docs, metas, dists):
         results.append({
-            "id": e.get('id'),
-            "title": e.get('title'),
-            "content": e.get('content'),
-            "source": e.get('source'),
-            "score": float(sc),
+            "id": _id,
+            "title": meta.get("title") if isinstance(meta, dict) else None,
+            "content": doc,
+            "source": meta.get("source") if isinstance(meta, dict) else None,
+            "score": float(max(0.0, 1.0 - dist)) if isinstance(dist, (int, float)) else None,
+            "chunk_index": meta.get("chunk_index") if isinstance(meta, dict) else None,
+            "section": meta.get("section") if isinstance(meta, dict) else None,
         })
+    return results
+
+
+def retrieve_chroma(query: str, k: int = 5, query_vector: Optional[List[float]] = None) -> List[Dict]:
+    """Consulta o Chroma com o embedding da pergunta (o mesmo modelo que gravou os chunks)."""
+    collection_name = os.environ.get("COLLECTION_NAME", "fragaz")
+    if query_vector is None:
+        query_vector = embeddings.get_embedding_service().encode([query], use_cache=False, lane=embeddings.QUERY)[0]
+    with get_pool().collection(collection_name) as coll:
+        res = coll.query(query_embeddings=[query_vector], n_results=k, include=["documents", "metadatas", "distances"])
+    results = _chroma_results(res)
+    logger.info("Recuperado %d docs de Chroma", len(results))
+    return results
+
+
+async def retrieve_chroma_async(query: str, k: int = 5) -> List[Dict]:
+    """Como `retrieve_chroma`, sem prender uma thread enquanto espera o Chroma.
+
+    O embedding da pergunta (CPU) roda no executor de perguntas do serviço de
+    embeddings e a consulta vai por `query_embeddings`. Sem Chroma remoto, ou
+    sem cliente assíncrono (chromadb antigo, falha ao criar), a versão
+    síncrona roda numa thread com o mesmo embedding.
+    """
+    qv = (await embeddings.get_embedding_service().encode_async([query], use_cache=False))[0]
+    chroma = chroma_pool.get_async_chroma()
+    if chroma is None:
+        return await asyncio.to_thread(retrieve_chroma, query, k, qv)
+    collection_name = os.environ.get("COLLECTION_NAME", "fragaz")
+    try:
+        coll = await chroma.collection(collection_name)
+    except ChromaUnavailable as e:
+        logger.info("Cliente Chroma assíncrono indisponível (%s); usando o pool síncrono", e)
+        return await asyncio.to_thread(retrieve_chroma, query, k, qv)
+    res = await coll.query(query_embeddings=[qv], n_results=k, include=["documents", "metadatas", "distances"])
+    results = _chroma_results(res)
+    logger.info("Recuperado %d docs de Chroma (async)", len(results))
+    return results
+
+
+def retrieve_chroma_many(queries: Sequence[str], k: int = 5) -> List[List[Dict]]:
+    """Várias perguntas numa única chamada `coll.query`, com os embeddings calculados num lote só."""
+    collection_name = os.environ.get("COLLECTION_NAME", "fragaz")
+    vectors = embeddings.get_embedding_service().encode(list(queries), use_cache=False, lane=embeddings.QUERY)
+    with get_pool().collection(collection_name) as coll:
+        res = coll.query(query_embeddings=vectors, n_results=k, include=["documents", "metadatas", "distances"])
+    results = [_chroma_results(res, row=i) for i in range(len(queries))]
+    logger.info("Recuperado lote de %d perguntas do Chroma", len(queries))
+    return results
+
+
+def retrieve_local(query: str, k: int = 5) -> List[Dict]:
+    snapshot = get_local_index(index_path()).snapshot()
+    if not len(snapshot):
+        logger.info("Nenhum documento local para recuperar.")
+        return []
+    qv = _embed_text(query, dim=snapshot.dim or 128)
+    results = lexical.hybrid_top_k(snapshot, query, qv, k)
     logger.info("Recuperado %d docs do índice local", len(results))
     return results
 
 
+def retrieve_local_many(queries: Sequence[str], k: int = 5) -> List[List[Dict]]:
+    snapshot = get_local_index(index_path()).snapshot()
+    if not len(snapshot):
+        logger.info("Nenhum documento local para recuperar.")
+        return [[] for _ in queries]
+    vectors = [_embed_text(q, dim=snapshot.dim or 128) for q in queries]
+    results = lexical.hybrid_top_k_many(snapshot, list(queries), vectors, k)
+    logger.info("Recuperado lote de %d perguntas do índice local", len(queries))
+    return results
+
+
+_coordinator: Optional[RetrievalCoordinator] = None
+
+
+def get_coordinator() -> RetrievalCoordinator:
+    global _coordinator
+    if _coordinator is None:
+        _coordinator = coordinator.from_env(retrieve_chroma, retrieve_local, primary_async=retrieve_chroma_async,
+                                            primary_many=retrieve_chroma_many, fallback_many=retrieve_local_many)
+    return _coordinator
+
+
+def reset_coordinator(c: Optional[RetrievalCoordinator] = None) -> None:
+    global _coordinator
+    _coordinator = c
+
+
+_result_cache: Optional[RetrievalCache] = None
+_result_cache_ready = False
+
+
+def get_result_cache() -> Optional[RetrievalCache]:
+    global _result_cache, _result_cache_ready
+    if not _result_cache_ready:
+        _result_cache = result_cache.from_env(ROOT)
+        _result_cache_ready = True
+    return _result_cache
+
+
+def reset_result_cache(cache: Optional[RetrievalCache] = None) -> None:
+    global _result_cache, _result_cache_ready
+    _result_cache, _result_cache_ready = cache, cache is not None
+
+
+def _local_index_tag() -> List:
+    path = index_path()
+    sig = file_signature(path)
+    return [str(path), list(sig) if sig else None]
+
+
+def _cached_entry_valid(meta: Optional[Dict]) -> bool:
+    # resultados do índice local valem enquanto o arquivo do índice não mudar
+    if meta and meta.get("origin") == "fallback":
+        return meta.get("index") == _local_index_tag()
+    return True
+
+
+def _cache_results(cache: RetrievalCache, query: str, k: int, collection_name: str, results: List[Dict],
+                   origin: str, index_tag) -> None:
+    if origin == "fallback":
+        # índice local só responde com o Chroma fora: TTL curto para voltar ao Chroma quando ele voltar
+        cache.put(query, k, collection_name, results, {"origin": origin, "index": index_tag}, ttl=cache.fallback_ttl)
+    else:
+        cache.put(query, k, collection_name, results, {"origin": origin})
+
+
+def retrieve_docs(query: str, k: int = 5) -> List[Dict]:
+    """Chroma com hedge/circuit breaker para o índice local (ver `coordinator.py`), com cache."""
+    collection_name = os.environ.get("COLLECTION_NAME", "fragaz")
+    cache = get_result_cache()
+    if cache is not None:
+        cached = cache.get(query, k, collection_name, validate=_cached_entry_valid)
+        if cached is not None:
+            return cached
+    index_tag = _local_index_tag()
+    results, origin = get_coordinator().retrieve_with_origin(query, k)
+    if cache is not None and results:
+        _cache_results(cache, query, k, collection_name, results, origin, index_tag)
+    return results
+
+
+async def retrieve_docs_async(query: str, k: int = 5) -> List[Dict]:
+    """Versão assíncrona de `retrieve_docs` (mesmo cache, mesmo coordinator)."""
+    collection_name = os.environ.get("COLLECTION_NAME", "fragaz")
+    cache = get_result_cache()
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, query, k, collection_name, _cached_entry_valid)
+        if cached is not None:
+            return cached
+    index_tag = _local_index_tag()
+    results, origin = await get_coordinator().retrieve_with_origin_async(query, k)
+    if cache is not None and results:
+        await asyncio.to_thread(_cache_results, cache, query, k, collection_name, results, origin, index_tag)
+    return results
+
+
+async def retrieve_ranked_async(query: str, k: int = 5) -> List[Dict]:
+    """`retrieve_docs_async` + rerank opcional: recupera mais candidatos e fica com os `k` melhores."""
+    reranker = rerank.get_reranker()
+    if reranker is None:
+        return await retrieve_docs_async(query, k)
+    candidates = await retrieve_docs_async(query, max(k, reranker.candidates))
+    return await reranker.rerank_async(query, candidates, k)
+
+
+def retrieve_docs_many(queries: Sequence[str], k: int = 5) -> List[List[Dict]]:
+    """`retrieve_docs` para várias perguntas: cache por pergunta, o resto numa consulta em lote."""
+    collection_name = os.environ.get("COLLECTION_NAME", "fragaz")
+    cache = get_result_cache()
+    out: List[Optional[List[Dict]]] = [None] * len(queries)
+    if cache is not None:
+        for i, q in enumerate(queries):
+            out[i] = cache.get(q, k, collection_name, validate=_cached_entry_valid)
+    missing = [i for i, res in enumerate(out) if res is None]
+    if missing:
+        index_tag = _local_index_tag()
+        found = get_coordinator().retrieve_many_with_origin([queries[i] for i in missing], k)
+        for i, (results, origin) in zip(missing, found):
+            out[i] = results
+            if cache is not None and results:
+                _cache_results(cache, queries[i], k, collection_name, results, origin, index_tag)
+    return [res or [] for res in out]
+
+
+def retrieve_ranked_many(queries: Sequence[str], k: int = 5) -> List[List[Dict]]:
+    """`retrieve_docs_many` + rerank opcional (um lote do cross-encoder por pergunta)."""
+    reranker = rerank.get_reranker()
+    if reranker is None:
+        return retrieve_docs_many(queries, k)
+    candidates = retrieve_docs_many(queries, max(k, reranker.candidates))
+    return [reranker.rerank(q, docs, k) for q, docs in zip(queries, candidates)]
+
+
 def add_documents_to_chroma(collection_name: str, documents: List[str], metadatas: List[Dict], ids: List[str], embeddings: Optional[List[List[float]]] = None):
-    client = get_chroma_client()
-    if not client:
-        raise RuntimeError("Chroma client não disponível")
-    coll = client.get_or_create_collection(collection_name)
-    coll.add(documents=documents, metadatas=metadatas, ids=ids, embeddings=embeddings)
+    try:
+        vector_writer.get_writer(collection_name).write("add", ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+    except ChromaUnavailable as e:
+        raise RuntimeError("Chroma client não disponível") from e
+    finally:
+        _invalidate_ingested(collection_name, ids)
+
+
+_manifest: Optional[SourceManifest] = None
+
+
+def get_manifest() -> SourceManifest:
+    global _manifest
+    if _manifest is None:
+        _manifest = manifest.from_env()
+    return _manifest
+
+
+def reset_manifest(m: Optional[SourceManifest] = None) -> None:
+    global _manifest
+    _manifest = m
+
+
+def _legacy_ids(coll, source: str, keep: set) -> List[str]:
+    """Ids gravados para `source` antes do manifesto existir (ids por timestamp)."""
+    try:
+        res = coll.get(where={"source": source}, include=[])
+    except Exception as e:
+        logger.info("Não foi possível listar chunks antigos de %s: %s", source, e)
+        return []
+    return [cid for cid in (res.get("ids") or []) if cid not in keep]
+
+
+def upsert_source(collection_name: str, source: str, chunks: Sequence[str], metadatas: Sequence[Dict],
+                  embed: Optional[Callable[[List[str]], List[List[float]]]] = None) -> Dict:
+    """Reingere uma fonte: só grava chunks novos, atualiza os alterados e remove os que sumiram."""
+    return upsert_source_stream(collection_name, source, zip(chunks, metadatas), embed=embed)
+
+
+def upsert_source_stream(collection_name: str, source: str, chunks: Iterable[Tuple[str, Dict]],
+                         embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                         window: Optional[int] = None, on_window: Optional[Callable[[int], None]] = None) -> Dict:
+    """`upsert_source` sobre um iterável de (texto, metadados), em janelas de `FRAGAZ_INGEST_WINDOW` chunks.
+
+    Cada janela é comparada com o manifesto, codificada e enviada ao writer
+    antes da próxima ser lida, e só uma janela fica em voo enquanto a seguinte
+    é preparada: textos e vetores em memória não crescem com o tamanho da
+    página. Do documento inteiro ficam só os ids e os hashes de metadados,
+    usados no fim para remover os chunks que sumiram e atualizar o manifesto.
+
+    `on_window(chunks_lidos)` é chamado a cada janela enviada (progresso do job);
+    se ele levantar exceção (ex.: `JobCancelled`), a ingestão para ali, depois
+    que a janela em voo termina, e o manifesto fica como estava: a próxima
+    ingestão da fonte refaz o diff (o upsert é idempotente pelo id).
+    """
+    window = max(1, window or int(os.environ.get("FRAGAZ_INGEST_WINDOW", "256")))
+    man = get_manifest()
+    first_time = not man.has_source(collection_name, source)
+    old = man.entries(collection_name, source)
+    encode = embed or embeddings.get_embedding_service().encode
+    writer = vector_writer.get_writer(collection_name)
+    chunk_id = manifest.ChunkIds(source)
+    counts = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    entries: List[Tuple[str, str]] = []
+    touched: List[str] = []
+    in_flight: List = []
+
+    def settle(futures: List) -> None:
+        errors = [f.exception() for f in futures]
+        first_error = next((e for e in errors if e is not None), None)
+        if first_error is not None:
+            raise first_error
+
+    def send(batch: List[Tuple[str, Dict]]) -> List:
+        ids = [chunk_id(text) for text, _ in batch]
+        added, updated = [], []
+        for cid, (text, meta) in zip(ids, batch):
+            mh = manifest.meta_hash(meta)
+            entries.append((cid, mh))
+            prev = old.get(cid)
+            if prev is None:
+                added.append((cid, text, meta))
+            elif prev != mh:
+                updated.append((cid, meta))
+            else:
+                counts["unchanged"] += 1
+        futures = []
+        if added:
+            vectors = encode([text for _, text, _ in added])
+            futures.append(writer.submit("upsert", [cid for cid, _, _ in added], documents=[t for _, t, _ in added],
+                                         metadatas=[m for _, _, m in added], embeddings=vectors))
+            touched.extend(cid for cid, _, _ in added)
+            counts["added"] += len(added)
+        if updated:
+            futures.append(writer.submit("update", [cid for cid, _ in updated], metadatas=[m for _, m in updated]))
+            touched.extend(cid for cid, _ in updated)
+            counts["updated"] += len(updated)
+        return futures
+
+    try:
+        batch: List[Tuple[str, Dict]] = []
+        for item in chunks:
+            batch.append(item)
+            if len(batch) >= window:
+                futures = send(batch)
+                batch = []
+                settle(in_flight)
+                in_flight = futures
+                if on_window is not None:
+                    on_window(len(entries))
+        futures = send(batch) if batch else []
+        settle(in_flight)
+        settle(futures)
+
+        current = {cid for cid, _ in entries}
+        removed = [cid for cid in old if cid not in current]
+        if first_time:
+            with get_pool().collection(collection_name, create=True) as coll:
+                removed.extend(_legacy_ids(coll, source, current))
+        if removed:
+            settle([writer.submit("delete", removed)])
+            touched.extend(removed)
+            counts["deleted"] = len(removed)
+    except ChromaUnavailable as e:
+        raise RuntimeError("Chroma client não disponível") from e
+    finally:
+        wait(in_flight)
+        if touched:
+            _invalidate_ingested(collection_name, touched)
+
+    man.replace_hashes(collection_name, source, entries)
+    logger.info("Upsert de %s em %s: %s", source, collection_name, counts)
+    return counts
+
+
+def delete_collection(collection_name: str) -> None:
+    try:
+        get_pool().delete_collection(collection_name)
+    finally:
+        chroma = chroma_pool.get_async_chroma()
+        if chroma is not None:
+            chroma.invalidate(collection_name)
+        _invalidate_collection(collection_name)
+        get_manifest().drop_collection(collection_name)
+
+
+def _invalidate_collection(collection_name: str) -> None:
+    cache = get_result_cache()
+    if cache is not None:
+        cache.invalidate(collection_name)
+
+
+def _invalidate_ingested(collection_name: str, ids: Sequence[str]) -> None:
+    _invalidate_collection(collection_name)
+    answers = generation.get_answer_cache()
+    if answers is not None:
+        answers.invalidate_sources(ids)
+
+
+def runtime_stats() -> Dict:
+    """Métricas de runtime expostas em `/metrics`."""
+    cache = get_result_cache()
+    answers = generation.get_answer_cache()
+    return {
+        "chroma_pool": get_pool().stats(),
+        "retrieval": get_coordinator().stats(),
+        "result_cache": cache.stats() if cache is not None else None,
+        "answer_cache": answers.stats() if answers is not None else None,
+        "embeddings": embeddings.stats(),
+        "jobs": ingestion.job_queue_stats(),
+        "vector_writer": vector_writer.stats(),
+        "llm": dict(llm_limits.stats(), client=llm.stats()),
+        "context": context_packer.stats(),
+        "rerank": rerank.stats(),
+        "confidence": scores.stats(),
+        "extractive": extractive.stats(),
+    }
@@ -0,0 +1,272 @@
+"""Vector writer: gravação no Chroma em lotes, em paralelo e com retry.
+
+Cada coleção tem um `VectorWriter` compartilhado pelo processo. Quem grava
+chama `submit(kind, ids, ...)` e recebe um `Future` que completa quando todos
+os itens foram gravados. Os itens de várias chamadas (várias páginas sendo
+ingeridas ao mesmo tempo) são agrupados em lotes por tipo de operação
+(`add`, `upsert`, `update`, `delete`), limitados por quantidade
+(`FRAGAZ_WRITE_BATCH`) e por bytes (`FRAGAZ_WRITE_BATCH_BYTES`); um lote
+incompleto sai depois de `FRAGAZ_WRITE_LINGER` segundos.
+
+Até `FRAGAZ_WRITE_CONCURRENCY` lotes são enviados em paralelo, cada um com
+um slot do `ChromaPool`. Todas as coleções dividem a cota de escrita do pool
+(`FRAGAZ_CHROMA_WRITE_SLOTS`, ver `chroma_pool.py`), e a concorrência de cada
+writer é limitada a ela: a ingestão nunca toma os slots das consultas. Erros transitórios (conexão, timeout, HTTP 429/5xx)
+são repetidos até `FRAGAZ_WRITE_RETRIES` vezes com backoff exponencial e
+jitter; os demais falham o lote na hora.
+
+Não há ordem garantida entre lotes: quem precisar gravar e depois remover o
+mesmo id deve esperar o primeiro `Future`.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .chroma_pool import ChromaPool, ChromaUnavailable
+
+logger = logging.getLogger("fragaz.vector_writer")
+
+KINDS = ("add", "upsert", "update", "delete")
+
+BatchKey = Tuple[str, Tuple[str, ...]]
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, (ChromaUnavailable, ConnectionError, TimeoutError)):
+        return True
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    name = type(exc).__name__.lower()
+    return "timeout" in name or "connect" in name
+
+
+def _item_size(item: Dict[str, Any]) -> int:
+    size = len(str(item["id"]))
+    if item.get("documents") is not None:
+        size += len(item["documents"].encode("utf-8"))
+    if item.get("embeddings") is not None:
+        size += 4 * len(item["embeddings"])
+    if item.get("metadatas") is not None:
+        size += len(json.dumps(item["metadatas"], ensure_ascii=False, default=str))
+    return size
+
+
+class _Ticket:
+    """Acompanha os itens de um `submit` espalhados por vários lotes."""
+
+    def __init__(self, n: int):
+        self.total = self.remaining = n
+        self.future: Future = Future()
+        self._lock = threading.Lock()
+        if n == 0:
+            self.future.set_result(0)
+
+    def done(self, n: int) -> None:
+        with self._lock:
+            if self.future.done():
+                return
+            self.remaining -= n
+            if self.remaining <= 0:
+                self.future.set_result(self.total)
+
+    def fail(self, exc: BaseException) -> None:
+        with self._lock:
+            if not self.future.done():
+                self.future.set_exception(exc)
+
+
+class VectorWriter:
+    def __init__(self, collection: str, pool: Callable[[], ChromaPool], max_items: int = 256,
+                 max_bytes: int = 4 * 1024 * 1024, concurrency: int = 4, retries: int = 4,
+                 backoff_base: float = 0.2, backoff_max: float = 5.0, linger: float = 0.02):
+        self.collection = collection
+        self._pool = pool
+        self.max_items = max(1, max_items)
+        self.max_bytes = max(1, max_bytes)
+        self.concurrency = max(1, concurrency)
+        self.retries = max(0, retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.linger = linger
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="fragaz-writer")
+        self._lock = threading.Condition()
+        # lotes abertos por (operação, colunas presentes)
+        self._pending: Dict[BatchKey, List[Tuple[Dict[str, Any], _Ticket]]] = {}
+        self._pending_bytes: Dict[BatchKey, int] = {}
+        self._oldest: Dict[BatchKey, float] = {}
+        self._closed = False
+        self._stats = {"batches": 0, "items": 0, "bytes": 0, "retries": 0, "failed_batches": 0,
+                       "write_seconds": 0.0, "busy_seconds": 0.0}
+        # tempo de parede com pelo menos um lote em voo (base do throughput)
+        self._in_flight = 0
+        self._busy_since = 0.0
+        self._flusher = threading.Thread(target=self._linger_loop, name=f"fragaz-writer-{collection}", daemon=True)
+        self._flusher.start()
+
+    def submit(self, kind: str, ids: Sequence[str], documents: Optional[Sequence[str]] = None,
+               metadatas: Optional[Sequence[Dict]] = None, embeddings: Optional[Sequence[Sequence[float]]] = None) -> Future:
+        if kind not in KINDS:
+            raise ValueError(f"operação desconhecida: {kind}")
+        columns = {name: col for name, col in (("documents", documents), ("metadatas", metadatas), ("embeddings", embeddings))
+                   if col is not None}
+        key: BatchKey = (kind, tuple(columns))
+        ticket = _Ticket(len(ids))
+        with self._lock:
+            for i, cid in enumerate(ids):
+                item = {"id": cid}
+                for name, col in columns.items():
+                    item[name] = col[i]
+                size = _item_size(item)
+                if self._pending.get(key) and self._pending_bytes[key] + size > self.max_bytes:
+                    self._seal(key)
+                self._pending.setdefault(key, []).append((item, ticket))
+                self._pending_bytes[key] = self._pending_bytes.get(key, 0) + size
+                self._oldest.setdefault(key, time.monotonic())
+                if len(self._pending[key]) >= self.max_items or self._pending_bytes[key] >= self.max_bytes:
+                    self._seal(key)
+            self._lock.notify()
+        return ticket.future
+
+    def write(self, kind: str, ids: Sequence[str], **columns) -> int:
+        """`submit` + espera; levanta o erro do primeiro lote que falhar."""
+        return self.submit(kind, ids, **columns).result()
+
+    def _seal(self, key: BatchKey) -> None:
+        # chamado com self._lock
+        batch = self._pending.pop(key, None)
+        self._pending_bytes.pop(key, None)
+        self._oldest.pop(key, None)
+        if batch:
+            self._executor.submit(self._send, key, batch)
+
+    def _linger_loop(self) -> None:
+        with self._lock:
+            while not self._closed:
+                now = time.monotonic()
+                due = [k for k, t in self._oldest.items() if now - t >= self.linger]
+                for key in due:
+                    self._seal(key)
+                waits = [self.linger - (now - t) for t in self._oldest.values()]
+                self._lock.wait(timeout=max(0.001, min(waits)) if waits else None)
+
+    def _send(self, key: BatchKey, batch: List[Tuple[Dict[str, Any], _Ticket]]) -> None:
+        kind, fields = key
+        items = [item for item, _ in batch]
+        kwargs: Dict[str, Any] = {"ids": [item["id"] for item in items]}
+        for name in fields:
+            kwargs[name] = [item[name] for item in items]
+        size = sum(_item_size(item) for item in items)
+        t0 = time.monotonic()
+        with self._lock:
+            if self._in_flight == 0:
+                self._busy_since = t0
+            self._in_flight += 1
+        try:
+            self._send_with_retry(kind, items, kwargs, batch, size, t0)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                if self._in_flight == 0:
+                    self._stats["busy_seconds"] += time.monotonic() - self._busy_since
+
+    def _send_with_retry(self, kind: str, items: List[Dict[str, Any]], kwargs: Dict[str, Any],
+                         batch: List[Tuple[Dict[str, Any], _Ticket]], size: int, t0: float) -> None:
+        attempt = 0
+        while True:
+            try:
+                with self._pool().collection(self.collection, create=True, write=True) as coll:
+                    getattr(coll, kind)(**kwargs)
+                break
+            except Exception as e:
+                if attempt >= self.retries or not is_transient(e):
+                    logger.warning("Lote %s de %d itens em %s falhou: %s", kind, len(items), self.collection, e)
+                    with self._lock:
+                        self._stats["failed_batches"] += 1
+                    for ticket in {id(t): t for _, t in batch}.values():
+                        ticket.fail(e)
+                    return
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                attempt += 1
+                with self._lock:
+                    self._stats["retries"] += 1
+                logger.info("Erro transitório gravando em %s (%s); nova tentativa %d em %.2fs", self.collection, e, attempt, delay)
+                time.sleep(delay)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["items"] += len(items)
+            self._stats["bytes"] += size
+            self._stats["write_seconds"] += time.monotonic() - t0
+        counts: Dict[int, Tuple[_Ticket, int]] = {}
+        for _, ticket in batch:
+            t, n = counts.get(id(ticket), (ticket, 0))
+            counts[id(ticket)] = (t, n + 1)
+        for ticket, n in counts.values():
+            ticket.done(n)
+
+    def flush(self) -> None:
+        with self._lock:
+            for key in list(self._pending):
+                self._seal(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["pending"] = sum(len(v) for v in self._pending.values())
+            busy = out["busy_seconds"] + (time.monotonic() - self._busy_since if self._in_flight else 0.0)
+        out["items_per_sec"] = out["items"] / busy if busy else 0.0
+        out["bytes_per_sec"] = out["bytes"] / busy if busy else 0.0
+        out["avg_batch_items"] = out["items"] / out["batches"] if out["batches"] else 0.0
+        out["avg_batch_seconds"] = out["write_seconds"] / out["batches"] if out["batches"] else 0.0
+        return out
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        self._executor.shutdown(wait=True)
+
+
+_writers: Dict[str, VectorWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(collection: str) -> VectorWriter:
+    writer = _writers.get(collection)
+    if writer is None:
+        from .chroma_pool import get_pool
+
+        with _writers_lock:
+            writer = _writers.get(collection)
+            if writer is None:
+                write_slots = get_pool().write_slots
+                writer = _writers[collection] = VectorWriter(
+                    collection,
+                    get_pool,
+                    max_items=int(os.environ.get("FRAGAZ_WRITE_BATCH", "256")),
+                    max_bytes=int(os.environ.get("FRAGAZ_WRITE_BATCH_BYTES", str(4 * 1024 * 1024))),
+                    concurrency=min(write_slots, int(os.environ.get("FRAGAZ_WRITE_CONCURRENCY", str(write_slots)))),
+                    retries=int(os.environ.get("FRAGAZ_WRITE_RETRIES", "4")),
+                    linger=float(os.environ.get("FRAGAZ_WRITE_LINGER", "0.02")),
+                )
+    return writer
+
+
+def reset_writers() -> None:
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+def stats() -> Dict:
+    return {name: writer.stats() for name, writer in list(_writers.items())}
@@ -0,0 +1,83 @@
+"""Benchmark recall@k x latência: IVF vs. busca exata no índice local.
+
+Uso::
+
+    python benchmarks/bench_ann.py                      # corpus sintético
+    python benchmarks/bench_ann.py --n 1000000 --dim 384
+    python benchmarks/bench_ann.py --index .fragaz_index.bin
+
+Com `--index` as queries são amostradas do próprio índice (com ruído).
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend_service.ann import IVFIndex  # noqa: E402
+from backend_service.local_index import LocalIndex, top_k  # noqa: E402
+
+
+def synthetic(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def _pct(values, p):
+    return float(np.percentile(np.asarray(values) * 1000.0, p))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", help="arquivo de índice local (.json/.bin)")
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", default="1,4,8,16,32,64")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    if args.index:
+        matrix = LocalIndex(Path(args.index)).snapshot().matrix
+    else:
+        matrix = synthetic(args.n, args.dim, args.clusters)
+    n, dim = matrix.shape
+    queries = np.asarray(matrix[rng.choice(n, args.queries)], dtype=np.float32) + 0.1 * rng.normal(size=(args.queries, dim)).astype(np.float32)
+
+    t0 = time.perf_counter()
+    ivf = IVFIndex.build(matrix, nlist=args.nlist)
+    print(f"corpus n={n} dim={dim} | build IVF nlist={ivf.nlist}: {time.perf_counter() - t0:.1f}s")
+
+    exact, lat = [], []
+    for q in queries:
+        t = time.perf_counter()
+        qn = q / np.linalg.norm(q)
+        exact.append({i for i, _ in top_k(matrix @ qn, args.k)})
+        lat.append(time.perf_counter() - t)
+    print(f"{'exato':>12} recall@{args.k}=1.000  p50={_pct(lat, 50):7.2f}ms  p99={_pct(lat, 99):7.2f}ms")
+
+    for nprobe in [int(v) for v in args.nprobe.split(",")]:
+        hits, lat = 0, []
+        for q, truth in zip(queries, exact):
+            t = time.perf_counter()
+            res = ivf.search(matrix, q, args.k, nprobe=nprobe)
+            lat.append(time.perf_counter() - t)
+            hits += len(truth & {i for i, _ in res})
+        recall = hits / (len(queries) * args.k)
+        print(f"{'nprobe=' + str(nprobe):>12} recall@{args.k}={recall:.3f}  p50={_pct(lat, 50):7.2f}ms  p99={_pct(lat, 99):7.2f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,124 @@
+"""Benchmark de throughput: N chamadas a `/query` em sequência x um `/query/batch`.
+
+Uso::
+
+    python benchmarks/bench_batch.py                        # 500 perguntas, 50k entradas
+    python benchmarks/bench_batch.py --queries 200 --n 200000
+    python benchmarks/bench_batch.py --llm-latency 0.05     # provedor stub com 50ms por chamada
+    python benchmarks/bench_batch.py --rtt 0                # sem ida e volta simulada
+
+Roda o app em processo (httpx + ASGI) sobre um índice local sintético, que
+faz o papel do Chroma: cada chamada ao primário (uma pergunta em `/query`, o
+lote inteiro em `/query/batch`) paga `--rtt` segundos de ida e volta, como a
+chamada HTTP ao servidor Chroma com o embedding da pergunta. Sem
+`--llm-latency` as respostas saem do fallback sem LLM.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend_service import llm, services  # noqa: E402
+from backend_service.coordinator import RetrievalCoordinator  # noqa: E402
+from backend_service.index_format import write_index  # noqa: E402
+from backend_service.local_index import TEXT_FIELDS, IndexSnapshot, StringColumn  # noqa: E402
+
+
+def synthetic_index(path: Path, n: int, dim: int, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    vocab = [f"termo{i}" for i in range(20000)]
+    content = [" ".join(vocab[w] for w in rng.integers(0, len(vocab), 60)) for _ in range(n)]
+    columns = {
+        "id": StringColumn.from_strings(f"doc-{i}" for i in range(n)),
+        "title": StringColumn.from_strings(f"Página {i // 10}" for i in range(n)),
+        "content": StringColumn.from_strings(content),
+        "source": StringColumn.from_strings(f"https://wiki/p{i // 10}" for i in range(n)),
+    }
+    assert set(columns) == set(TEXT_FIELDS)
+    write_index(path, IndexSnapshot.from_matrix(columns, rng.normal(size=(n, dim)).astype(np.float32)))
+
+
+async def run(queries, k: int, concurrency: int):
+    import httpx
+
+    from backend_service.app import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        t0 = time.perf_counter()
+        for q in queries:
+            resp = await client.post("/query", json={"q": q, "k": k})
+            resp.raise_for_status()
+        loop = time.perf_counter() - t0
+
+        out = [loop]
+        for generate in (True, False):
+            t0 = time.perf_counter()
+            resp = await client.post("/query/batch", json={"queries": queries, "k": k, "concurrency": concurrency,
+                                                           "generate": generate})
+            resp.raise_for_status()
+            out.append(time.perf_counter() - t0)
+            assert len(resp.text.splitlines()) == len(queries) + 1
+    return out
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--rtt", type=float, default=0.02)
+    args = parser.parse_args(argv)
+
+    os.environ["FRAGAZ_RESULT_CACHE"] = "off"
+    os.environ["FRAGAZ_ANSWER_CACHE"] = "0"
+    os.environ["FRAGAZ_LLM_PROVIDER"] = "stub" if args.llm_latency else "off"
+    os.environ["FRAGAZ_LLM_STUB_LATENCY"] = str(args.llm_latency)
+    os.environ["FRAGAZ_LLM_CONCURRENCY"] = str(args.concurrency)
+    llm.reset_client()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "index.bin"
+        t0 = time.perf_counter()
+        synthetic_index(path, args.n, args.dim)
+        services.INDEX_BIN_FILE = path
+        services.get_local_index(path).snapshot(wait=True)
+        print(f"índice n={args.n} dim={args.dim}: {time.perf_counter() - t0:.1f}s")
+
+        def primary(q, k):
+            time.sleep(args.rtt)
+            return services.retrieve_local(q, k)
+
+        def primary_many(qs, k):
+            time.sleep(args.rtt)
+            return services.retrieve_local_many(qs, k)
+
+        services.reset_coordinator(RetrievalCoordinator(primary, services.retrieve_local, hedge_default_delay=10.0,
+                                                        hedge_min_delay=10.0, primary_many=primary_many,
+                                                        fallback_many=services.retrieve_local_many))
+        rng = np.random.default_rng(1)
+        queries = [" ".join(f"termo{w}" for w in rng.integers(0, 20000, 6)) for _ in range(args.queries)]
+        loop, batch, retrieval_only = asyncio.run(run(queries, args.k, args.concurrency))
+        services.reset_coordinator()
+
+    n = args.queries
+    print(f"/query em laço (rtt={args.rtt * 1000:.0f}ms): {loop:7.2f}s  {n / loop:8.1f} perguntas/s")
+    print(f"/query/batch              : {batch:7.2f}s  {n / batch:8.1f} perguntas/s  ({loop / batch:.1f}x)")
+    print(f"/query/batch generate=0   : {retrieval_only:7.2f}s  {n / retrieval_only:8.1f} perguntas/s  ({loop / retrieval_only:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
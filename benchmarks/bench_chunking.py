@@ -0,0 +1,140 @@
+"""Benchmark do chunking em streaming (HTML -> chunks): throughput e pico de memória.
+
+Uso::
+
+    python benchmarks/bench_chunking.py                 # página sintética de ~20 MB
+    python benchmarks/bench_chunking.py --mb 100
+    python benchmarks/bench_chunking.py --file export.html
+    python benchmarks/bench_chunking.py --no-ingest     # só o chunking
+
+O pico de memória (tracemalloc) é medido com o HTML lido do disco em pedaços,
+como na ingestão; deve ficar estável quando a página cresce. Além do chunking
+sozinho, mede a ingestão inteira (`ingest_html`: chunking, diff com o
+manifesto, embedding e writer) contra um Chroma em memória que descarta as
+gravações, com o embedding determinístico de fallback. Nessa medida só os ids
+e hashes de metadados (dezenas de bytes por chunk) crescem com a página.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend_service import chroma_pool, embeddings, services, vector_writer  # noqa: E402
+from backend_service.chunking import iter_chunks  # noqa: E402
+from backend_service.manifest import SourceManifest  # noqa: E402
+
+PARAGRAPH = ("<p>Para estornar uma transação acesse o painel financeiro e selecione a opção de estorno. "
+             "O prazo padrão é de até 2 dias úteis! Em caso de dúvida, abra um chamado com o suporte.</p>\n")
+
+
+def synthetic_page(path: Path, mb: float) -> None:
+    target = int(mb * 1024 * 1024)
+    written, section = 0, 0
+    with path.open("w", encoding="utf-8") as f:
+        f.write("<html><body><h1>Manual de operações</h1>\n")
+        while written < target:
+            section += 1
+            block = f"<h2>Seção {section}</h2>\n<h3>Detalhes {section}</h3>\n" + PARAGRAPH * 20 + "<ul><li>Item de lista.</li></ul>\n"
+            f.write(block)
+            written += len(block.encode("utf-8"))
+        f.write("</body></html>\n")
+
+
+def read_pieces(path: Path, size: int = 65536):
+    with path.open("r", encoding="utf-8") as f:
+        while True:
+            piece = f.read(size)
+            if not piece:
+                return
+            yield piece
+
+
+class NullCollection:
+    def upsert(self, **kwargs):
+        pass
+
+    update = delete = upsert
+
+    def get(self, **kwargs):
+        return {"ids": []}
+
+
+class NullClient:
+    def __init__(self):
+        self.coll = NullCollection()
+
+    def heartbeat(self):
+        return 1
+
+    def get_or_create_collection(self, name):
+        return self.coll
+
+    get_collection = get_or_create_collection
+
+
+def ingest_peak(path: Path, tmp: str) -> float:
+    from backend_service.ingestion import ingest_html
+
+    def no_model(name, device):
+        raise ImportError("benchmark usa o embedding de fallback")
+
+    chroma_pool.reset_pool(chroma_pool.ChromaPool(NullClient, size=4))
+    services.reset_manifest(SourceManifest(Path(tmp) / "manifest.sqlite"))
+    embeddings.register_embedding_service(embeddings.EmbeddingService(embeddings.default_model_name(), loader=no_model))
+    try:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        summary = ingest_html("bench", "https://wiki/bench", "Bench", read_pieces(path))
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"ingestão completa: {summary['added']} chunks em {elapsed:.2f}s")
+        return peak
+    finally:
+        vector_writer.reset_writers()
+        embeddings.reset_embedding_services()
+        chroma_pool.reset_pool()
+        services.reset_manifest()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", help="HTML exportado do Confluence")
+    parser.add_argument("--mb", type=float, default=20.0)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--overlap", type=int, default=40)
+    parser.add_argument("--no-ingest", action="store_true")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.file) if args.file else Path(tmp) / "page.html"
+        if not args.file:
+            synthetic_page(path, args.mb)
+        size_mb = path.stat().st_size / (1024 * 1024)
+
+        t0 = time.perf_counter()
+        n = sum(1 for _ in iter_chunks(read_pieces(path), args.tokens, args.overlap))
+        elapsed = time.perf_counter() - t0
+        print(f"{size_mb:.1f} MB -> {n} chunks em {elapsed:.2f}s ({size_mb / elapsed:.1f} MB/s)")
+
+        tracemalloc.start()
+        for _ in iter_chunks(read_pieces(path), args.tokens, args.overlap):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"pico de memória do chunking: {peak / (1024 * 1024):.1f} MB")
+
+        if not args.no_ingest:
+            peak = ingest_peak(path, tmp)
+            print(f"pico de memória da ingestão completa: {peak / (1024 * 1024):.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
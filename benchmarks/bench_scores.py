@@ -0,0 +1,94 @@
+"""Benchmark da confiança composta: funções escalares x lote vetorizado.
+
+Uso::
+
+    python benchmarks/bench_scores.py                 # 10k respostas sintéticas
+    python benchmarks/bench_scores.py --n 50000 --k 8
+
+Mede (1) só a parte numérica (Rs/Cs/Fs/FS/C a partir das similaridades), em
+laço escalar e em lote; (2) o `ConfidenceScorer` completo a partir dos textos,
+em lote e uma resposta por vez (o caso do `/query`).
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend_service import scores  # noqa: E402
+
+
+def _pct(values, p):
+    return float(np.percentile(np.asarray(values) * 1e6, p))
+
+
+def synthetic_texts(n: int, k: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vocab = [f"termo{i}" for i in range(5000)]
+
+    def sentence(words):
+        return " ".join(vocab[w] for w in words) + "."
+
+    answers, sources = [], []
+    for _ in range(n):
+        topic = rng.integers(0, len(vocab), 60)
+        chunks = [" ".join(sentence(rng.choice(topic, 12)) for _ in range(8)) for _ in range(k)]
+        answers.append(" ".join(sentence(rng.choice(topic if rng.random() < 0.7 else np.arange(5000), 12)) for _ in range(4)))
+        sources.append([{"content": c, "score": float(s)} for c, s in zip(chunks, np.sort(rng.uniform(0.3, 0.95, k))[::-1])])
+    return answers, sources
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=10_000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--sentences", type=int, default=4)
+    args = parser.parse_args(argv)
+    n, k, s = args.n, args.k, args.sentences
+
+    rng = np.random.default_rng(1)
+    sims = rng.uniform(0, 1, (n, k))
+    resp = rng.uniform(0, 1, (n, k))
+    support = rng.uniform(0, 1, (n, s))
+    lengths = rng.integers(3, 30, (n, s)).astype(np.float64)
+
+    t = time.perf_counter()
+    scalar = []
+    for i in range(n):
+        unsupported = int((support[i] < 0.35).sum())
+        scalar.append(scores.confidence_score(
+            scores.retrieval_score(list(sims[i])), scores.consistency_score(list(resp[i])),
+            scores.faithfulness_score(unsupported, s), scores.fact_score(list(support[i]), list(lengths[i]))))
+    t_scalar = time.perf_counter() - t
+
+    t = time.perf_counter()
+    batch = scores.confidence_scores(scores.retrieval_scores(sims), scores.consistency_scores(resp),
+                                     scores.faithfulness_scores((support < 0.35).sum(axis=1), np.full(n, s)),
+                                     scores.fact_scores(support, lengths))
+    t_batch = time.perf_counter() - t
+    assert np.allclose(batch, scalar)
+    print(f"numérico  n={n}: escalar {t_scalar * 1000:8.1f}ms | lote {t_batch * 1000:6.2f}ms | {t_scalar / t_batch:6.0f}x")
+
+    answers, sources = synthetic_texts(n, k)
+    scorer = scores.ConfidenceScorer()
+    t = time.perf_counter()
+    scorer.score_batch(answers, sources)
+    t_texts = time.perf_counter() - t
+    print(f"textos    n={n}: lote {t_texts * 1000:8.1f}ms ({1e6 * t_texts / n:6.1f}us/resposta)")
+
+    lat = []
+    for a, src in zip(answers[:2000], sources[:2000]):
+        t = time.perf_counter()
+        scorer.score(a, src)
+        lat.append(time.perf_counter() - t)
+    print(f"por /query: p50={_pct(lat, 50):7.1f}us  p99={_pct(lat, 99):7.1f}us")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -59,26 +59,59 @@ export default function Chats() {
     conv.messages.push(userMsg)
     setConversations({ ...conversations, [active]: conv })
     setQuery('')
-    // call local python API
-    fetch('http://127.0.0.1:8765/query', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ q: userMsg.text, k: 5 }) })
-      .then(r => {
-        if (!r.ok) throw new Error('backend-error:' + r.status)
-        return r.json()
-      })
-      .then(data => {
-        // backend returns { answer, confidence, sources }
-        const text = data.answer || ((data.sources || []).map(s => `${s.title || s.id} — ${s.source || ''}: ${ (s.content||'').slice(0,200)}`).join('\n\n'))
-        const assistant = { sender: 'assistant', text }
-        conv.messages.push(assistant)
-        setConversations({ ...conversations, [active]: conv })
-        setResults(data.sources || [])
+    const assistant = { sender: 'assistant', text: '' }
+    conv.messages.push(assistant)
+    const refresh = () => setConversations(prev => ({ ...prev, [active]: conv }))
+    refresh()
+    // call local python API: sources first, then answer tokens (Server-Sent Events)
+    fetch('http://127.0.0.1:8765/query/stream', { method: 'POST', headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' }, body: JSON.stringify({ q: userMsg.text, k: 5 }) })
+      .then(async r => {
+        if (!r.ok || !r.body) throw new Error('backend-error:' + r.status)
+        const reader = r.body.getReader()
+        const decoder = new TextDecoder()
+        let buffer = ''
+        for (;;) {
+          const { value, done } = await reader.read()
+          if (done) break
+          buffer += decoder.decode(value, { stream: true })
+          let sep
+          while ((sep = buffer.indexOf('\n\n')) >= 0) {
+            handleEvent(buffer.slice(0, sep))
+            buffer = buffer.slice(sep + 2)
+          }
+        }
+        if (!assistant.text) {
+          assistant.text = 'Sem resposta.'
+          refresh()
+        }
       })
       .catch(err => {
         const msg = err.message && err.message.startsWith('backend-error') ? 'Erro no backend (status). Verifique se o Python local API está rodando.' : 'Erro ao conectar ao backend: ' + err.message
-        const assistant = { sender: 'assistant', text: msg }
-        conv.messages.push(assistant)
-        setConversations({ ...conversations, [active]: conv })
+        assistant.text = assistant.text ? assistant.text + '\n\n' + msg : msg
+        refresh()
+      })
+
+    function handleEvent(raw) {
+      let event = 'message'
+      const data = []
+      raw.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data.push(line.slice(5).trimStart())
       })
+      if (!data.length) return
+      const payload = JSON.parse(data.join('\n'))
+      if (event === 'sources') {
+        setResults(payload || [])
+      } else if (event === 'token') {
+        assistant.text += payload.text
+        refresh()
+      } else if (event === 'done') {
+        assistant.confidence = payload.confidence
+        refresh()
+      } else if (event === 'error') {
+        throw new Error(payload.detail || 'erro')
+      }
+    }
   }
 
   return (
@@ -111,6 +144,9 @@ export default function Chats() {
                 {(conversations[active] && conversations[active].messages || []).map((m, i) => (
                   <div key={i} className={`msg ${m.sender === 'user' ? 'msg-user' : 'msg-assistant'}`}>
                     <pre>{m.text}</pre>
+                    {m.confidence && typeof m.confidence.score === 'number' && (
+                      <small className="confidence">Confiança: {Math.round(m.confidence.score * 100)}%</small>
+                    )}
                   </div>
                 ))}
                 <div ref={endRef} />
@@ -0,0 +1,68 @@
+import json
+
+import numpy as np
+
+from backend_service import ann
+from backend_service.ann import IVFIndex
+from backend_service.local_index import LocalIndex, top_k
+
+
+def _clustered(n=2000, dim=16, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    x = centers[rng.integers(0, clusters, n)] + 0.2 * rng.normal(size=(n, dim))
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_ivf_recall_e_nprobe_total_igual_exato():
+    x = _clustered()
+    ivf = IVFIndex.build(x, nlist=32)
+    rng = np.random.default_rng(1)
+    hits = 0
+    for q in x[rng.choice(len(x), 20)]:
+        exact = [i for i, _ in top_k(x @ q, 10)]
+        assert [i for i, _ in ivf.search(x, q, 10, nprobe=32)] == exact
+        hits += len(set(exact) & {i for i, _ in ivf.search(x, q, 10, nprobe=4)})
+    assert hits / 200 >= 0.9
+
+
+def test_ivf_persistido_ao_lado_do_indice(tmp_path, monkeypatch):
+    monkeypatch.setenv("FRAGAZ_ANN", "ivf")
+    monkeypatch.setenv("FRAGAZ_ANN_NLIST", "16")
+    x = _clustered(n=500)
+    path = tmp_path / "idx.json"
+    path.write_text(json.dumps([{"id": f"d{i}", "title": "", "content": "", "source": "", "embedding": v.tolist()} for i, v in enumerate(x)]))
+
+    snap = LocalIndex(path).snapshot(wait=True)
+    assert snap.ann is not None and snap.ann.nlist == 16
+    assert ann.ann_path(path).exists()
+
+    reloaded = LocalIndex(path).snapshot(wait=True)
+    assert np.array_equal(reloaded.ann.list_rows, snap.ann.list_rows)
+    assert reloaded.top_k(x[3], 1)[0]["id"] == "d3"
+
+
+def test_sem_ann_por_padrao(tmp_path, monkeypatch):
+    monkeypatch.delenv("FRAGAZ_ANN", raising=False)
+    path = tmp_path / "idx.json"
+    path.write_text(json.dumps([{"id": "a", "embedding": [1.0, 0.0]}]))
+    assert LocalIndex(path).snapshot(wait=True).ann is None
+
+
+def test_fingerprint_calculado_uma_vez_por_recarga(tmp_path, monkeypatch):
+    monkeypatch.setenv("FRAGAZ_ANN", "ivf")
+    monkeypatch.setenv("FRAGAZ_ANN_NLIST", "8")
+    monkeypatch.setenv("FRAGAZ_QUANT", "int8")
+    monkeypatch.delenv("FRAGAZ_LEXICAL", raising=False)
+    calls = []
+    real = ann.fingerprint
+    monkeypatch.setattr(ann, "fingerprint", lambda snap: calls.append(1) or real(snap))
+    x = _clustered(n=200)
+    path = tmp_path / "idx.json"
+    path.write_text(json.dumps([{"id": f"d{i}", "content": f"doc {i}", "embedding": v.tolist()} for i, v in enumerate(x)]))
+
+    snap = LocalIndex(path).snapshot(wait=True)
+    assert snap.ann is not None and snap.quant is not None and snap.lexical is not None
+    assert len(calls) == 1 and snap.fingerprint == snap.ann.fingerprint == snap.quant.fingerprint == snap.lexical.fingerprint
+    # recarga com os sidecars no disco: valida os três com a mesma passada
+    assert LocalIndex(path).snapshot(wait=True).ann is not None and len(calls) == 2
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+
+from backend_service import generation
+from backend_service.answer_cache import AnswerCache
+
+SOURCES = [{"id": "c1", "content": "Para reverter uma transação use o estorno."},
+           {"id": "c2", "content": "O estorno leva até 2 dias úteis."}]
+
+
+def _vec(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_hit_semantico_com_mesmas_fontes():
+    cache = AnswerCache(threshold=0.9)
+    cache.store(_vec(1, 0, 0), SOURCES, "resposta", cost=1.5)
+    assert cache.lookup(_vec(0.95, 0.05, 0), list(reversed(SOURCES))) == "resposta"
+    assert cache.lookup(_vec(0, 1, 0), SOURCES) is None
+    st = cache.stats()
+    assert st["hits"] == 1 and st["misses"] == 1 and st["saved_seconds"] == 1.5
+
+
+def test_miss_quando_fontes_mudam():
+    cache = AnswerCache(threshold=0.9)
+    cache.store(_vec(1, 0), SOURCES, "resposta")
+    changed = [dict(SOURCES[0], content="Conteúdo reescrito."), SOURCES[1]]
+    assert cache.lookup(_vec(1, 0), changed) is None
+    assert cache.lookup(_vec(1, 0), SOURCES[:1]) is None
+    assert cache.lookup(_vec(1, 0), SOURCES) == "resposta"
+
+
+def test_invalidacao_lru_e_ttl():
+    cache = AnswerCache(threshold=0.9, max_entries=2)
+    cache.store(_vec(1, 0), SOURCES, "a")
+    cache.store(_vec(0, 1), SOURCES[:1], "b")
+    assert cache.invalidate_sources(["c2"]) == 1
+    assert cache.lookup(_vec(1, 0), SOURCES) is None
+    cache.store(_vec(1, 0), SOURCES[1:], "c")
+    cache.store(_vec(1, 1), SOURCES[1:], "d")
+    assert cache.stats()["evictions"] == 1 and cache.lookup(_vec(0, 1), SOURCES[:1]) is None
+
+    short = AnswerCache(ttl=0.01)
+    short.store(_vec(1, 0), SOURCES, "a")
+    time.sleep(0.02)
+    assert short.lookup(_vec(1, 0), SOURCES) is None
+
+
+def test_generate_answer_usa_cache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(generation, "llm_enabled", lambda: True)
+    monkeypatch.setattr(generation, "generate_llm", lambda q, s: calls.append(q) or f"resposta para {q}")
+    generation.reset_answer_cache(AnswerCache(threshold=0.9))
+    try:
+        first = generation.generate_answer_from_context("Como reverter transação?", SOURCES)
+        second = generation.generate_answer_from_context("como  reverter transação?", SOURCES)
+        assert first == second and len(calls) == 1
+        assert generation.generate_answer_from_context("pergunta", []) == generation.NO_CONTEXT_ANSWER
+    finally:
+        generation.reset_answer_cache()
+
+
+def test_sem_modelo_de_embedding_so_reaproveita_a_mesma_pergunta(monkeypatch):
+    cache = AnswerCache(threshold=0.9)
+    cache.store(_vec(1, 0, 0), SOURCES, "resposta")
+    assert cache.lookup(_vec(0.95, 0.05, 0), SOURCES, exact=True) is None
+    assert cache.lookup(_vec(2, 0, 0), SOURCES, exact=True) == "resposta"
+
+    vectors = {"como reverter transação?": [1.0, 0.0], "como desfazer transação?": [0.97, 0.03],
+               "como anular transação?": [0.95, 0.05]}
+    calls = []
+    monkeypatch.setattr(generation, "llm_enabled", lambda: True)
+    monkeypatch.setattr(generation, "embed_query", lambda q: vectors[q.lower()])
+    monkeypatch.setattr(generation, "generate_llm", lambda q, s: calls.append(q) or "r")
+    generation.reset_answer_cache(AnswerCache(threshold=0.9))
+    try:
+        monkeypatch.setattr(generation, "semantic_embeddings", lambda: False)
+        generation.generate_answer_from_context("como reverter transação?", SOURCES)
+        generation.generate_answer_from_context("como desfazer transação?", SOURCES)
+        assert len(calls) == 2
+        monkeypatch.setattr(generation, "semantic_embeddings", lambda: True)
+        generation.generate_answer_from_context("como anular transação?", SOURCES)
+        assert len(calls) == 2
+    finally:
+        generation.reset_answer_cache()
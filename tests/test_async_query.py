@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from backend_service import controllers, services
+from backend_service.app import app
+from backend_service.coordinator import RetrievalCoordinator
+
+DOCS = [{"id": "c1", "title": "Estorno", "content": "Use o estorno.", "source": "u", "score": 0.8}]
+
+
+def _coordinator(primary_delay=0.0, fallback=None):
+    calls = {"primary_threads": set(), "cancelled": 0}
+
+    async def primary(q, k):
+        calls["primary_threads"].add(threading.get_ident())
+        try:
+            await asyncio.sleep(primary_delay)
+        except asyncio.CancelledError:
+            calls["cancelled"] += 1
+            raise
+        return DOCS[:k]
+
+    c = RetrievalCoordinator(lambda q, k: [], fallback or (lambda q, k: []), hedge_min_delay=0.02,
+                             hedge_default_delay=0.02, deadline=2.0, primary_async=primary)
+    return c, calls
+
+
+def test_hedge_assincrono_cancela_primario_lento():
+    local = [{"id": "l1", "content": "local", "score": 0.5}]
+    c, calls = _coordinator(primary_delay=1.0, fallback=lambda q, k: local)
+
+    async def run():
+        res = await c.retrieve_with_origin_async("pergunta", 1)
+        await asyncio.sleep(0)
+        return res
+
+    assert asyncio.run(run()) == (local, "fallback")
+    assert calls["cancelled"] == 1 and c.stats()["hedge_wins"] == 1
+
+
+def test_query_concorrente_sem_thread_por_requisicao(monkeypatch):
+    monkeypatch.setenv("ENABLE_GENAI", "0")
+    monkeypatch.setenv("FRAGAZ_RESULT_CACHE", "off")
+    c, calls = _coordinator(primary_delay=0.3)
+    services.reset_coordinator(c)
+    services.reset_result_cache()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            t0 = time.monotonic()
+            resps = await asyncio.gather(*[client.post("/query", json={"q": f"p{i}", "k": 1}) for i in range(200)])
+            return resps, time.monotonic() - t0
+
+    try:
+        resps, elapsed = asyncio.run(run())
+        assert all(r.status_code == 200 for r in resps)
+        body = resps[0].json()
+        assert body["sources"][0]["id"] == "c1" and "Use o estorno." in body["answer"]
+        assert elapsed < 3.0
+        assert len(calls["primary_threads"]) == 1
+    finally:
+        services.reset_coordinator()
+        services.reset_result_cache()
+
+
+def test_desconexao_cancela_o_trabalho():
+    cancelled = []
+
+    class FakeRequest:
+        def __init__(self):
+            self.polls = 0
+
+        async def is_disconnected(self):
+            self.polls += 1
+            return self.polls >= 2
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        with pytest.raises(controllers.ClientDisconnected):
+            await controllers.until_disconnect(FakeRequest(), slow(), poll=0.01)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled == [True]
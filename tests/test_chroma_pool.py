@@ -0,0 +1,133 @@
+import asyncio
+import threading
+
+import pytest
+
+from backend_service import chroma_pool, services
+from backend_service.chroma_pool import ChromaPool, ChromaPoolTimeout, ChromaUnavailable
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.added = []
+        self.queries = []
+
+    def query(self, query_embeddings, n_results, include):
+        self.queries.append(query_embeddings)
+        return {"ids": [["c1"]], "documents": [["conteúdo"]], "metadatas": [[{"title": "T", "source": "s"}]], "distances": [[0.25]]}
+
+    def add(self, **kwargs):
+        self.added.append(kwargs)
+
+
+class FakeClient:
+    def __init__(self):
+        self.get_calls = 0
+        self.healthy = True
+        self.collections = {}
+
+    def heartbeat(self):
+        if not self.healthy:
+            raise ConnectionError("down")
+        return 1
+
+    def get_collection(self, name):
+        self.get_calls += 1
+        return self.collections.setdefault(name, FakeCollection(name))
+
+    get_or_create_collection = get_collection
+
+    def delete_collection(self, name):
+        self.collections.pop(name, None)
+
+
+def test_reutiliza_cliente_e_handle_de_colecao():
+    clients = []
+    pool = ChromaPool(lambda: clients.append(FakeClient()) or clients[-1], size=2)
+    for _ in range(5):
+        with pool.collection("fragaz") as coll:
+            assert coll.name == "fragaz"
+    assert len(clients) == 1
+    assert clients[0].get_calls == 1
+    st = pool.stats()
+    assert st["created"] == 1 and st["checkouts"] == 5 and st["collection_hits"] == 4
+
+
+def test_invalidacao_ao_remover_colecao():
+    client = FakeClient()
+    pool = ChromaPool(lambda: client, size=1)
+    with pool.collection("fragaz"):
+        pass
+    pool.delete_collection("fragaz")
+    with pool.collection("fragaz"):
+        pass
+    assert client.get_calls == 2
+
+
+def test_pool_limitado_e_timeout():
+    pool = ChromaPool(FakeClient, size=1, checkout_timeout=0.05)
+    with pool.connection():
+        with pytest.raises(ChromaPoolTimeout):
+            with pool.connection():
+                pass
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_health_check_descarta_cliente_com_falha():
+    clients = []
+    pool = ChromaPool(lambda: clients.append(FakeClient()) or clients[-1], size=1, health_interval=0.0)
+    with pool.connection():
+        pass
+    clients[0].healthy = False
+    with pool.connection() as slot:
+        assert slot.client is clients[1]
+    assert pool.stats()["discarded"] == 1
+
+
+def test_indisponivel_falha_rapido():
+    calls = []
+    pool = ChromaPool(lambda: calls.append(1), size=1, retry_after=60)
+    for _ in range(3):
+        with pytest.raises(ChromaUnavailable):
+            with pool.connection():
+                pass
+    assert len(calls) == 1
+
+
+def test_retrieve_docs_usa_pool():
+    client = FakeClient()
+    chroma_pool.reset_pool(ChromaPool(lambda: client, size=2))
+    services.reset_coordinator()
+    try:
+        threads = [threading.Thread(target=services.retrieve_docs, args=("pergunta", 1)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        res = services.retrieve_docs("pergunta", k=1)
+        assert res[0]["id"] == "c1" and res[0]["score"] == pytest.approx(0.75)
+        assert client.get_calls <= 2
+    finally:
+        chroma_pool.reset_pool()
+        services.reset_coordinator()
+
+
+def test_async_sem_cliente_assincrono_usa_pool_sincrono_com_o_mesmo_embedding(monkeypatch):
+    monkeypatch.setenv("FRAGAZ_EMBED_MODEL", "ausente-no-teste")
+    client = FakeClient()
+    chroma_pool.reset_pool(ChromaPool(lambda: client, size=1))
+
+    async def no_client():
+        return None
+
+    chroma_pool.reset_async_chroma(chroma_pool.AsyncChroma(no_client))
+    try:
+        res = asyncio.run(services.retrieve_chroma_async("pergunta", 1))
+        assert res[0]["id"] == "c1"
+        services.retrieve_chroma("pergunta", 1)
+        coll = client.collections["fragaz"]
+        assert len(coll.queries) == 2 and coll.queries[0] == coll.queries[1]
+    finally:
+        chroma_pool.reset_pool()
+        chroma_pool.reset_async_chroma()
@@ -0,0 +1,43 @@
+from backend_service.chunking import iter_blocks, iter_chunks, split_sentences
+
+HTML = """<html><head><style>p { color: red }</style></head><body>
+<h1>Guia</h1><p>Primeira frase aqui. Segunda frase também! Terceira frase? Sim.</p>
+<h2>Estorno</h2><ul><li>Item um com texto.</li><li>Item dois.</li></ul>
+<h3>Prazos</h3><p>O estorno leva até 2 dias úteis. Depois disso &amp; sem resposta, abra um chamado.</p>
+<h2>Pix</h2><p>Limite de R$ 1.000,00 por dia.</p>
+</body></html>"""
+
+
+def test_frases_nao_quebram_numeros_nem_abreviacoes_de_valor():
+    assert split_sentences("Limite de R$ 1.000,00 por dia. Ok! E depois? fim") == ["Limite de R$ 1.000,00 por dia.", "Ok!", "E depois? fim"]
+
+
+def test_secoes_e_limites_de_titulo():
+    chunks = list(iter_chunks(HTML, max_tokens=50, overlap=10))
+    assert [c.section for c in chunks] == ["Guia", "Guia > Estorno", "Guia > Estorno > Prazos", "Guia > Pix"]
+    assert "color" not in " ".join(c.text for c in chunks)
+    assert "&" in chunks[2].text and [c.index for c in chunks] == [0, 1, 2, 3]
+
+
+def test_tamanho_e_sobreposicao_por_frase():
+    sentences = [f"Frase numero {i} com cinco." for i in range(12)]
+    chunks = list(iter_chunks("<p>" + " ".join(sentences) + "</p>", max_tokens=12, overlap=5))
+    assert all(c.tokens <= 12 for c in chunks)
+    for prev, cur in zip(chunks, chunks[1:]):
+        last = prev.text.split(". ")[-1].rstrip(".")
+        assert cur.text.startswith(last)
+    assert chunks[-1].text.endswith("Frase numero 11 com cinco.")
+
+
+def test_streaming_em_pedacos_e_frase_gigante():
+    words = " ".join(f"w{i}" for i in range(1000))
+    html = f"<p>{words}</p>"
+    pieces = [html[i:i + 7].encode("utf-8") for i in range(0, len(html), 7)]
+    chunks = list(iter_chunks(iter(pieces), max_tokens=100, overlap=20))
+    assert all(c.tokens <= 100 for c in chunks)
+    seen = set(" ".join(c.text for c in chunks).split())
+    assert seen == set(words.split())
+
+    raw = "<p>ação é</p><p>fim</p>".encode("utf-8")
+    blocks = list(iter_blocks(iter([raw[:5], raw[5:]])))
+    assert blocks == [(None, "ação é"), (None, "fim")]
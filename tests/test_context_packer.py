@@ -0,0 +1,60 @@
+from backend_service import context_packer, generation
+from backend_service.context_packer import ContextPacker, estimate_tokens
+
+BASE = "O estorno devolve o valor ao cliente em até dois dias úteis após a aprovação do gerente da agência."
+
+
+def _doc(id, content, source="u", score=0.8, chunk_index=None):
+    return {"id": id, "title": "Estorno", "content": content, "source": source, "score": score, "chunk_index": chunk_index}
+
+
+def test_junta_chunks_vizinhos_sem_repetir_sobreposicao():
+    a = "Para estornar abra o painel financeiro. " + BASE
+    b = BASE + " Depois confirme o protocolo no sistema."
+    packing = ContextPacker(budget=1000).pack("como estornar?", [_doc("c2", b, chunk_index=1), _doc("c1", a, chunk_index=0)])
+    assert packing.merged == 1 and len(packing.passages) == 1
+    p = packing.passages[0]
+    assert p.ids == ["c1", "c2"] and p.text.count("dois dias úteis") == 1
+    assert p.text.startswith("Para estornar") and p.text.endswith("protocolo no sistema.")
+
+
+def test_remove_frases_quase_duplicadas_entre_fontes():
+    docs = [_doc("c1", BASE + " Só gerentes aprovam.", source="u1", score=0.9),
+            _doc("c2", BASE.replace("cliente", "cliente final") + " O limite é de mil reais.", source="u2", score=0.7)]
+    packing = ContextPacker(budget=1000, dedup_threshold=0.6).pack("estorno", docs)
+    text = " ".join(p.text for p in packing.passages)
+    assert packing.duplicates_removed == 1 and text.count("dois dias úteis") == 1
+    assert "limite é de mil reais" in text
+
+
+def test_orcamento_e_mmr_preferem_passagem_diversa():
+    redundant = "Estorno estorno valor cliente aprovação gerente estorno valor cliente aprovação."
+    docs = [_doc("a", BASE, source="u1", score=0.9),
+            _doc("b", redundant + " " + BASE[:40], source="u2", score=0.85),
+            _doc("c", "Cancelamentos de boleto seguem outro fluxo no módulo de cobrança.", source="u3", score=0.6)]
+    budget = estimate_tokens(BASE) + estimate_tokens(docs[2]["content"]) + 5
+    packer = ContextPacker(budget=budget, mmr_lambda=0.5, min_passage_tokens=30)
+    packing = packer.pack("estorno valor cliente", docs)
+    assert [p.ids[0] for p in packing.passages] == ["a", "c"]
+    assert packing.tokens <= budget and packing.dropped == ["b"]
+    st = packer.stats()
+    assert st["prompts"] == 1 and 0 < st["token_reduction"] < 1
+
+
+def test_build_prompt_usa_contexto_empacotado():
+    context_packer.reset_packer(ContextPacker(budget=25))
+    try:
+        long = " ".join(f"Frase número {i} sobre o estorno." for i in range(40))
+        prompt = generation.build_prompt("estorno?", [_doc("c1", long)])
+        assert prompt.startswith("Contexto:\n[1] Estorno (u)\nFrase número 0")
+        assert "Frase número 39" not in prompt
+        assert context_packer.stats()["truncated"] == 1
+    finally:
+        context_packer.reset_packer()
+
+
+def test_passagem_sem_pontuacao_maior_que_o_orcamento_e_cortada_em_palavra():
+    packing = ContextPacker(budget=50).pack("palavra", [_doc("a", "palavra " * 400, score=0.9)])
+    assert len(packing.passages) == 1 and packing.dropped == []
+    p = packing.passages[0]
+    assert p.truncated and 0 < p.tokens <= 50 and p.text.split() == ["palavra"] * len(p.text.split())
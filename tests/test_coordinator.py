@@ -0,0 +1,88 @@
+import time
+
+from backend_service.coordinator import OPEN, CircuitBreaker, RetrievalCoordinator
+
+LOCAL = [{"id": "local"}]
+REMOTE = [{"id": "remote"}]
+
+
+def _local(q, k):
+    return LOCAL
+
+
+def test_primario_rapido_vence():
+    coord = RetrievalCoordinator(lambda q, k: REMOTE, _local, hedge_default_delay=0.5)
+    assert coord.retrieve("q") == REMOTE
+    assert coord.stats()["primary_wins"] == 1 and coord.stats()["hedges"] == 0
+
+
+def test_hedge_quando_primario_lento():
+    def slow(q, k):
+        time.sleep(0.5)
+        return REMOTE
+
+    coord = RetrievalCoordinator(slow, _local, hedge_default_delay=0.02, hedge_min_delay=0.01)
+    t0 = time.monotonic()
+    assert coord.retrieve("q") == LOCAL
+    assert time.monotonic() - t0 < 0.3
+    st = coord.stats()
+    assert st["hedge_wins"] == 1 and st["hedge_win_rate"] == 1.0
+
+
+def test_breaker_abre_e_curto_circuita():
+    calls = []
+
+    def failing(q, k):
+        calls.append(1)
+        raise ConnectionError("chroma fora")
+
+    coord = RetrievalCoordinator(failing, _local, breaker=CircuitBreaker(failure_threshold=2, cooldown=60))
+    for _ in range(5):
+        assert coord.retrieve("q") == LOCAL
+    st = coord.stats()
+    assert len(calls) == 2
+    assert st["breaker"]["state"] == OPEN and st["short_circuits"] == 3
+
+
+def test_breaker_half_open_fecha_apos_sucesso():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.0)
+    breaker.record_failure()
+    assert breaker.allow()  # sonda
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_deadline():
+    def hang(q, k):
+        time.sleep(0.5)
+        return REMOTE
+
+    coord = RetrievalCoordinator(hang, hang, hedge_default_delay=0.01, hedge_min_delay=0.01, deadline=0.1)
+    t0 = time.monotonic()
+    assert coord.retrieve("q") == []
+    assert time.monotonic() - t0 < 0.3
+    assert coord.stats()["deadline_exceeded"] == 1
+
+
+def test_primario_travado_abre_o_breaker_no_caminho_assincrono():
+    import asyncio
+
+    async def hang(q, k):
+        await asyncio.sleep(10)
+        return REMOTE
+
+    coord = RetrievalCoordinator(lambda q, k: REMOTE, _local, breaker=CircuitBreaker(failure_threshold=2, cooldown=60),
+                                 hedge_default_delay=0.01, hedge_min_delay=0.01, deadline=0.05, primary_async=hang)
+
+    async def run():
+        out = []
+        for _ in range(20):
+            out.append(await coord.retrieve_with_origin_async("q"))
+            await asyncio.sleep(0.01)
+        return out
+
+    results = asyncio.run(run())
+    assert all(res == (LOCAL, "fallback") for res in results)
+    st = coord.stats()
+    assert st["breaker"]["state"] == OPEN and st["primary_failures"] >= 2 and st["short_circuits"] > 0
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from backend_service.crawler import ConfluenceCrawler, TokenBucket
+from backend_service.manifest import SourceManifest
+
+PAGES = {
+    "1": {"title": "Raiz", "children": ["2", "3"], "version": 1},
+    "2": {"title": "Estorno", "children": ["4"], "version": 1},
+    "3": {"title": "Pix", "children": [], "version": 1},
+    "4": {"title": "Limites", "children": [], "version": 1},
+}
+
+
+class StubConfluence(BaseHTTPRequestHandler):
+    log = []
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _paged(self, ids, qs):
+        start, limit = int(qs["start"][0]), int(qs["limit"][0])
+        part = ids[start:start + limit]
+        links = {"next": "/next"} if start + limit < len(ids) else {}
+        self._json({"results": [{"id": i, "title": PAGES[i]["title"]} for i in part], "_links": links})
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            url = urlsplit(self.path)
+            qs = parse_qs(url.query)
+            parts = url.path.strip("/").split("/")
+            cls.log.append(url.path)
+            time.sleep(0.02)
+            if url.path == "/rest/api/content":
+                return self._paged(sorted(PAGES), qs)
+            if parts[-2:] == ["child", "page"]:
+                return self._paged(PAGES[parts[-3]]["children"], qs)
+            page_id = parts[-1]
+            etag = f'"{page_id}-v{PAGES[page_id]["version"]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self._json({"id": page_id, "title": PAGES[page_id]["title"],
+                        "body": {"storage": {"value": f"<p>Conteúdo {page_id} v{PAGES[page_id]['version']}</p>"}},
+                        "_links": {"webui": f"/wiki/pages/{page_id}"}}, headers={"ETag": etag})
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+@pytest.fixture
+def server():
+    StubConfluence.log, StubConfluence.max_active = [], 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubConfluence)
+    t = threading.Thread(target=httpd.serve_forever, daemon=True)
+    t.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def _crawler(base, tmp_path, sunk, **kwargs):
+    return ConfluenceCrawler(base, "fragaz", SourceManifest(tmp_path / "manifest.sqlite"), sink=sunk.append,
+                             rate=0, page_size=2, **kwargs)
+
+
+def test_crawl_de_espaco_com_requisicoes_condicionais(server, tmp_path):
+    sunk = []
+    out = asyncio.run(_crawler(server, tmp_path, sunk).crawl(space_key="ENG"))
+    assert out["discovered"] == 4 and out["ingested"] == 4
+    assert sorted(p.id for p in sunk) == ["1", "2", "3", "4"]
+    assert sunk[0].url.startswith(server + "/wiki/pages/") and "Conteúdo" in sunk[0].html
+
+    sunk.clear()
+    out = asyncio.run(_crawler(server, tmp_path, sunk).crawl(space_key="ENG"))
+    assert out["not_modified"] == 4 and sunk == []
+
+    PAGES["3"]["version"] = 2
+    try:
+        out = asyncio.run(_crawler(server, tmp_path, sunk).crawl(space_key="ENG"))
+    finally:
+        PAGES["3"]["version"] = 1
+    assert out["fetched"] == 1 and [p.id for p in sunk] == ["3"] and "v2" in sunk[0].html
+
+
+def test_crawl_de_arvore_e_limite_por_host(server, tmp_path):
+    sunk = []
+    out = asyncio.run(_crawler(server, tmp_path, sunk, per_host=2).crawl(root_page_id="1"))
+    assert sorted(p.id for p in sunk) == ["1", "2", "3", "4"] and out["errors"] == 0
+    assert StubConfluence.max_active <= 2
+
+
+def test_falha_no_sink_nao_grava_etag(server, tmp_path):
+    def broken(page):
+        raise RuntimeError("chroma fora")
+
+    manifest = SourceManifest(tmp_path / "manifest.sqlite")
+    c = ConfluenceCrawler(server, "fragaz", manifest, sink=broken, rate=0)
+    out = asyncio.run(c.crawl(space_key="ENG"))
+    assert out["errors"] == 4 and manifest.fetch_state("fragaz", c.page_url("1")) == (None, None)
+
+
+def test_token_bucket_limita_taxa():
+    async def run():
+        bucket = TokenBucket(rate=100, burst=1)
+        t0 = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - t0
+
+    assert asyncio.run(run()) >= 0.045
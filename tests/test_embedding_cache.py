@@ -0,0 +1,76 @@
+from backend_service import embedding_cache
+from backend_service.embedding_cache import EmbeddingCache, cache_key
+from backend_service.embeddings import EmbeddingService
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=None):
+        self.encoded.extend(texts)
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+
+def test_chave_por_modelo_versao_e_texto_normalizado():
+    assert cache_key("m", "1", "Olá  mundo\n") == cache_key("m", "1", "Olá mundo")
+    assert cache_key("m", "1", "Olá mundo") != cache_key("m", "2", "Olá mundo")
+    assert cache_key("m", "1", "Olá mundo") != cache_key("outro", "1", "Olá mundo")
+
+
+def test_reingestao_so_codifica_chunks_novos(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache(tmp_path / "emb.sqlite")
+    service = EmbeddingService("fake", batch_size=2, loader=lambda name, device: model, cache=cache)
+    first = service.encode(["a", "bb", "ccc", "a"])
+    assert model.encoded == ["a", "bb", "ccc"]
+
+    second = service.encode(["a", "bb", "dddd", "ccc"])
+    assert model.encoded[3:] == ["dddd"]
+    assert second[0] == first[0] and second[3] == first[2] and second[2][0] == 4.0
+    st = cache.stats()
+    assert st["hits"] == 3 and st["entries"] == 4
+
+    assert service.encode(["a"], use_cache=False) == [first[0]]
+    assert model.encoded[-1] == "a"
+    service.close()
+
+
+def test_limite_de_tamanho_e_compactacao(tmp_path):
+    path = tmp_path / "emb.sqlite"
+    cache = EmbeddingCache(path, max_bytes=3 * 12)
+    for i in range(5):
+        cache.put_many("m", {f"k{i}": [1.0, 2.0, 3.0]})
+    assert cache.stats()["entries"] == 3 and cache.stats()["evictions"] == 2
+    assert set(cache.get_many(["k0", "k4"])) == {"k4"}
+
+    out = cache.compact(max_bytes=12)
+    assert out["removed"] == 2 and out["entries"] == 1
+    assert embedding_cache.main(["stats", "--path", str(path)]) == 0
+
+
+def test_total_corrente_sem_somar_a_tabela(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "emb.sqlite"
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE embeddings (key TEXT PRIMARY KEY, model TEXT, dim INTEGER, vector BLOB, size INTEGER, last_access REAL)")
+    legacy.execute("INSERT INTO embeddings VALUES ('antigo', 'm', 1, x'00000000', 4, 0)")
+    legacy.commit()
+    legacy.close()
+
+    cache = EmbeddingCache(path, max_bytes=5 * 12)
+    cache.put_many("m", {"k0": [1.0, 2.0, 3.0], "k1": [1.0]})
+    cache.put_many("m", {"k1": [1.0, 2.0, 3.0]})  # regravação troca o tamanho
+    conn = sqlite3.connect(path)
+
+    def total():
+        return conn.execute("SELECT total FROM embeddings_meta").fetchone()[0]
+
+    assert total() == conn.execute("SELECT SUM(size) FROM embeddings").fetchone()[0] == 4 + 2 * 12
+    for i in range(2, 6):
+        cache.put_many("m", {f"k{i}": [1.0, 2.0, 3.0]})
+    assert total() == conn.execute("SELECT SUM(size) FROM embeddings").fetchone()[0] <= 5 * 12
+    assert cache.stats()["bytes"] == total()
+    cache.clear()
+    assert total() == 0
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+from backend_service import embeddings
+from backend_service.embeddings import EmbeddingService
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=None):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_carrega_uma_vez_e_codifica_em_lotes():
+    loads = []
+    model = FakeModel()
+    service = EmbeddingService("fake", batch_size=3, loader=lambda name, device: loads.append(name) or model)
+    threads = [threading.Thread(target=service.encode, args=(["a", "bb"],)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    vectors = service.encode([f"t{i}" for i in range(7)])
+    assert len(loads) == 1
+    assert [len(c) for c in model.calls[-3:]] == [3, 3, 1]
+    assert vectors[0] == [2.0, 1.0] and len(vectors) == 7
+    st = service.stats()
+    assert st["backend"] == "model" and st["chunks"] == 15 and st["batches"] == 7
+    assert st["chunks_per_sec"] > 0 and st["batch_latency_avg"] >= 0
+    service.close()
+
+
+def test_fallback_quando_modelo_indisponivel():
+    def broken(name, device):
+        raise ImportError("sentence_transformers")
+
+    service = EmbeddingService("ausente", batch_size=2, loader=broken)
+    vectors = service.encode(["a", "b", "c"])
+    assert len(vectors) == 3 and all(len(v) == embeddings.FALLBACK_DIM for v in vectors)
+    assert service.encode(["a"])[0] == vectors[0]
+    st = service.stats()
+    assert st["backend"] == "fallback" and st["load_failures"] == 1 and st["fallback_chunks"] == 4
+    service.close()
+
+
+def test_pergunta_nao_espera_lotes_da_ingestao():
+    gate = threading.Event()
+
+    class SlowModel(FakeModel):
+        def encode(self, texts, batch_size=None):
+            if texts[0].startswith("chunk"):
+                gate.wait(2)
+            return super().encode(texts, batch_size)
+
+    loads = []
+    service = EmbeddingService("fake", batch_size=2, loader=lambda name, device: loads.append(name) or SlowModel())
+    service.warmup().result()
+    bulk = service.submit([f"chunk {i}" for i in range(6)])
+    try:
+        assert service.encode(["pergunta"], use_cache=False, lane=embeddings.QUERY) == [[8.0, 1.0]]
+        assert not any(f.done() for f in bulk) and service.stats()["query_batches"] == 1
+    finally:
+        gate.set()
+    assert all(len(f.result()[0]) == 2 for f in bulk) and loads == ["fake"]
+    service.close()
+
+
+def test_encode_async_e_registro():
+    service = EmbeddingService("fake", batch_size=2, loader=lambda name, device: FakeModel())
+    embeddings.register_embedding_service(service)
+    try:
+        assert embeddings.get_embedding_service("fake") is service
+        vectors = asyncio.run(service.encode_async(["a", "bb", "ccc"]))
+        assert [v[0] for v in vectors] == [1.0, 2.0, 3.0]
+        assert "fake" in embeddings.stats()
+    finally:
+        embeddings.reset_embedding_services()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+
+from backend_service import generation, services
+from backend_service.app import app
+from backend_service.chunking import sentence_spans, split_sentences
+from backend_service.coordinator import RetrievalCoordinator
+from backend_service.extractive import ExtractiveAnswerer
+
+DOCS = json.loads((Path(__file__).resolve().parent.parent / "data" / "docs.json").read_text(encoding="utf-8"))
+
+
+def test_sentence_spans_batem_com_split_sentences():
+    text = "  Para estornar use o painel. O prazo é de 2 dias!  Dúvidas? Abra um chamado. "
+    assert [text[a:b] for a, b in sentence_spans(text)] == [s.strip() for s in split_sentences(text)]
+
+
+def test_resposta_extrativa_com_offsets():
+    sources = [dict(d, score=0.5) for d in DOCS]
+    ex = ExtractiveAnswerer(dense=False).answer("recuperação de senha", sources)
+    assert [h.id for h in ex.highlights] == ["doc-2"]
+    h = ex.highlights[0]
+    assert sources[h.source]["content"][h.start:h.end] == h.text and "senha" in h.text
+    assert ex.text.startswith(h.text) and "[2]" in ex.text and len(ex.text) < 300
+
+    ex = ExtractiveAnswerer(dense=False, max_sentences=2).answer("como reverter uma transação?", sources)
+    assert {h.id for h in ex.highlights} == {"doc-1"} and len(ex.highlights) == 2
+    assert ex.highlights[0].start < ex.highlights[1].start
+
+
+def test_query_sem_llm_devolve_resposta_extrativa(monkeypatch):
+    monkeypatch.setenv("ENABLE_GENAI", "0")
+    monkeypatch.setenv("FRAGAZ_RESULT_CACHE", "off")
+    sources = [dict(d, score=0.8 - 0.1 * i) for i, d in enumerate(DOCS)]
+
+    async def primary(q, k):
+        return sources[:k]
+
+    services.reset_coordinator(RetrievalCoordinator(lambda q, k: [], lambda q, k: [], primary_async=primary))
+    services.reset_result_cache()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/query", json={"q": "timeout nos logs", "k": 3})
+
+    try:
+        body = asyncio.run(run()).json()
+        assert body["mode"] == "extractive" and body["highlights"]
+        for h in body["highlights"]:
+            assert h["id"] == "doc-3" and body["sources"][h["source"]]["content"][h["start"]:h["end"]] in body["answer"]
+
+        monkeypatch.setenv("FRAGAZ_FALLBACK", "snippets")
+        assert generation.fallback("timeout nos logs", sources).mode == "snippets"
+        assert generation.fallback_answer("timeout nos logs", sources).startswith("(Fallback)")
+    finally:
+        services.reset_coordinator()
+        services.reset_result_cache()
+
+
+def test_denso_fora_do_cache_persistente_e_com_lru(monkeypatch):
+    from backend_service import embeddings
+    from backend_service.embeddings import EmbeddingService
+
+    class FakeModel:
+        def __init__(self):
+            self.encoded = []
+
+        def encode(self, texts, batch_size=None):
+            self.encoded.extend(texts)
+            return [[float("senha" in t), 1.0] for t in texts]
+
+    class RecordingCache:
+        def __init__(self):
+            self.puts = 0
+
+        def get_many(self, keys):
+            return {}
+
+        def put_many(self, model, vectors):
+            self.puts += 1
+
+        def stats(self):
+            return {"puts": self.puts}
+
+    model, cache = FakeModel(), RecordingCache()
+    monkeypatch.setenv("FRAGAZ_EMBED_MODEL", "fake-extrativo")
+    service = EmbeddingService("fake-extrativo", loader=lambda name, device: model, cache=cache)
+    service.warmup().result()
+    embeddings.register_embedding_service(service)
+    try:
+        answerer = ExtractiveAnswerer()
+        sources = [dict(d, score=0.5) for d in DOCS]
+        first = answerer.answer("recuperação de senha", sources)
+        n = len(model.encoded)
+        second = answerer.answer("recuperação de senha", sources)
+        assert first.dense and second.text == first.text
+        assert cache.puts == 0 and len(model.encoded) == n + 1  # só a pergunta é recodificada
+        assert answerer.stats()["vector_hits"] >= n - 1 and service.stats()["query_batches"] >= 2
+    finally:
+        embeddings.reset_embedding_services()
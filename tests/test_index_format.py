@@ -0,0 +1,72 @@
+import json
+
+import numpy as np
+import pytest
+
+from backend_service import index_format
+from backend_service.local_index import LocalIndex
+
+
+def _entries(n=30, dim=8):
+    rng = np.random.default_rng(7)
+    return [
+        {"id": f"doc-{i}", "title": f"Título {i}", "content": "transação revertida " * (i + 1), "source": f"kb_{i}", "embedding": rng.normal(size=dim).tolist()}
+        for i in range(n)
+    ]
+
+
+def test_converte_json_e_le_sem_copia(tmp_path):
+    src, dst = tmp_path / "idx.json", tmp_path / "idx.bin"
+    entries = _entries()
+    src.write_text(json.dumps(entries), encoding="utf-8")
+    index_format.convert_json_index(src, dst)
+
+    assert index_format.is_binary_index(dst)
+    snap = index_format.open_snapshot(dst)
+    assert len(snap) == 30 and snap.dim == 8
+    assert not snap.matrix.flags.owndata  # view sobre o mmap
+
+    back = index_format.read_entries(dst)
+    assert [e["id"] for e in back] == [e["id"] for e in entries]
+    assert back[3]["content"] == entries[3]["content"]
+    assert back[3]["embedding"] == pytest.approx(entries[3]["embedding"], rel=1e-5)
+
+
+def test_busca_no_binario_igual_ao_json(tmp_path):
+    src, dst = tmp_path / "idx.json", tmp_path / "idx.bin"
+    src.write_text(json.dumps(_entries()), encoding="utf-8")
+    index_format.convert_json_index(src, dst)
+    q = np.random.default_rng(2).normal(size=8).tolist()
+
+    from_json = LocalIndex(src).search(q, 5)
+    from_bin = LocalIndex(dst).search(q, 5)
+    assert [r["id"] for r in from_bin] == [r["id"] for r in from_json]
+
+
+def test_float16(tmp_path):
+    src, dst = tmp_path / "idx.json", tmp_path / "idx16.bin"
+    src.write_text(json.dumps(_entries()), encoding="utf-8")
+    index_format.main(["convert", str(src), str(dst), "--float16"])
+    snap = index_format.open_snapshot(dst)
+    assert snap.matrix.dtype == np.float16
+    q = np.random.default_rng(2).normal(size=8).tolist()
+    assert LocalIndex(dst).search(q, 3)[0]["id"] == LocalIndex(src).search(q, 3)[0]["id"]
+
+
+def test_arquivo_invalido(tmp_path):
+    bad = tmp_path / "bad.bin"
+    bad.write_bytes(index_format.MAGIC + b"\x00" * 8)
+    with pytest.raises(index_format.IndexFormatError):
+        index_format.open_snapshot(bad)
+
+
+def test_mesma_escolha_de_arquivo_no_backend_legado_e_no_servico(tmp_path, monkeypatch):
+    from backend_service import services
+
+    src = tmp_path / ".fragaz_index.json"
+    src.write_text(json.dumps(_entries(n=5)), encoding="utf-8")
+    monkeypatch.setattr(services, "INDEX_FILE", src)
+    monkeypatch.setattr(services, "INDEX_BIN_FILE", src.with_suffix(".bin"))
+    assert services.index_path() == index_format.preferred_index_path(src) == src
+    index_format.convert_json_index(src, src.with_suffix(".bin"))
+    assert services.index_path() == index_format.preferred_index_path(src) == src.with_suffix(".bin")
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend_service import ingestion
+from backend_service.app import app
+from backend_service.jobs import CANCELLED, FAILED, QUEUED, SUCCEEDED, JobQueue, QueueFull, SQLiteJobStore
+
+client = TestClient(app)
+
+
+def _wait(q, job_id, timeout=2.0):
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        job = q.get(job_id)
+        if job.status in (SUCCEEDED, FAILED, CANCELLED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job não terminou")
+
+
+def test_execucao_progresso_e_falha():
+    def handler(payload, ctx):
+        ctx.progress(0.5, "metade")
+        if payload.get("boom"):
+            raise RuntimeError("falhou")
+        return {"ok": payload["n"]}
+
+    q = JobQueue({"t": handler}, workers=1)
+    try:
+        ok = _wait(q, q.submit("t", {"n": 1}).id)
+        assert ok.status == SUCCEEDED and ok.result == {"ok": 1} and ok.progress == 1.0 and ok.message == "metade"
+        bad = _wait(q, q.submit("t", {"boom": True}).id)
+        assert bad.status == FAILED and bad.error == "falhou"
+        assert q.stats()["succeeded"] == 1 and q.stats()["failed"] == 1
+    finally:
+        q.shutdown()
+
+
+def test_backpressure_e_cancelamento():
+    gate = threading.Event()
+
+    def handler(payload, ctx):
+        gate.wait(2)
+        ctx.progress(0.9)
+        return {}
+
+    q = JobQueue({"t": handler}, workers=1, max_queued=1)
+    try:
+        running = q.submit("t", {})
+        time.sleep(0.05)
+        waiting = q.submit("t", {})
+        with pytest.raises(QueueFull):
+            q.submit("t", {})
+        q.cancel(waiting.id)
+        # cancelado na fila libera a vaga na hora
+        assert q.get(waiting.id).status == CANCELLED and q.stats()["queued"] == 0
+        refill = q.submit("t", {})
+        q.cancel(running.id)
+        gate.set()
+        assert _wait(q, refill.id).status == SUCCEEDED
+        assert _wait(q, running.id).status == CANCELLED
+        assert _wait(q, waiting.id).status == CANCELLED and q.stats()["rejected"] == 1
+    finally:
+        q.shutdown()
+
+
+def test_store_sqlite_retoma_fila(tmp_path):
+    path = tmp_path / "jobs.sqlite"
+    gate = threading.Event()
+    first = JobQueue({"t": lambda p, ctx: gate.wait(2) and {}}, store=SQLiteJobStore(path), workers=1)
+    first.submit("t", {})
+    time.sleep(0.05)
+    pending = first.submit("t", {"n": 2})
+    assert SQLiteJobStore(path).get(pending.id).status == QUEUED
+
+    second = JobQueue({"t": lambda p, ctx: {"n": p["n"]}}, store=SQLiteJobStore(path), workers=1)
+    try:
+        assert _wait(second, pending.id).result == {"n": 2}
+    finally:
+        gate.set()
+        first.shutdown()
+        second.shutdown()
+
+
+def test_store_sqlite_sem_credenciais_e_com_retencao(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "jobs.sqlite"
+    gate = threading.Event()
+    first = JobQueue({"t": lambda p, ctx: gate.wait(2) and {}}, store=SQLiteJobStore(path), workers=1)
+    try:
+        first.submit("t", {})
+        time.sleep(0.05)
+        pending = first.submit("t", {"url": "https://wiki/p1", "username": "ana", "api_token": "segredo"})
+        assert first.get(pending.id).payload["api_token"] == "segredo"
+        raw = "".join(r[0] for r in sqlite3.connect(path).execute("SELECT data FROM jobs"))
+        assert "segredo" not in raw and "ana" not in raw
+
+        # após reinício o job não tem mais as credenciais: falha em vez de rodar sem autenticação
+        second = JobQueue({"t": lambda p, ctx: {}}, store=SQLiteJobStore(path), workers=1)
+        second.shutdown()
+        job = second.get(pending.id)
+        assert job.status == FAILED and "credenciais" in job.error
+    finally:
+        first.cancel(pending.id)
+        gate.set()
+        first.shutdown()
+
+    store = SQLiteJobStore(path, retention=3600)
+    assert store.prune(now=time.time() + 7200, force=True) >= 1
+    assert store.get(pending.id) is None
+
+
+def test_endpoints_de_jobs(monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setitem(ingestion.HANDLERS, "confluence", lambda payload, ctx: gate.wait(2) and {"added": 1})
+    q = JobQueue(ingestion.HANDLERS, workers=1, max_queued=1)
+    ingestion.reset_job_queue(q)
+    try:
+        r = client.post("/scrape/confluence", json={"url": "https://wiki/p1", "api_token": "segredo"})
+        assert r.status_code == 202
+        job_id = r.json()["job_id"]
+        time.sleep(0.05)
+        assert client.post("/scrape/confluence", json={"url": "https://wiki/p2"}).status_code == 202
+        assert client.post("/scrape/confluence", json={"url": "https://wiki/p3"}).status_code == 429
+        status = client.get(f"/jobs/{job_id}").json()
+        assert status["status"] == "running" and "payload" not in status
+        gate.set()
+        assert _wait(q, job_id).result == {"added": 1}
+        assert client.get("/jobs/inexistente").status_code == 404
+    finally:
+        gate.set()
+        ingestion.reset_job_queue()
+
+
+def test_cancelamento_durante_o_upsert_de_uma_pagina(monkeypatch):
+    from types import SimpleNamespace
+
+    from backend_service import services
+
+    written = []
+
+    def fake_stream(collection, url, chunks, on_window=None, **kw):
+        for text, _ in chunks:
+            written.append(text)
+            time.sleep(0.01)
+            on_window(len(written))
+        return {"added": len(written)}
+
+    monkeypatch.setattr(ingestion, "fetch_page", lambda url, user, token: "<p>texto</p>")
+    monkeypatch.setattr(ingestion, "iter_chunks", lambda html: (SimpleNamespace(text=str(i), section=None, index=i)
+                                                                 for i in range(500)))
+    monkeypatch.setattr(services, "upsert_source_stream", fake_stream)
+    q = JobQueue(ingestion.HANDLERS, workers=1)
+    try:
+        job = q.submit("confluence", {"url": "https://wiki/p1"})
+        t_end = time.monotonic() + 2
+        while "chunks gravados" not in (q.get(job.id).message or "") and time.monotonic() < t_end:
+            time.sleep(0.01)
+        assert q.get(job.id).progress > 0.2
+        q.cancel(job.id)
+        assert _wait(q, job.id).status == CANCELLED and len(written) < 500
+    finally:
+        q.shutdown()
@@ -0,0 +1,71 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from backend_service import lexical
+from backend_service.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from backend_service.local_index import LocalIndex
+
+DOCS = json.loads((Path(__file__).resolve().parent.parent / "data" / "docs.json").read_text(encoding="utf-8"))
+
+
+def test_tokenizacao_portugues():
+    assert tokenize("Transações") == tokenize("transacao")
+    assert tokenize("Recuperação de Senhas") == tokenize("recuperacao senha")
+    assert "de" not in tokenize("recuperação de senha")
+
+
+def test_bm25_consultas_procedurais():
+    bm25 = BM25Index.build([f"{d['title']} {d['content']}" for d in DOCS])
+    assert DOCS[bm25.search("reverter transação", 1)[0][0]]["id"] == "doc-1"
+    assert DOCS[bm25.search("recuperação de senha", 1)[0][0]]["id"] == "doc-2"
+    assert DOCS[bm25.search("timeout nos logs", 1)[0][0]]["id"] == "doc-3"
+    assert bm25.search("xyzzy", 3) == []
+
+
+def test_maxscore_igual_a_avaliacao_exaustiva():
+    rng = np.random.default_rng(0)
+    words = [f"termo{i}" for i in range(300)]
+    texts = [" ".join(rng.choice(words, size=30, p=np.r_[np.full(10, 0.05), np.full(290, 0.5 / 290)])) for _ in range(2000)]
+    bm25 = BM25Index.build(texts)
+    query = "termo1 termo2 termo150 termo200"
+    exhaustive = np.zeros(bm25.n_docs, dtype=np.float32)
+    for t in set(tokenize(query)):
+        docs, impacts = bm25.postings(bm25.vocab[t])
+        exhaustive[docs] += impacts
+    expected = np.sort(exhaustive)[::-1][:10]
+    got = [sc for _, sc in bm25.search(query, 10)]
+    assert np.allclose(got, expected, rtol=1e-5)
+
+
+def test_rrf():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "a", "d"]])
+    assert {fused[0][0], fused[1][0]} == {"a", "b"}
+    assert fused[-1][0] in ("c", "d")
+
+
+def test_retrieve_local_hibrido(tmp_path, monkeypatch):
+    monkeypatch.delenv("FRAGAZ_LEXICAL", raising=False)
+    path = tmp_path / "idx.json"
+    rng = np.random.default_rng(3)
+    path.write_text(json.dumps([dict(d, embedding=rng.normal(size=8).tolist()) for d in DOCS]), encoding="utf-8")
+    snap = LocalIndex(path).snapshot(wait=True)
+    assert snap.lexical is not None and lexical.lexical_path(path).exists()
+
+    res = lexical.hybrid_top_k(snap, "como reverter uma transação?", rng.normal(size=8), 2)
+    assert res[0]["id"] == "doc-1"
+    assert 0.0 < res[0]["score"] <= 1.0
+
+
+def test_bm25_persistido_reconstroi_quando_conteudo_muda_com_mesmos_ids(tmp_path, monkeypatch):
+    monkeypatch.delenv("FRAGAZ_LEXICAL", raising=False)
+    path = tmp_path / "idx.json"
+    entries = [dict(d, embedding=[1.0, 0.0]) for d in DOCS]
+    path.write_text(json.dumps(entries), encoding="utf-8")
+    assert LocalIndex(path).snapshot(wait=True).lexical.search("xyzzy", 1) == []
+
+    entries[0]["content"] = "Procedimento xyzzy para auditoria."
+    path.write_text(json.dumps(entries), encoding="utf-8")
+    snap = LocalIndex(path).snapshot(wait=True)
+    assert snap.lexical.search("xyzzy", 1)[0][0] == 0
@@ -0,0 +1,124 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend_service import generation, llm, llm_limits, services
+from backend_service.app import app
+from backend_service.coordinator import RetrievalCoordinator
+from backend_service.llm import Completion, LLMClient, RetryBudget, StubProvider
+
+PROMPT = "Contexto:\nUse o estorno no painel.\n\nPergunta: como estornar?\n\nResponda de forma objetiva."
+
+
+class FlakyProvider:
+    name = model = "flaky"
+
+    def __init__(self, failures, delay=0.0):
+        self.failures = list(failures)
+        self.delay = delay
+        self.calls = 0
+
+    def generate(self, prompt, timeout):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return Completion("ok", 10, 1)
+
+    async def generate_async(self, prompt, timeout):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            raise self.failures.pop(0)
+        return Completion("ok", 10, 1)
+
+    async def stream_async(self, prompt, timeout):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        for t in ["o", "k"]:
+            yield t
+
+
+def test_stub_deterministico():
+    stub = StubProvider(latency=0.0, token_delay=0.0)
+    a = stub.generate(PROMPT, timeout=1.0).text
+    assert a == stub.generate(PROMPT, timeout=1.0).text
+    assert a.startswith("[stub ") and "como estornar?" in a and "Use o estorno" in a
+
+    async def stream():
+        return "".join([t async for t in stub.stream_async(PROMPT, timeout=1.0)])
+
+    assert asyncio.run(stream()) == a
+
+
+def test_retry_em_erro_transitorio_e_erro_permanente():
+    provider = FlakyProvider([TimeoutError("lento")])
+    client = LLMClient(provider, retries=2, backoff_base=0.001)
+    assert client.generate(PROMPT) == "ok"
+    st = client.stats()
+    assert st["retries"] == 1 and st["timeouts"] == 1 and st["errors"] == 0
+    assert st["prompt_tokens"] == 10 and st["output_tokens"] == 1
+
+    client = LLMClient(FlakyProvider([ValueError("prompt inválido")]), retries=2)
+    with pytest.raises(ValueError):
+        client.generate(PROMPT)
+    assert client.stats()["retries"] == 0 and client.stats()["errors"] == 1
+
+
+def test_prazo_e_orcamento_de_retry():
+    client = LLMClient(FlakyProvider([], delay=1.0), timeout=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(client.generate_async(PROMPT))
+    assert client.stats()["timeouts"] == 1
+
+    provider = FlakyProvider([ConnectionError("reset")] * 3)
+    client = LLMClient(provider, retries=5, backoff_base=0.001, budget=RetryBudget(ratio=0.0, initial=1))
+    with pytest.raises(ConnectionError):
+        asyncio.run(client.generate_async(PROMPT))
+    st = client.stats()
+    assert provider.calls == 2 and st["retries"] == 1 and st["retries_denied"] == 1
+
+
+def test_stream_tenta_de_novo_antes_do_primeiro_token():
+    client = LLMClient(FlakyProvider([ConnectionError("reset")]), backoff_base=0.001)
+
+    async def collect():
+        return [t async for t in client.stream_async(PROMPT)]
+
+    assert asyncio.run(collect()) == ["o", "k"]
+    assert client.stats()["retries"] == 1
+
+
+def test_query_completo_com_stub(monkeypatch):
+    monkeypatch.setenv("FRAGAZ_LLM_PROVIDER", "stub")
+    monkeypatch.setenv("FRAGAZ_LLM_STUB_LATENCY", "0.05")
+    monkeypatch.setenv("FRAGAZ_RESULT_CACHE", "off")
+    monkeypatch.setenv("FRAGAZ_ANSWER_CACHE", "0")
+    docs = [{"id": "c1", "title": "Estorno", "content": "Use o estorno no painel.", "source": "u", "score": 0.9}]
+
+    async def primary(q, k):
+        return docs
+
+    services.reset_coordinator(RetrievalCoordinator(lambda q, k: [], lambda q, k: [], primary_async=primary))
+    services.reset_result_cache()
+    generation.reset_answer_cache()
+    llm.reset_client()
+    llm_limits.reset()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[client.post("/query", json={"q": f"pergunta {i}", "k": 1}) for i in range(50)])
+
+    try:
+        resps = asyncio.run(run())
+        assert all(r.status_code == 200 for r in resps)
+        assert resps[0].json()["answer"].startswith("[stub ")
+        assert services.runtime_stats()["llm"]["client"]["calls"] == 50
+    finally:
+        services.reset_coordinator()
+        services.reset_result_cache()
+        generation.reset_answer_cache()
+        llm.reset_client()
+        llm_limits.reset()
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend_service import generation, llm, llm_limits
+from backend_service.llm import Completion, LLMClient
+from backend_service.llm_limits import ConcurrencyLimiter, LLMBusy, SingleFlight
+
+SOURCES = [{"id": "c1", "content": "Para reverter uma transação use o estorno."}]
+
+
+def test_single_flight_coalesce_chamadas_identicas():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "resposta"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["resposta"] * 8 and len(calls) == 1
+    assert flight.stats()["coalesced"] == 7 and flight.stats()["in_flight"] == 0
+
+
+def test_single_flight_async_sobrevive_ao_cancelamento_do_primeiro():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do_async("k", work))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do_async("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "ok" and len(calls) == 1
+
+
+def test_limite_global_por_modelo_e_timeout_de_fila():
+    limiter = ConcurrencyLimiter(limit=2, per_model={"lento": 1}, queue_timeout=0.05)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def call(model):
+        with limiter.slot(model):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    limiter.queue_timeout = 2.0
+    threads = [threading.Thread(target=call, args=("rapido",)) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2
+
+    limiter.queue_timeout = 0.05
+    with limiter.slot("lento"):
+        with pytest.raises(LLMBusy):
+            with limiter.slot("lento"):
+                pass
+        with limiter.slot("outro"):
+            pass
+    st = limiter.stats()
+    assert st["timeouts"] == 1 and st["queued"] >= 1 and st["active"] == 0 and st["queue_depth"] == 0
+
+
+def test_limite_async_timeout_e_fifo():
+    limiter = ConcurrencyLimiter(limit=1, queue_timeout=0.05)
+    order = []
+
+    async def call(i, hold):
+        async with limiter.slot_async("m"):
+            order.append(i)
+            await asyncio.sleep(hold)
+
+    async def run():
+        first = asyncio.ensure_future(call(0, 0.2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(LLMBusy):
+            await call(1, 0)
+        await first
+        limiter.queue_timeout = 1.0
+        await asyncio.gather(*[call(i, 0.01) for i in range(2, 5)])
+
+    asyncio.run(run())
+    assert order == [0, 2, 3, 4]
+    assert limiter.stats()["timeouts"] == 1
+
+
+def test_geracao_concorrente_faz_uma_chamada_ao_provedor():
+    calls = []
+
+    class FakeProvider:
+        name = model = "fake"
+
+        async def generate_async(self, prompt, timeout):
+            calls.append(prompt)
+            await asyncio.sleep(0.05)
+            return Completion("Use o estorno.")
+
+    llm.reset_client(LLMClient(FakeProvider()))
+    llm_limits.reset(ConcurrencyLimiter(limit=1, queue_timeout=1.0), SingleFlight())
+
+    async def run():
+        return await asyncio.gather(*[generation.generate_llm_async("Como estornar?", SOURCES) for _ in range(20)])
+
+    try:
+        assert asyncio.run(run()) == ["Use o estorno."] * 20
+        assert len(calls) == 1
+        assert llm_limits.stats()["single_flight"]["coalesced"] == 19
+    finally:
+        llm.reset_client()
+        llm_limits.reset()
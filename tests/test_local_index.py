@@ -0,0 +1,81 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from backend_service.local_index import LocalIndex, top_k
+
+
+def _write_index(path, n=50, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    emb = rng.normal(size=(n, dim))
+    entries = [
+        {"id": f"doc-{i}", "title": f"Título {i}", "content": f"conteúdo ção {i}", "source": "kb", "embedding": emb[i].tolist()}
+        for i in range(n)
+    ]
+    path.write_text(json.dumps(entries), encoding="utf-8")
+    return emb
+
+
+def test_top_k_igual_busca_exaustiva(tmp_path):
+    path = tmp_path / "idx.json"
+    emb = _write_index(path)
+    q = np.random.default_rng(1).normal(size=16)
+    res = LocalIndex(path).search(q.tolist(), 5)
+
+    expected = (emb @ q) / (np.linalg.norm(emb, axis=1) * np.linalg.norm(q))
+    order = np.argsort(-expected)[:5]
+    assert [r["id"] for r in res] == [f"doc-{i}" for i in order]
+    assert res[0]["score"] == pytest.approx(expected[order[0]], rel=1e-5)
+    assert res[0]["content"].startswith("conteúdo ção")
+
+
+def test_hot_reload_quando_arquivo_muda(tmp_path):
+    path = tmp_path / "idx.json"
+    _write_index(path, n=10)
+    idx = LocalIndex(path)
+    first = idx.snapshot()
+    assert len(first) == 10
+    assert idx.snapshot() is first
+
+    _write_index(path, n=20, seed=3)
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert len(idx.snapshot()) == 20
+    assert idx.reloads == 2
+
+
+def test_indice_ausente(tmp_path):
+    assert LocalIndex(tmp_path / "nao_existe.json").search([1.0, 0.0], 3) == []
+
+
+def test_top_k_maior_que_n():
+    scores = np.array([0.1, 0.9, 0.5], dtype=np.float32)
+    assert [i for i, _ in top_k(scores, 10)] == [1, 2, 0]
+
+
+def test_aceleradores_em_background_sem_bloquear_a_busca(tmp_path, monkeypatch):
+    import threading
+
+    from backend_service import ann
+
+    path = tmp_path / "idx.json"
+    emb = _write_index(path)
+    gate = threading.Event()
+    built = []
+
+    def slow_attach(snap, index_path, fp=None):
+        gate.wait(2)
+        built.append(index_path)
+        snap.ann = "ivf"
+
+    monkeypatch.setattr(ann, "attach", slow_attach)
+    idx = LocalIndex(path)
+    snap = idx.snapshot()
+    # enquanto o build não termina, a busca é a exata
+    assert snap.ann is None and not snap.accelerators.done()
+    q = emb[7]
+    assert idx.search(q.tolist(), 1)[0]["id"] == "doc-7"
+    gate.set()
+    assert idx.snapshot(wait=True) is snap and snap.ann == "ivf" and built == [path]
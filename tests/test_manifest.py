@@ -0,0 +1,128 @@
+import pytest
+
+from backend_service import chroma_pool, services, vector_writer
+from backend_service.chroma_pool import ChromaPool
+from backend_service.jobs import JobCancelled
+from backend_service.manifest import SourceManifest, chunk_ids
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+        self.calls = []
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.calls.append(("upsert", len(ids)))
+        for cid, doc, meta in zip(ids, documents, metadatas):
+            self.docs[cid] = (doc, meta)
+
+    def update(self, ids, metadatas):
+        self.calls.append(("update", len(ids)))
+        for cid, meta in zip(ids, metadatas):
+            self.docs[cid] = (self.docs[cid][0], meta)
+
+    def delete(self, ids):
+        self.calls.append(("delete", len(ids)))
+        for cid in ids:
+            self.docs.pop(cid, None)
+
+    def get(self, where, include):
+        return {"ids": [cid for cid, (_, meta) in self.docs.items() if meta.get("source") == where["source"]]}
+
+
+class FakeClient:
+    def __init__(self):
+        self.coll = FakeCollection()
+
+    def heartbeat(self):
+        return 1
+
+    def get_or_create_collection(self, name):
+        return self.coll
+
+    get_collection = get_or_create_collection
+
+
+def _metas(url, chunks):
+    return [{"source": url, "title": "T", "chunk_index": i} for i in range(len(chunks))]
+
+
+def test_ids_estaveis_por_fonte_e_conteudo():
+    a = chunk_ids("https://wiki/p1", ["Olá  mundo", "x", "x"])
+    assert a == chunk_ids("https://wiki/p1", ["Olá mundo", "x", "x"])
+    assert len(set(a)) == 3
+    assert chunk_ids("https://wiki/p2", ["x"])[0] != a[1]
+
+
+def test_reingestao_incremental(tmp_path, monkeypatch):
+    client = FakeClient()
+    client.coll.docs["confluence-1700000000-0"] = ("antigo", {"source": "u"})
+    chroma_pool.reset_pool(ChromaPool(lambda: client, size=1))
+    services.reset_manifest(SourceManifest(tmp_path / "manifest.sqlite"))
+    monkeypatch.setenv("FRAGAZ_WRITE_BATCH", "2")
+    vector_writer.reset_writers()
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+    try:
+        v1 = ["a", "b", "c"]
+        out = services.upsert_source("fragaz", "u", v1, _metas("u", v1), embed=embed)
+        assert out == {"added": 3, "updated": 0, "deleted": 1, "unchanged": 0}
+        assert ("upsert", 2) in client.coll.calls and len(client.coll.docs) == 3
+
+        out = services.upsert_source("fragaz", "u", v1, _metas("u", v1), embed=embed)
+        assert out == {"added": 0, "updated": 0, "deleted": 0, "unchanged": 3}
+
+        v2 = ["novo", "a", "c"]
+        out = services.upsert_source("fragaz", "u", v2, _metas("u", v2), embed=embed)
+        assert out == {"added": 1, "updated": 1, "deleted": 1, "unchanged": 1}
+        assert embedded == ["a", "b", "c", "novo"]
+        assert sorted(doc for doc, _ in client.coll.docs.values()) == ["a", "c", "novo"]
+        assert client.coll.docs[chunk_ids("u", v2)[1]][1]["chunk_index"] == 1
+    finally:
+        vector_writer.reset_writers()
+        chroma_pool.reset_pool()
+        services.reset_manifest()
+
+
+def test_upsert_em_janelas(tmp_path):
+    client = FakeClient()
+    chroma_pool.reset_pool(ChromaPool(lambda: client, size=2))
+    services.reset_manifest(SourceManifest(tmp_path / "manifest.sqlite"))
+    vector_writer.reset_writers()
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return [[1.0, 0.0] for _ in texts]
+
+    try:
+        v1 = ["a", "b", "a", "c", "d"]
+        out = services.upsert_source_stream("fragaz", "u", zip(v1, _metas("u", v1)), embed=embed, window=2)
+        assert out == {"added": 5, "updated": 0, "deleted": 0, "unchanged": 0} and calls == [2, 2, 1]
+        assert set(client.coll.docs) == set(chunk_ids("u", v1))
+
+        v2 = ["a", "b", "a", "x"]
+        out = services.upsert_source_stream("fragaz", "u", zip(v2, _metas("u", v2)), embed=embed, window=3)
+        assert out == {"added": 1, "updated": 0, "deleted": 2, "unchanged": 3}
+        assert set(client.coll.docs) == set(chunk_ids("u", v2))
+
+        # cancelamento entre janelas: para depois da janela em voo e não mexe no manifesto
+        seen = []
+
+        def cancel(done):
+            seen.append(done)
+            raise JobCancelled("job")
+
+        v3 = ["p", "q", "r", "s", "t"]
+        with pytest.raises(JobCancelled):
+            services.upsert_source_stream("fragaz", "u3", zip(v3, _metas("u3", v3)), embed=embed, window=2, on_window=cancel)
+        assert seen == [2] and not services.get_manifest().has_source("fragaz", "u3")
+        assert set(chunk_ids("u3", v3)[:2]) <= set(client.coll.docs) and chunk_ids("u3", v3)[4] not in client.coll.docs
+    finally:
+        vector_writer.reset_writers()
+        chroma_pool.reset_pool()
+        services.reset_manifest()
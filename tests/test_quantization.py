@@ -0,0 +1,46 @@
+import json
+
+import numpy as np
+
+from backend_service import quantization
+from backend_service.local_index import LocalIndex, top_k
+
+
+def _vectors(n=1500, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_int8_scores_proximos_do_float():
+    x = _vectors()
+    sq = quantization.ScalarQuantizer.train(x)
+    q = x[0]
+    assert np.abs(sq.scores(q) - x @ q).max() < 0.05
+    assert sq.nbytes < x.nbytes / 3.5
+
+
+def test_pq_lookup_table_e_rerank_recuperam_recall():
+    x = _vectors()
+    pq = quantization.ProductQuantizer.train(x, m=8)
+    assert pq.codes.dtype == np.uint8 and pq.size == len(x)
+    queries = x[:20] + 0.05 * np.random.default_rng(1).normal(size=(20, 32)).astype(np.float32)
+    report = quantization.evaluate(x, pq, queries, k=5, rerank=100)
+    assert report["recall_rerank"] >= report["recall"]
+    assert report["recall_rerank"] >= 0.9
+    assert report["compression"] > 4
+
+
+def test_busca_quantizada_no_indice_local(tmp_path, monkeypatch):
+    monkeypatch.setenv("FRAGAZ_QUANT", "int8")
+    monkeypatch.setenv("FRAGAZ_QUANT_RERANK", "20")
+    x = _vectors(n=300)
+    path = tmp_path / "idx.json"
+    path.write_text(json.dumps([{"id": f"d{i}", "embedding": v.tolist()} for i, v in enumerate(x)]))
+
+    snap = LocalIndex(path).snapshot(wait=True)
+    assert snap.quant is not None and snap.quant.rerank == 20
+    assert quantization.quant_path(path, "int8").exists()
+    q = x[42]
+    assert [r["id"] for r in snap.top_k(q, 3)] == [f"d{i}" for i, _ in top_k(x @ q, 3)]
+    assert isinstance(snap.matrix, np.memmap) and quantization.matrix_path(path).exists()
@@ -0,0 +1,88 @@
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+from backend_service import lexical, services
+from backend_service.app import app
+from backend_service.coordinator import RetrievalCoordinator
+from backend_service.local_index import LocalIndex
+
+DOCS = json.loads((Path(__file__).resolve().parent.parent / "data" / "docs.json").read_text(encoding="utf-8"))
+
+
+def test_busca_em_lote_igual_a_busca_por_pergunta(tmp_path, monkeypatch):
+    monkeypatch.delenv("FRAGAZ_LEXICAL", raising=False)
+    path = tmp_path / "idx.json"
+    rng = np.random.default_rng(5)
+    path.write_text(json.dumps([dict(d, embedding=rng.normal(size=8).tolist()) for d in DOCS]), encoding="utf-8")
+    snap = LocalIndex(path).snapshot(wait=True)
+    queries = ["como reverter uma transação?", "recuperação de senha", "xyzzy"]
+    vecs = [rng.normal(size=8).tolist() for _ in queries]
+
+    many, single = snap.search_many(vecs, 2), [snap.search(v, 2) for v in vecs]
+    assert [[row for row, _ in hits] for hits in many] == [[row for row, _ in hits] for hits in single]
+    assert np.allclose([sc for hits in many for _, sc in hits], [sc for hits in single for _, sc in hits], atol=1e-6)
+    assert lexical.hybrid_search_many(snap, queries, vecs, 2) == [lexical.hybrid_search(snap, q, v, 2)
+                                                                  for q, v in zip(queries, vecs)]
+
+
+def test_lote_cai_no_local_quando_primario_falha_ou_vem_vazio():
+    local = {"b": [{"id": "l-b"}], "c": [{"id": "l-c"}]}
+    batches = []
+
+    def primary_many(qs, k):
+        batches.append(list(qs))
+        return [[{"id": "p-a"}], [], []]
+
+    c = RetrievalCoordinator(lambda q, k: [], lambda q, k: local.get(q, []), primary_many=primary_many)
+    out = c.retrieve_many_with_origin(["a", "b", "c"], 1)
+    assert batches == [["a", "b", "c"]]
+    assert out == [([{"id": "p-a"}], "primary"), ([{"id": "l-b"}], "fallback"), ([{"id": "l-c"}], "fallback")]
+
+    def broken(qs, k):
+        raise ConnectionError("chroma fora")
+
+    c = RetrievalCoordinator(lambda q, k: [], lambda q, k: local.get(q, []), primary_many=broken)
+    assert [origin for _, origin in c.retrieve_many_with_origin(["b", "x"], 1)] == ["fallback", "fallback"]
+    assert c.stats()["primary_failures"] == 1 and c.stats()["batch_fallbacks"] == 2
+
+
+def test_query_batch_ndjson_com_uma_recuperacao(monkeypatch):
+    monkeypatch.setenv("ENABLE_GENAI", "0")
+    monkeypatch.setenv("FRAGAZ_RESULT_CACHE", "off")
+    calls = []
+
+    def primary_many(qs, k):
+        calls.append((list(qs), k))
+        return [[{"id": f"c{i}", "content": f"Resposta sobre {q}.", "score": 0.7}] for i, q in enumerate(qs)]
+
+    services.reset_coordinator(RetrievalCoordinator(lambda q, k: [], lambda q, k: [], primary_many=primary_many))
+    services.reset_result_cache()
+    queries = [f"pergunta {i}" for i in range(20)]
+
+    async def run(body):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/query/batch", json=body)
+
+    try:
+        resp = asyncio.run(run({"queries": queries, "k": 1, "concurrency": 3}))
+        assert resp.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in resp.text.splitlines()]
+        items, summary = lines[:-1], lines[-1]
+        assert calls == [(queries, 1)]
+        assert sorted(item["index"] for item in items) == list(range(20))
+        assert all(item["sources"][0]["id"] == f"c{item['index']}" and item["answer"] for item in items)
+        assert 0.0 < items[0]["confidence"]["score"] <= 1.0
+        assert summary["done"] and summary["queries"] == 20 and summary["errors"] == 0
+
+        lines = asyncio.run(run({"queries": queries[:2], "k": 1, "generate": False})).text.splitlines()
+        assert [json.loads(line).get("answer") for line in lines] == [None, None, None]
+        assert json.loads(lines[0])["confidence"] == {"Rs": 0.7}
+        assert asyncio.run(run({"queries": []})).status_code == 400
+    finally:
+        services.reset_coordinator()
+        services.reset_result_cache()
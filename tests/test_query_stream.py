@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import httpx
+
+from backend_service import generation, llm, services
+from backend_service.app import app
+from backend_service.coordinator import RetrievalCoordinator
+from backend_service.llm import LLMClient
+
+DOCS = [{"id": "c1", "title": "Estorno", "content": "Para reverter uma transação use o estorno no painel.", "source": "u", "score": 0.8}]
+
+
+def _events(body: str):
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], lines["data"]))
+    return out
+
+
+def test_stream_envia_fontes_tokens_e_done(monkeypatch):
+    monkeypatch.setenv("ENABLE_GENAI", "0")
+    monkeypatch.setenv("FRAGAZ_RESULT_CACHE", "off")
+
+    async def primary(q, k):
+        return DOCS
+
+    services.reset_coordinator(RetrievalCoordinator(lambda q, k: [], lambda q, k: [], primary_async=primary))
+    services.reset_result_cache()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/query/stream", json={"q": "como estornar?", "k": 1})
+
+    try:
+        resp = asyncio.run(run())
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events = _events(resp.text)
+        assert events[0][0] == "sources" and json.loads(events[0][1])[0]["id"] == "c1"
+        tokens = [json.loads(d)["text"] for e, d in events if e == "token"]
+        assert len(tokens) > 1
+        assert "".join(tokens) == generation.fallback_answer("como estornar?", DOCS)
+        assert events[-1][0] == "done"
+        done = json.loads(events[-1][1])
+        assert done["confidence"]["Rs"] == 0.8 and set(done["timing"]) == {"retrieval_ms", "first_token_ms", "total_ms"}
+    finally:
+        services.reset_coordinator()
+        services.reset_result_cache()
+
+
+def test_stream_answer_usa_tokens_do_llm_e_cacheia(monkeypatch):
+    class FakeProvider:
+        name = model = "fake"
+
+        async def stream_async(self, prompt, timeout):
+            for t in ["Use ", "o ", "estorno."]:
+                yield t
+
+    from backend_service.answer_cache import AnswerCache
+
+    llm.reset_client(LLMClient(FakeProvider()))
+    monkeypatch.setattr(generation, "embed_query", lambda q: [1.0, 0.0])
+    generation.reset_answer_cache(AnswerCache(threshold=0.9))
+
+    async def collect():
+        return [p async for p in generation.stream_answer("como estornar?", DOCS)]
+
+    try:
+        assert asyncio.run(collect()) == ["Use ", "o ", "estorno."]
+        assert "".join(asyncio.run(collect())) == "Use o estorno."
+        assert generation.get_answer_cache().stats()["hits"] == 1
+    finally:
+        llm.reset_client()
+        generation.reset_answer_cache()
+
+
+def test_falha_no_meio_do_stream_vira_erro(monkeypatch):
+    monkeypatch.setenv("FRAGAZ_RESULT_CACHE", "off")
+
+    class BrokenProvider:
+        name = model = "fake"
+
+        async def stream_async(self, prompt, timeout):
+            yield "Use "
+            raise ConnectionError("conexão caiu")
+
+    async def primary(q, k):
+        return DOCS
+
+    llm.reset_client(LLMClient(BrokenProvider()))
+    monkeypatch.setattr(generation, "get_answer_cache", lambda: None)
+    services.reset_coordinator(RetrievalCoordinator(lambda q, k: [], lambda q, k: [], primary_async=primary))
+    services.reset_result_cache()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/query/stream", json={"q": "como estornar?", "k": 1})
+
+    try:
+        events = _events(asyncio.run(run()).text)
+        assert [e for e, _ in events] == ["sources", "token", "error"]
+        assert json.loads(events[-1][1])["truncated"] is True
+    finally:
+        llm.reset_client()
+        services.reset_coordinator()
+        services.reset_result_cache()
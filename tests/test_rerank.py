@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from backend_service import rerank, services
+from backend_service.coordinator import RetrievalCoordinator
+from backend_service.rerank import Reranker
+
+DOCS = [{"id": f"c{i}", "content": text, "score": 0.9 - i * 0.1} for i, text in enumerate([
+    "Horário de funcionamento das agências.",
+    "Como pedir segunda via do cartão.",
+    "Para estornar uma transação use o painel de estorno.",
+])]
+
+
+class FakeCrossEncoder:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.batches.append((len(pairs), batch_size))
+        time.sleep(self.delay * len(pairs))
+        return [len(set(q.lower().split()) & set(d.lower().split())) for q, d in pairs]
+
+
+def _reranker(model, **kwargs):
+    r = Reranker("fake", loader=lambda name: model, **kwargs)
+    r.model()
+    return r
+
+
+def test_reordena_em_um_lote_e_cacheia_pares():
+    model = FakeCrossEncoder()
+    r = _reranker(model, budget=1.0)
+    out = r.rerank("como estornar uma transação", DOCS, k=2)
+    assert out[0]["id"] == "c2" and out[0]["score"] == DOCS[2]["score"] and "rerank_score" in out[0]
+    assert len(out) == 2 and model.batches == [(3, 3)]
+
+    r.rerank("Como estornar  uma transação", DOCS, k=2)
+    st = r.stats()
+    assert model.batches == [(3, 3)] and st["cache_hits"] == 3 and st["pairs_scored"] == 3 and st["top1_changed"] == 2
+
+
+def test_pula_quando_estimativa_estoura_orcamento():
+    r = _reranker(FakeCrossEncoder(delay=0.02), budget=0.03)
+    r.rerank("estornar", DOCS, k=3)
+    out = r.rerank("segunda via", DOCS, k=2)
+    assert [d["id"] for d in out] == ["c0", "c1"]
+    st = r.stats()
+    assert st["skipped_budget"] == 1 and st["over_budget"] == 1
+
+
+def test_sem_modelo_mantem_ordem_e_carrega_em_background():
+    def loader(name):
+        raise ImportError("sentence_transformers ausente")
+
+    r = Reranker("fake", loader=loader)
+    assert r.rerank("estornar", DOCS, k=2) == DOCS[:2]
+    for _ in range(50):
+        if r._load_failed:
+            break
+        time.sleep(0.01)
+    assert r.rerank("estornar", DOCS, k=2) == DOCS[:2]
+    assert r.stats()["skipped_unavailable"] == 2 and not r.stats()["loaded"]
+
+
+def test_retrieve_ranked_busca_mais_candidatos(monkeypatch):
+    monkeypatch.setenv("FRAGAZ_RESULT_CACHE", "off")
+    asked = []
+
+    async def primary(q, k):
+        asked.append(k)
+        return DOCS[:k]
+
+    services.reset_coordinator(RetrievalCoordinator(lambda q, k: [], lambda q, k: [], primary_async=primary))
+    services.reset_result_cache()
+    rerank.reset_reranker(_reranker(FakeCrossEncoder(), candidates=3, budget=1.0))
+    try:
+        out = asyncio.run(services.retrieve_ranked_async("estornar uma transação", k=1))
+        assert asked == [3] and [d["id"] for d in out] == ["c2"]
+    finally:
+        rerank.reset_reranker()
+        services.reset_coordinator()
+        services.reset_result_cache()
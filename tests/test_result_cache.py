@@ -0,0 +1,123 @@
+import json
+import time
+
+from backend_service import services
+from backend_service.result_cache import MemoryBackend, RetrievalCache, SQLiteBackend
+
+
+def test_chave_normalizada_hit_e_miss():
+    cache = RetrievalCache(MemoryBackend())
+    cache.put("Como  reverter transação?", 5, "fragaz", [{"id": "doc-1"}])
+    assert cache.get("como reverter transação?", 5, "fragaz") == [{"id": "doc-1"}]
+    assert cache.get("como reverter transação?", 3, "fragaz") is None
+    assert cache.get("como reverter transação?", 5, "outra") is None
+    st = cache.stats()
+    assert st["hits"] == 1 and st["misses"] == 2
+
+
+def test_lru_por_orcamento_de_bytes_e_ttl():
+    backend = MemoryBackend(max_bytes=300)
+    cache = RetrievalCache(backend, ttl=60)
+    for i in range(10):
+        cache.put(f"q{i}", 5, "c", [{"id": "x" * 40}])
+    assert backend.stats()["bytes"] <= 300
+    assert backend.evictions > 0
+    assert cache.get("q9", 5, "c") is not None
+    assert cache.get("q0", 5, "c") is None
+
+    short = RetrievalCache(MemoryBackend(), ttl=0.01)
+    short.put("q", 5, "c", [1])
+    time.sleep(0.02)
+    assert short.get("q", 5, "c") is None
+
+
+def test_invalidacao_por_colecao_sqlite_compartilhado(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    worker_a = RetrievalCache(SQLiteBackend(path))
+    worker_b = RetrievalCache(SQLiteBackend(path))
+    worker_a.put("q", 5, "fragaz", [{"id": "a"}])
+    worker_a.put("q", 5, "outra", [{"id": "b"}])
+    assert worker_b.get("q", 5, "fragaz") == [{"id": "a"}]
+    worker_b.invalidate("fragaz")
+    assert worker_a.get("q", 5, "fragaz") is None
+    assert worker_a.get("q", 5, "outra") == [{"id": "b"}]
+
+
+def test_retrieve_docs_usa_cache_e_invalida_quando_indice_local_muda(tmp_path, monkeypatch):
+    path = tmp_path / "idx.json"
+    path.write_text(json.dumps([{"id": "v1", "title": "senha", "content": "recuperação de senha", "embedding": [1.0, 0.0]}]))
+    monkeypatch.setattr(services, "INDEX_FILE", path)
+    monkeypatch.setattr(services, "INDEX_BIN_FILE", tmp_path / "idx.bin")
+    calls = []
+    monkeypatch.setattr(services, "retrieve_chroma", lambda q, k: calls.append(q) or [])
+    services.reset_coordinator()
+    services.reset_result_cache(RetrievalCache(MemoryBackend()))
+    try:
+        assert services.retrieve_docs("senha", 1)[0]["id"] == "v1"
+        assert services.retrieve_docs("Senha ", 1)[0]["id"] == "v1"
+        assert len(calls) == 1
+
+        path.write_text(json.dumps([{"id": "v2", "title": "senha", "content": "nova senha", "embedding": [0.0, 1.0, 0.0]}]))
+        assert services.retrieve_docs("senha", 1)[0]["id"] == "v2"
+        assert services.get_result_cache().stats()["stale"] == 1
+    finally:
+        services.reset_coordinator()
+        services.reset_result_cache()
+
+
+def test_orcamento_em_bytes_utf8():
+    backend = MemoryBackend()
+    backend.set("k", "ção", "c", 60)
+    assert backend.stats()["bytes"] == len("ção".encode("utf-8")) == 5
+    backend.delete("k")
+    assert backend.stats()["bytes"] == 0
+
+
+def test_resultado_do_fallback_local_tem_ttl_curto(tmp_path, monkeypatch):
+    path = tmp_path / "idx.json"
+    path.write_text(json.dumps([{"id": "v1", "title": "senha", "content": "recuperação de senha", "embedding": [1.0, 0.0]}]))
+    monkeypatch.setattr(services, "INDEX_FILE", path)
+    monkeypatch.setattr(services, "INDEX_BIN_FILE", tmp_path / "idx.bin")
+    chroma_up = []
+    monkeypatch.setattr(services, "retrieve_chroma", lambda q, k: [{"id": "chroma"}] if chroma_up else [])
+    services.reset_coordinator()
+    services.reset_result_cache(RetrievalCache(MemoryBackend(), ttl=60, fallback_ttl=0.01))
+    try:
+        assert services.retrieve_docs("senha", 1)[0]["id"] == "v1"
+        chroma_up.append(True)
+        time.sleep(0.02)
+        # o Chroma voltou: a resposta do índice local já expirou
+        assert services.retrieve_docs("senha", 1)[0]["id"] == "chroma"
+        chroma_up.clear()
+        assert services.retrieve_docs("senha", 1)[0]["id"] == "chroma"
+    finally:
+        services.reset_coordinator()
+        services.reset_result_cache()
+
+
+def test_sqlite_total_corrente_por_trigger(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "cache.sqlite"
+    backend = SQLiteBackend(path, max_bytes=100)
+    for i in range(6):
+        backend.set(f"k{i}", "x" * 30, "c", 60)
+    backend.set("k5", "ção" * 5, "c", 60)
+    conn = sqlite3.connect(path)
+    total = conn.execute("SELECT total FROM result_cache_meta").fetchone()[0]
+    assert total == conn.execute("SELECT SUM(size) FROM result_cache").fetchone()[0] <= 100
+    assert backend.stats()["bytes"] == total and backend.evictions > 0
+    backend.invalidate_tag("c")
+    assert backend.stats()["bytes"] == 0
+
+
+def test_falha_ao_remover_entrada_obsoleta_conta_como_erro():
+    class BrokenDelete(MemoryBackend):
+        def delete(self, key):
+            raise RuntimeError("database is locked")
+
+    cache = RetrievalCache(BrokenDelete())
+    cache.put("q", 5, "c", [1], meta={"index": "v1"})
+    assert cache.get("q", 5, "c", validate=lambda meta: False) is None
+    st = cache.stats()
+    assert st["errors"] == 1 and st["stale"] == 1
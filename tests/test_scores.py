@@ -1,51 +1,8 @@
-import math
-from typing import List, Optional
+import numpy as np
 import pytest
 
-def clamp01(x: float) -> float:
-    return max(0.0, min(1.0, float(x)))
-
-def retrieval_score(similarities_01: List[float]) -> float:
-    if not similarities_01:
-        return 0.0
-    num = den = 0.0
-    for i, sim in enumerate(similarities_01, start=1):
-        w = 1.0 / math.log(i + 1.0)
-        num += w * clamp01(sim)
-        den += w
-    return clamp01(num / den) if den > 0 else 0.0
-
-def consistency_score(resp_chunk_sim_01: List[float]) -> float:
-    return clamp01(sum(resp_chunk_sim_01) / len(resp_chunk_sim_01)) if resp_chunk_sim_01 else 0.0
-
-def faithfulness_score(n_unsupported: int, n_total: int, eps: float = 1e-6) -> float:
-    if n_total <= 0:
-        return 1.0
-    return clamp01(1.0 - (n_unsupported / (n_total + eps)))
-
-def fact_score(entail_probs_01: List[float], weights: Optional[List[float]] = None) -> float:
-    if not entail_probs_01:
-        return 0.0
-    if weights is None:
-        return clamp01(sum(entail_probs_01) / len(entail_probs_01))
-    wsum = sum(max(0.0, w) for w in weights[:len(entail_probs_01)])
-    if wsum == 0:
-        return clamp01(sum(entail_probs_01) / len(entail_probs_01))
-    num = sum(clamp01(p) * max(0.0, w) for p, w in zip(entail_probs_01, weights))
-    return clamp01(num / wsum)
-
-def confidence_score(Rs: float, Cs: float, Fs: float, FS: float,
-                     alpha: float = 0.40, beta: float = 0.25,
-                     gamma: float = 0.20, delta: float = 0.15) -> float:
-    s = alpha + beta + gamma + delta
-    if s <= 0:
-        s = 1.0
-    alpha, beta, gamma, delta = alpha/s, beta/s, gamma/s, delta/s
-    sc = (alpha * clamp01(Rs) +
-          beta * clamp01(Cs) +
-          gamma * clamp01(Fs) +
-          delta * clamp01(FS))
-    return clamp01(sc)
+from backend_service.scores import (ConfidenceScorer, clamp01, confidence_score, confidence_scores, consistency_score,
+                                    fact_score, fact_scores, faithfulness_score, pad, retrieval_score, retrieval_scores)
 
 # Testes unitários
 def test_retrieval_score():
@@ -74,3 +31,24 @@ def test_confidence_score():
 def test_faithfulness_score_ragas():
     Fs = 0.85
     assert clamp01(Fs) == 0.85
+
+def test_lote_igual_as_funcoes_escalares():
+    rows = [[0.9, 0.8, 0.7], [0.5], [], [1.2, -0.1]]
+    batch = retrieval_scores(pad(rows))
+    assert batch == pytest.approx([retrieval_score(r) for r in rows])
+    probs, weights = [[0.8, 0.6, 0.9], [0.4, 0.2], []], [[1, 2, 1], [0, 0], []]
+    assert fact_scores(pad(probs), pad(weights, 3)) == pytest.approx([fact_score(p, w) for p, w in zip(probs, weights)])
+    Rs, Cs, Fs, FS = np.array([0.8, 0.1]), np.array([0.7, 0.2]), np.array([0.9, 0.3]), np.array([0.6, 0.4])
+    assert confidence_scores(Rs, Cs, Fs, FS) == pytest.approx([confidence_score(*v) for v in zip(Rs, Cs, Fs, FS)])
+
+
+def test_scorer_distingue_resposta_apoiada_nas_fontes():
+    sources = [{"content": "Para reverter uma transação use o estorno no painel administrativo.", "score": 0.8},
+               {"content": "O horário das agências é das 10h às 16h.", "score": 0.6}]
+    scorer = ConfidenceScorer()
+    good, bad = scorer.score_batch(["Para reverter a transação, use o estorno no painel administrativo.",
+                                    "Ligue para a central telefônica amanhã cedo."], [sources, sources])
+    assert good["Rs"] == bad["Rs"] == pytest.approx(retrieval_score([0.8, 0.6]), abs=1e-4)
+    assert good["FS"] > bad["FS"] and good["Fs"] == 1.0 and bad["Fs"] == 0.0 and good["score"] > bad["score"]
+    assert scorer.score("qualquer coisa", []) == {"score": 0.0, "Rs": 0.0, "Cs": 0.0, "Fs": 0.0, "FS": 0.0}
+    assert scorer.stats()["responses"] == 3
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+from backend_service.chroma_pool import ChromaPool
+from backend_service.vector_writer import VectorWriter
+
+
+class SlowCollection:
+    def __init__(self, delay=0.0, failures=None):
+        self.delay = delay
+        self.failures = list(failures or [])
+        self.batches = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _call(self, kind, ids, **columns):
+        with self._lock:
+            if self.failures:
+                raise self.failures.pop(0)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+            self.batches.append((kind, list(ids), sorted(columns)))
+
+    def add(self, ids, **columns):
+        self._call("add", ids, **columns)
+
+    def delete(self, ids):
+        self._call("delete", ids)
+
+
+class FakeClient:
+    def __init__(self, coll):
+        self.coll = coll
+
+    def heartbeat(self):
+        return 1
+
+    def get_or_create_collection(self, name):
+        return self.coll
+
+    get_collection = get_or_create_collection
+
+
+def _writer(coll, **kwargs):
+    pool = ChromaPool(lambda: FakeClient(coll), size=4)
+    return VectorWriter("fragaz", lambda: pool, backoff_base=0.001, **kwargs)
+
+
+def test_agrupa_submits_por_quantidade_e_bytes():
+    coll = SlowCollection()
+    w = _writer(coll, max_items=3, linger=0.05)
+    try:
+        f1 = w.submit("add", ["a", "b"], documents=["x", "y"])
+        f2 = w.submit("add", ["c", "d"], documents=["z", "w"])
+        assert f1.result(timeout=2) == 2 and f2.result(timeout=2) == 2
+        assert sorted(len(ids) for _, ids, _ in coll.batches) == [1, 3]
+        assert w.stats()["items"] == 4
+    finally:
+        w.close()
+
+    coll = SlowCollection()
+    w = _writer(coll, max_items=100, max_bytes=250)
+    try:
+        w.write("add", [f"id{i}" for i in range(5)], documents=["x" * 100] * 5)
+        assert all(len(ids) <= 2 for _, ids, _ in coll.batches)
+    finally:
+        w.close()
+
+
+def test_operacoes_e_colunas_diferentes_nao_se_misturam():
+    coll = SlowCollection()
+    w = _writer(coll, max_items=10)
+    try:
+        futures = [w.submit("add", ["a"], documents=["x"]), w.submit("add", ["b"], documents=["y"], metadatas=[{}]),
+                   w.submit("delete", ["c"])]
+        for f in futures:
+            f.result(timeout=2)
+        assert sorted((k, cols) for k, _, cols in coll.batches) == [
+            ("add", ["documents"]), ("add", ["documents", "metadatas"]), ("delete", [])]
+    finally:
+        w.close()
+
+
+def test_concorrencia_limitada():
+    coll = SlowCollection(delay=0.05)
+    w = _writer(coll, max_items=1, concurrency=2)
+    try:
+        w.write("add", [str(i) for i in range(6)], documents=["x"] * 6)
+        assert coll.peak == 2
+        assert w.stats()["items_per_sec"] > 0
+    finally:
+        w.close()
+
+
+def test_escrita_nao_ocupa_o_pool_inteiro():
+    coll = SlowCollection(delay=0.1)
+    pool = ChromaPool(lambda: FakeClient(coll), size=4, checkout_timeout=0.05)
+    w = VectorWriter("fragaz", lambda: pool, max_items=1, concurrency=4)
+    try:
+        future = w.submit("add", [str(i) for i in range(8)], documents=["x"] * 8)
+        time.sleep(0.03)
+        with pool.collection("fragaz") as read:
+            assert read is coll
+        assert future.result(timeout=2) == 8
+        assert coll.peak == pool.write_slots == 2 and pool.stats()["timeouts"] == 0
+    finally:
+        w.close()
+
+
+def test_retry_em_erro_transitorio():
+    coll = SlowCollection(failures=[ConnectionError("reset"), TimeoutError("lento")])
+    w = _writer(coll, retries=3)
+    try:
+        assert w.write("add", ["a"], documents=["x"]) == 1
+        st = w.stats()
+        assert st["retries"] == 2 and st["failed_batches"] == 0
+    finally:
+        w.close()
+
+
+def test_erro_permanente_falha_o_future():
+    coll = SlowCollection(failures=[ValueError("dimensão errada")])
+    w = _writer(coll, retries=3)
+    try:
+        with pytest.raises(ValueError):
+            w.write("add", ["a"], documents=["x"])
+        st = w.stats()
+        assert st["retries"] == 0 and st["failed_batches"] == 1
+    finally:
+        w.close()